@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import phonenumbers
+
+#add parent directory into search path
+import os
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from benchmarks import synthetic_data
+from utilities import csv_cleaning, csv_profiling, csv_transformations, phone_number_utility
+from utilities.multivalued_table import MultivaluedTable
+
+""" Times each public function of the utilities on synthetic data and records time, throughput and peak memory as
+JSON lines, one record per (benchmark, size), so results can be diffed between releases.
+
+Usage: python benchmarks/run_benchmarks.py --sizes 10000 1000000 10000000 --output results.jsonl """
+
+
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+
+# rows per key and distinct values per key for the multivalued fields of the generated data
+ROWS_PER_KEY = 3
+FANOUT = 3
+
+COMPLAINTS_FIELDS = ['Product', 'Sub-product', 'Issue', 'Company', 'State']
+TRAFFIC_FIELDS = ['Description', 'Charge', 'Violation Type', 'Make', 'Color']
+
+
+def _clean_phones(dataframe):
+    phone_number_utility.clean_phone_numbers(dataframe, phonenum_field='Phone', newField='Cleaned Phone',
+                                             region_string='US')
+    return dataframe['Cleaned Phone']
+
+def _nullify_non_alphanum(dataframe):
+    csv_cleaning.nullify_non_alphanum(dataframe)
+    return dataframe
+
+def _nullify_fields_if_field_matches_pattern(dataframe):
+    csv_cleaning.nullify_fields_if_field_matches_pattern(dataframe, 'Description', 'SPEED', ['Charge', 'Violation Type'])
+    return dataframe
+
+def _blacklist_values(dataframe):
+    csv_cleaning.blacklist_values(dataframe, {'Make': ['DODGE', 'JEEP'], 'Color': ['GOLD', 'MAROON', 'BROWN']})
+    return dataframe
+
+def _nullify_regex(dataframe):
+    csv_cleaning.nullify_regex(dataframe, {'Description': ['LICENSE', '^FAILURE'], 'Model': [r'^\d', '-']})
+    return dataframe
+
+def _concat_fieldvalues(dataframe):
+    return csv_transformations.concat_fieldvalues(dataframe, ['Make', 'Model', 'Color', 'Year', 'State'])
+
+def _csv_profiling_profile_uniques(dataframe):
+    return csv_profiling.profile_uniques(dataframe, 'Complaint ID', COMPLAINTS_FIELDS)
+
+def _profile_uniques(dataframe):
+    return MultivaluedTable.profile_uniques(dataframe, 'Complaint ID', COMPLAINTS_FIELDS)
+
+def _widen_multivalues(dataframe):
+    return MultivaluedTable.widen_multivalues_into_additional_columns(dataframe, 'Stop ID', TRAFFIC_FIELDS)
+
+# name -> (dataset, function to time). Functions get their own copy of the data and return a result to fingerprint
+BENCHMARKS = {
+    'clean_phone_numbers': ('consumer_complaints', _clean_phones),
+    'nullify_non_alphanum': ('traffic_violations', _nullify_non_alphanum),
+    'nullify_fields_if_field_matches_pattern': ('traffic_violations', _nullify_fields_if_field_matches_pattern),
+    'blacklist_values': ('traffic_violations', _blacklist_values),
+    'nullify_regex': ('traffic_violations', _nullify_regex),
+    'concat_fieldvalues': ('traffic_violations', _concat_fieldvalues),
+    'csv_profiling.profile_uniques': ('consumer_complaints', _csv_profiling_profile_uniques),
+    'MultivaluedTable.profile_uniques': ('consumer_complaints', _profile_uniques),
+    'MultivaluedTable.widen_multivalues_into_additional_columns': ('traffic_violations', _widen_multivalues),
+}
+
+def generate_dataset(dataset, n_rows, seed=0):
+    """
+    :param dataset: 'consumer_complaints' or 'traffic_violations'
+    :return: synthetic dataframe with n_rows rows, ROWS_PER_KEY rows per key on average and up to FANOUT distinct
+    values per key in the multivalued fields
+    """
+    n_keys = max(1, n_rows // ROWS_PER_KEY)
+    generator = getattr(synthetic_data, dataset)
+    return generator(n_rows, n_keys=n_keys, fanout=FANOUT, seed=seed)
+
+def fingerprint(result):
+    """ order-sensitive hash of a benchmark's result, so runs that change output can be spotted when diffing """
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return '{:016x}'.format(int(pd.util.hash_pandas_object(result, index=True).values.sum(dtype=np.uint64)))
+    return hashlib.md5(json.dumps(result, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def time_benchmark(name, dataframe):
+    """
+    Runs one benchmark twice, each time on a fresh copy of dataframe: once timed, and once under tracemalloc to measure
+    peak memory, since tracing every allocation would slow down the timed run. tracemalloc is only switched on around
+    the call (so data generation and copying don't count).
+    :return: dict record of the run
+    """
+    dataset, function = BENCHMARKS[name]
+
+    timed_dataframe = dataframe.copy(deep=True)
+    start = time.perf_counter()
+    result = function(timed_dataframe)
+    seconds = time.perf_counter() - start
+    del timed_dataframe
+
+    traced_dataframe = dataframe.copy(deep=True)
+    tracemalloc.start()
+    function(traced_dataframe)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced_dataframe
+
+    return {"benchmark": name,
+            "dataset": dataset,
+            "rows": len(dataframe),
+            "seconds": seconds,
+            "rows_per_sec": len(dataframe) / seconds if seconds > 0 else None,
+            "peak_memory_bytes": peak_memory,
+            "result_fingerprint": fingerprint(result)}
+
+def run_benchmarks(sizes=None, names=None, seed=0, outfile=None):
+    """
+    Times every selected benchmark at every size. Each record also holds library versions and a timestamp.
+    :param sizes: list of row counts. Defaults to DEFAULT_SIZES
+    :param names: list of benchmark names to run (keys of BENCHMARKS). Defaults to all
+    :param seed: random seed for the synthetic data
+    :param outfile: optional path of a JSON lines file to append records to
+    :return: list of dict records
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    names = sorted(BENCHMARKS) if names is None else names
+
+    environment = {"python": platform.python_version(),
+                   "pandas": pd.__version__,
+                   "numpy": np.__version__,
+                   "phonenumbers": phonenumbers.__version__,
+                   "timestamp": datetime.utcnow().isoformat()}
+
+    records = []
+    for n_rows in sizes:
+        datasets = dict()
+        for name in names:
+            dataset = BENCHMARKS[name][0]
+            if dataset not in datasets:
+                datasets[dataset] = generate_dataset(dataset, n_rows, seed=seed)
+
+            record = time_benchmark(name, datasets[dataset])
+            record.update(environment)
+            record["seed"] = seed
+            records.append(record)
+
+            if outfile is not None:
+                with open(outfile, 'a') as jsonfile:
+                    jsonfile.write(json.dumps(record, sort_keys=True) + '\n')
+
+        del datasets
+
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pandas utilities on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='row counts to benchmark')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run (default all)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic data')
+    parser.add_argument('--output', help='JSON lines file to append results to')
+    args = parser.parse_args()
+
+    for record in run_benchmarks(sizes=args.sizes, names=args.benchmarks, seed=args.seed, outfile=args.output):
+        # rows_per_sec is None when a run is too fast for the clock to measure
+        rows_per_sec = 'n/a' if record["rows_per_sec"] is None else '{:.0f}'.format(record["rows_per_sec"])
+        print("{benchmark}: {rows} rows in {seconds:.3f}s ({rows_per_sec} rows/sec), "
+              "peak memory {peak_memory_bytes} bytes".format(**dict(record, rows_per_sec=rows_per_sec)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+""" Seeded synthetic data generators modeled on the sample_data schemas (Consumer_Complaints and Traffic_violations),
+for benchmarking the utilities at sizes far beyond the sample files. The same arguments and seed always produce the
+same dataframe. """
+
+
+PRODUCTS = ['Consumer Loan', 'Mortgage', 'Credit card', 'Debt collection', 'Bank account or service',
+            'Credit reporting', 'Student loan', 'Payday loan', 'Money transfers', 'Prepaid card']
+ISSUES = ['Managing the loan or lease', 'Loan servicing, payments, escrow account', 'Billing disputes',
+          'Incorrect information on credit report', 'Cont\'d attempts collect debt not owed', 'Account opening, closing, or management',
+          'Deposits and withdrawals', 'Problems caused by my funds being low', 'Identity theft / Fraud / Embezzlement',
+          'Communication tactics', 'Disclosure verification of debt', 'Payoff process']
+COMPANIES = ['Wells Fargo & Company', 'Bank of America', 'JPMorgan Chase & Co.', 'Equifax', 'Experian',
+             'TransUnion Intermediate Holdings, Inc.', 'Citibank', 'Ocwen', 'Nationstar Mortgage', 'Navient Solutions, Inc.']
+STATES = ['VA', 'CA', 'NY', 'TX', 'FL', 'MD', 'MA', 'IL', 'GA', 'WA', 'PA', 'OH', 'NC', 'NJ', 'MI']
+SUBMITTED_VIA = ['Web', 'Referral', 'Phone', 'Postal mail', 'Fax', 'Email']
+COMPANY_RESPONSES = ['Closed with explanation', 'Closed with non-monetary relief', 'Closed with monetary relief',
+                     'In progress', 'Untimely response']
+
+AGENCIES = ['MCP']
+SUBAGENCIES = ['1st district, Rockville', '2nd district, Bethesda', '3rd district, Silver Spring',
+               '4th district, Wheaton', '5th district, Germantown', '6th district, Gaithersburg / Montgomery Village',
+               'Headquarters and Special Operations']
+DESCRIPTIONS = ['DRIVER FAILURE TO STOP AT STEADY CIRCULAR RED SIGNAL', 'DRIVING VEHICLE IN EXCESS OF REASONABLE AND PRUDENT SPEED',
+                'FAILURE TO DISPLAY REGISTRATION CARD UPON DEMAND', 'DRIVER USING HANDS TO USE HANDHELD TELEPHONE WHILEMOTOR VEHICLE IS IN MOTION',
+                'DRIVING VEH. ON HWY. WITH SUSPENDED REGISTRATION', 'FAILURE OF INDIVIDUAL DRIVING ON HIGHWAY TO DISPLAY LICENSE',
+                'PERSON DRIVING MOTOR VEHICLE ON HIGHWAY WITHOUT REQUIRED LICENSE', 'FAILURE TO OBEY DESIGNATED LANE DIRECTIONS']
+CHARGES = ['21-202(h1)', '21-801.1', '13-409(b)', '21-1124.2(d2)', '13-401(h)', '16-112(c)', '16-101(a)', '21-309(b)']
+MAKES = ['FORD', 'TOYOTA', 'HONDA', 'NISSAN', 'CHEVROLET', 'DODGE', 'HYUNDAI', 'ACURA', 'BMW', 'VOLKSWAGEN', 'JEEP']
+MODELS = ['MUSTANG', 'CAMRY', 'CIVIC', 'ACCORD', 'ALTIMA', 'COROLLA', 'F150', 'TK', '4S', 'SENTRA', 'CR-V']
+COLORS = ['BLACK', 'WHITE', 'SILVER', 'GRAY', 'RED', 'BLUE', 'GREEN', 'GOLD', 'MAROON', 'BROWN']
+VEHICLE_TYPES = ['02 - Automobile', '05 - Light Duty Truck', '01 - Motorcycle', '06 - Heavy Duty Truck']
+VIOLATION_TYPES = ['Citation', 'Warning', 'ESERO', 'SERO']
+RACES = ['BLACK', 'WHITE', 'HISPANIC', 'ASIAN', 'OTHER', 'NATIVE AMERICAN']
+YES_NO = ['No', 'Yes']
+
+# area codes that are in service, so generated numbers validate as US phone numbers
+VALID_AREA_CODES = ['212', '617', '415', '312', '206', '202', '301', '410', '703', '713']
+# values that commonly show up in phone columns and never validate
+INVALID_PHONES = ['N/A', 'BILL_TO', 'SHIP_TO', '000-000-0000', '12', '', '  ', 'none@example.com',
+                  '123456789012345678901234567890', '555-1234']
+
+
+def consumer_complaints(n_rows, n_keys=None, fanout=1, null_ratio=0.05, valid_phone_ratio=0.8, seed=0):
+    """
+    Generates a denormalized Consumer_Complaints-style dataframe. Rows are spread over n_keys distinct 'Complaint ID'
+    values, and 'Product', 'Sub-product' and 'Issue' take up to fanout distinct values per complaint, as you get when
+    a complaints table has been joined to a one-to-many table. Other fields are constant per complaint.
+    Includes a 'Phone' field (not in the original schema) for benchmarking phone number cleaning.
+
+    :param n_rows: number of rows
+    :param n_keys: number of distinct complaint ids. Defaults to n_rows (no repeated keys)
+    :param fanout: maximum number of distinct values per key for the multivalued fields
+    :param null_ratio: fraction of values (outside of the key field) that are NaN
+    :param valid_phone_ratio: fraction of non-null phones that are valid US numbers; the rest are garbage values
+    :param seed: random seed
+    :return: dataframe
+    """
+    rng = np.random.RandomState(seed)
+    keys = _generate_keys(rng, n_rows, n_keys)
+    offsets = rng.randint(0, max(fanout, 1), n_rows)
+
+    dataframe = pd.DataFrame({
+        'Date received': _dates(rng, keys),
+        'Product': _per_key_choice(PRODUCTS, keys, offsets),
+        'Sub-product': _per_key_choice(['Vehicle loan', 'Conventional fixed mortgage', 'Other mortgage', 'FHA mortgage',
+                                        'Checking account', 'Savings account', 'Federal student loan', 'I do not know'],
+                                       keys * 3, offsets),
+        'Issue': _per_key_choice(ISSUES, keys * 5, offsets),
+        'Company': _per_key_choice(COMPANIES, keys * 7),
+        'State': _per_key_choice(STATES, keys * 11),
+        'ZIP code': (keys * 7919 % 90000 + 10000).astype(str),
+        'Submitted via': _per_key_choice(SUBMITTED_VIA, keys * 13),
+        'Company response to consumer': _per_key_choice(COMPANY_RESPONSES, keys * 17),
+        'Timely response?': _per_key_choice(YES_NO, keys * 19),
+        'Consumer disputed?': _per_key_choice(YES_NO, keys * 23),
+        'Phone': _phones(rng, keys, valid_phone_ratio),
+        'Complaint ID': keys + 400000},
+        columns=['Date received', 'Product', 'Sub-product', 'Issue', 'Company', 'State', 'ZIP code', 'Submitted via',
+                 'Company response to consumer', 'Timely response?', 'Consumer disputed?', 'Phone', 'Complaint ID'])
+
+    _add_nulls(rng, dataframe, null_ratio, exclude=['Complaint ID'])
+    return dataframe
+
+def traffic_violations(n_rows, n_keys=None, fanout=1, null_ratio=0.05, seed=0):
+    """
+    Generates a Traffic_violations-style dataframe. Rows are spread over n_keys distinct stops (a 'Stop ID' field that
+    is not in the original schema), and 'Description', 'Charge' and 'Violation Type' take up to fanout distinct values
+    per stop, as when a driver gets several charges at one stop. Vehicle and driver fields are constant per stop and
+    have the low cardinality of the original data.
+
+    :param n_rows: number of rows
+    :param n_keys: number of distinct stops. Defaults to n_rows (no repeated keys)
+    :param fanout: maximum number of distinct values per key for the multivalued fields
+    :param null_ratio: fraction of values (outside of the key field) that are NaN
+    :param seed: random seed
+    :return: dataframe
+    """
+    rng = np.random.RandomState(seed)
+    keys = _generate_keys(rng, n_rows, n_keys)
+    offsets = rng.randint(0, max(fanout, 1), n_rows)
+
+    dataframe = pd.DataFrame({
+        'Stop ID': keys,
+        'Date Of Stop': _dates(rng, keys),
+        'Agency': _per_key_choice(AGENCIES, keys),
+        'SubAgency': _per_key_choice(SUBAGENCIES, keys * 3),
+        'Description': _per_key_choice(DESCRIPTIONS, keys * 5, offsets),
+        'Charge': _per_key_choice(CHARGES, keys * 5, offsets),
+        'Violation Type': _per_key_choice(VIOLATION_TYPES, keys * 7, offsets),
+        'Accident': _per_key_choice(YES_NO, keys // 50),
+        'State': _per_key_choice(STATES, keys * 11),
+        'VehicleType': _per_key_choice(VEHICLE_TYPES, keys * 13),
+        'Year': (keys * 31 % 25 + 1992).astype(str),
+        'Make': _per_key_choice(MAKES, keys * 17),
+        'Model': _per_key_choice(MODELS, keys * 19),
+        'Color': _per_key_choice(COLORS, keys * 23),
+        'Race': _per_key_choice(RACES, keys * 29),
+        'Gender': _per_key_choice(['M', 'F'], keys * 37)},
+        columns=['Stop ID', 'Date Of Stop', 'Agency', 'SubAgency', 'Description', 'Charge', 'Violation Type',
+                 'Accident', 'State', 'VehicleType', 'Year', 'Make', 'Model', 'Color', 'Race', 'Gender'])
+
+    _add_nulls(rng, dataframe, null_ratio, exclude=['Stop ID'])
+    return dataframe
+
+def _generate_keys(rng, n_rows, n_keys):
+    """ every key appears at least once (when n_rows allows), the remaining rows pick keys at random """
+    if n_keys is None:
+        n_keys = n_rows
+    if n_keys < 1:
+        raise ValueError('n_keys must be at least 1')
+
+    keys = np.concatenate([np.arange(min(n_keys, n_rows)), rng.randint(0, n_keys, max(n_rows - n_keys, 0))])
+    rng.shuffle(keys)
+    return keys
+
+def _per_key_choice(choices, seeds, offsets=None):
+    """ picks a value for every row from seeds (+ offsets), so rows with the same seed get the same value """
+    positions = seeds if offsets is None else seeds + offsets
+    return np.asarray(choices, dtype=object)[positions % len(choices)]
+
+def _dates(rng, keys):
+    """ one random date per key, spread over the years covered by the sample data """
+    n_keys = keys.max() + 1 if len(keys) else 0
+    days_by_key = rng.randint(0, 1800, n_keys)
+    days = pd.to_datetime('2011-12-01') + pd.to_timedelta(days_by_key[keys], unit='D')
+    return np.asarray(days.strftime('%m/%d/%Y'), dtype=object)
+
+def _phones(rng, keys, valid_phone_ratio):
+    """ one phone number per key: mostly valid US numbers in a mix of formats, plus garbage values """
+    key_rng = np.random.RandomState(rng.randint(0, 2 ** 31 - 1))
+    n_keys = keys.max() + 1 if len(keys) else 0
+
+    area_codes = np.asarray(VALID_AREA_CODES, dtype=object)[key_rng.randint(0, len(VALID_AREA_CODES), n_keys)]
+    exchanges = key_rng.randint(200, 1000, n_keys).astype(str).astype(object)
+    lines = np.char.zfill(key_rng.randint(0, 10000, n_keys).astype(str), 4).astype(object)
+    formats = key_rng.randint(0, 3, n_keys)
+
+    valid = np.where(formats == 0, '(' + area_codes + ') ' + exchanges + '-' + lines,
+                     np.where(formats == 1, area_codes + '-' + exchanges + '-' + lines,
+                              area_codes + exchanges + lines))
+    invalid = np.asarray(INVALID_PHONES, dtype=object)[key_rng.randint(0, len(INVALID_PHONES), n_keys)]
+
+    phones_by_key = np.where(key_rng.rand(n_keys) < valid_phone_ratio, valid, invalid)
+    return phones_by_key[keys]
+
+def _add_nulls(rng, dataframe, null_ratio, exclude):
+    """ replaces null_ratio of the values of every field except exclude with NaNs, in place """
+    if null_ratio <= 0:
+        return
+
+    for field in dataframe.columns:
+        if field in exclude:
+            continue
+        values = dataframe[field].values.astype(object)
+        values[rng.rand(len(values)) < null_ratio] = np.nan
+        dataframe[field] = values
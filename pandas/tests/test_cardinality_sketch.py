@@ -0,0 +1,61 @@
+import unittest
+import os
+import pandas as pd
+import numpy as np
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities.cardinality_sketch import KeyedHyperLogLog, precision_for_error_rate
+
+class TestKeyedHyperLogLog(unittest.TestCase):
+    def test_precision_for_error_rate(self):
+        self.assertEqual(precision_for_error_rate(0.05), 9)
+        self.assertEqual(precision_for_error_rate(0.9), 4)
+        self.assertEqual(precision_for_error_rate(0.0001), 16)
+        self.assertLessEqual(KeyedHyperLogLog(0.02).relative_error, 0.02)
+        self.assertRaises(ValueError, precision_for_error_rate, 0)
+
+    def test_small_counts_are_exact_and_nans_are_not_counted(self):
+        sketch = KeyedHyperLogLog().update(['a', 'a', 'b', 'b', 'b', 'c'], ['x', 'y', 'x', 'x', np.nan, np.nan])
+
+        self.assertEqual(sketch.estimate().to_dict(), {'a': 2, 'b': 1, 'c': 0})
+
+    def test_high_cardinality_within_error_bound(self):
+        rng = np.random.RandomState(0)
+        keys = rng.randint(0, 20, 200000)
+        values = rng.randint(0, 10 ** 9, 200000)
+
+        sketch = KeyedHyperLogLog(0.02).update(keys, values)
+        exact = pd.DataFrame({'key': keys, 'value': values}).groupby('key')['value'].nunique()
+        relative_errors = (sketch.estimate() / exact - 1).abs()
+
+        # every count within 4 standard errors
+        self.assertTrue((relative_errors < 4 * sketch.relative_error).all())
+
+    def test_merge_matches_single_sketch(self):
+        rng = np.random.RandomState(1)
+        keys = rng.randint(0, 50, 20000)
+        values = rng.randint(0, 5000, 20000)
+
+        single = KeyedHyperLogLog().update(keys, values)
+        merged = KeyedHyperLogLog().update(keys[:7000], values[:7000]).merge(
+            KeyedHyperLogLog().update(keys[7000:], values[7000:]))
+
+        pd.testing.assert_series_equal(merged.estimate(), single.estimate())
+        self.assertRaises(ValueError, merged.merge, KeyedHyperLogLog(precision=10))
+
+    def test_blockwise_updates_match_single_update(self):
+        rng = np.random.RandomState(2)
+        keys = rng.randint(0, 30, 10000)
+        values = rng.randint(0, 3000, 10000)
+
+        single = KeyedHyperLogLog().update(keys, values)
+        blockwise = KeyedHyperLogLog()
+        for start in range(0, len(keys), 1500):
+            blockwise.update(keys[start:start + 1500], values[start:start + 1500])
+
+        np.testing.assert_array_equal(blockwise._slots, single._slots)
+        np.testing.assert_array_equal(blockwise._ranks, single._ranks)
@@ -0,0 +1,125 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from pandas.util.testing import assert_frame_equal
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities import columnar_io
+from utilities.columnar_io import read_table, write_table, iter_chunks, ChunkWriter, format_for_path
+from utilities.csv_pipeline import process_in_chunks, step
+from utilities.csv_cleaning import nullify_non_alphanum
+from utilities.csv_profiling import profile_uniques
+from utilities.phone_number_utility import clean_phone_numbers
+from utilities.multivalued_table import MultivaluedTable
+
+class TestFormatForPath(unittest.TestCase):
+    def test_format_from_extension(self):
+        self.assertEqual(format_for_path('out/widened.parquet'), columnar_io.PARQUET)
+        self.assertEqual(format_for_path('widened.FEATHER'), columnar_io.ARROW)
+        self.assertEqual(format_for_path('widened.txt'), columnar_io.CSV)
+        self.assertEqual(format_for_path('widened.txt', columnar_io.ARROW), columnar_io.ARROW)
+        self.assertRaises(ValueError, format_for_path, 'widened.csv', 'xlsx')
+
+@unittest.skipIf(columnar_io.pyarrow is None, 'pyarrow is not installed')
+class TestColumnarIO(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.mydf = pd.DataFrame({'key': ['a', 'a', 'b', 'c', 'c'],
+                                  'make': pd.Categorical(['FORD', 'JEEP', 'FORD', np.nan, 'FORD']),
+                                  'city': ['Toronto', '---', 'Boston', np.nan, 'Madrid']})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_widened_table_round_trip_with_projection(self):
+        widened = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['make', 'city'])
+
+        for extension in ['.parquet', '.arrow']:
+            path = os.path.join(self.tempdir, 'widened' + extension)
+            write_table(widened, path)
+
+            assert_frame_equal(read_table(path), widened)
+            assert_frame_equal(read_table(path, columns=['make_1']), widened[['make_1']])
+
+    def test_chunks_written_and_read_back(self):
+        for extension in ['.parquet', '.arrow', '.csv']:
+            path = os.path.join(self.tempdir, 'chunks' + extension)
+            with ChunkWriter(path) as writer:
+                writer.write(self.mydf.iloc[:3])
+                writer.write(self.mydf.iloc[3:])
+
+            chunks = list(iter_chunks(path, 2, columns=['key', 'city']))
+            self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+            self.assertEqual(chunks[-1].index.tolist(), [4])
+            assert_frame_equal(pd.concat(chunks), read_table(path, columns=['key', 'city']))
+            assert_frame_equal(pd.concat(chunks), self.mydf[['key', 'city']])
+
+    def test_categorical_chunks_with_different_categories(self):
+        infile = os.path.join(self.tempdir, 'input.csv')
+        self.mydf.to_csv(infile, index=False)
+
+        for extension in ['.parquet', '.arrow']:
+            outfile = os.path.join(self.tempdir, 'cleaned' + extension)
+            # each chunk read from the csv gets the categories of its own values
+            rows_written = process_in_chunks(infile, outfile, [step(nullify_non_alphanum, ['city'])], chunksize=2,
+                                             read_kwargs={'dtype': {'key': str, 'make': 'category', 'city': str}})
+
+            self.assertEqual(rows_written, 5)
+            self.assertEqual(read_table(outfile)['make'].astype(object).fillna('').tolist(),
+                             ['FORD', 'JEEP', 'FORD', '', 'FORD'])
+
+    def test_chunks_with_an_all_null_first_chunk(self):
+        infile = os.path.join(self.tempdir, 'input.csv')
+        pd.DataFrame({'phone': ['BILL_TO', '', '416-593-8570', '(604) 264-0954', '1']}).to_csv(infile, index=False)
+        steps = [step(clean_phone_numbers, phonenum_field='phone', newField='clean', region_string='CA')]
+
+        for extension in ['.parquet', '.arrow']:
+            outfile = os.path.join(self.tempdir, 'cleaned' + extension)
+            # the first chunk has no valid numbers, so its newField is all NaN floats
+            process_in_chunks(infile, outfile, steps, chunksize=2, read_kwargs={'dtype': str})
+
+            self.assertEqual(read_table(outfile)['clean'].fillna('').tolist(),
+                             ['', '', '4165938570', '6042640954', ''])
+
+    def test_chunks_with_an_explicit_schema(self):
+        path = os.path.join(self.tempdir, 'chunks.parquet')
+        with ChunkWriter(path, schema={'clean': columnar_io.pyarrow.string()}) as writer:
+            writer.write(pd.DataFrame({'key': ['a'], 'clean': [np.nan]}))
+            writer.write(pd.DataFrame({'key': ['b'], 'clean': ['4165938570']}))
+
+        self.assertEqual(read_table(path)['clean'].fillna('').tolist(), ['', '4165938570'])
+
+    def test_columns_null_in_every_chunk(self):
+        path = os.path.join(self.tempdir, 'chunks.arrow')
+        with ChunkWriter(path) as writer:
+            writer.write(pd.DataFrame({'key': ['a'], 'empty': [None]}))
+            writer.write(pd.DataFrame({'key': ['b'], 'empty': [None]}))
+
+        self.assertEqual(read_table(path)['key'].tolist(), ['a', 'b'])
+        self.assertTrue(read_table(path)['empty'].isnull().all())
+
+    def test_pipeline_from_csv_to_parquet(self):
+        infile = os.path.join(self.tempdir, 'input.csv')
+        outfile = os.path.join(self.tempdir, 'cleaned.parquet')
+        self.mydf.to_csv(infile, index=False)
+
+        rows_written = process_in_chunks(infile, outfile, [step(nullify_non_alphanum, ['city'])], chunksize=2,
+                                         columns=['key', 'city'], read_kwargs={'dtype': str})
+
+        expected = self.mydf[['key', 'city']].copy()
+        nullify_non_alphanum(expected)
+        self.assertEqual(rows_written, 5)
+        assert_frame_equal(read_table(outfile), expected)
+
+    def test_profile_written_as_parquet(self):
+        outfile = os.path.join(self.tempdir, 'profile.parquet')
+        results = profile_uniques(self.mydf, 'key', ['make', 'city'], outfile=outfile)
+
+        assert_frame_equal(read_table(outfile), pd.DataFrame(results))
@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 from pandas.util.testing import assert_frame_equal, assert_series_equal
 
-from utilities.csv_cleaning import nullify_non_alphanum, nullify_fields_if_field_matches_pattern
+from utilities.csv_cleaning import nullify_non_alphanum, nullify_fields_if_field_matches_pattern, blacklist_values, \
+    nullify_regex, NullificationRules
 
 class TestCsvCleaning_NullifyNonAlphaNum(unittest.TestCase):
     def setUp(self):
@@ -74,4 +75,142 @@ class TestCsvCleaning_NullifyFieldsIfFieldMatchesPattern(unittest.TestCase):
 
         nullify_fields_if_field_matches_pattern(mydf, 'field1', pattern, ['field1'], case_sensitive=False)
 
-        assert_series_equal(expected['field1'], mydf['field1'])
\ No newline at end of file
+        assert_series_equal(expected['field1'], mydf['field1'])
+
+    def test_nullifies_with_nonunique_index(self):
+        mydf = self.mydf.copy(deep=True)
+        mydf.index = ['a', 'a', 'b', 'b', 'c', 'a']
+
+        expected = pd.DataFrame({'field1': ['hello', 'hello1', 'dontstop', 'why', 'HELLO', '3'],
+                             'field2': [np.nan, np.nan, np.nan, '. .', np.nan, 'a'],
+                             'field3': [np.nan, np.nan, 'a', '1 . 2', np.nan, np.nan]},
+                            index=['a', 'a', 'b', 'b', 'c', 'a'])
+
+        nullify_fields_if_field_matches_pattern(mydf, 'field1', 'hello', ['field2', 'field3'], case_sensitive=False)
+
+        assert_frame_equal(expected, mydf)
+
+    def test_case_sensitive_ignores_non_string_values(self):
+        mydf = self.mydf.copy(deep=True)
+
+        nullify_fields_if_field_matches_pattern(mydf, 'field3', 'A', ['field1'], case_sensitive=True)
+
+        assert_frame_equal(self.mydf, mydf)
+
+class TestCsvCleaning_NullifyNonAlphaNumMixedTypes(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'text': ['a', '--', '', 'b1'],
+                                  'ints': [1, 2, 3, 4],
+                                  'floats': [1.5, np.nan, 0.0, -2.0],
+                                  'mixed': ['!', 5, 'c', np.nan]})
+
+    def test_numeric_fields_are_left_untouched(self):
+        mydf = self.mydf.copy(deep=True)
+        nullify_non_alphanum(mydf)
+
+        expected = pd.DataFrame({'text': ['a', np.nan, np.nan, 'b1'],
+                                 'ints': [1, 2, 3, 4],
+                                 'floats': [1.5, np.nan, 0.0, -2.0],
+                                 'mixed': [np.nan, 5, 'c', np.nan]})
+
+        assert_frame_equal(mydf, expected)
+
+    def test_only_numeric_fields_selected(self):
+        mydf = self.mydf.copy(deep=True)
+        nullify_non_alphanum(mydf, ['ints', 'floats'])
+
+        assert_frame_equal(mydf, self.mydf)
+
+
+class TestCsvCleaning_NullificationRules(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'name': ['Acme', 'N/A', 'unknown', 'Widgets Inc', 'TEST ACCOUNT', np.nan],
+                                  'phone': ['555-1234', '000-000-0000', 'none', '555-9999', 'n/a', '999'],
+                                  'count': [1, 0, -1, 5, 0, 2]})
+
+    def test_blacklist_values_case_insensitive(self):
+        mydf = self.mydf.copy(deep=True)
+
+        counts = blacklist_values(mydf, {'name': ['n/a', 'Unknown'], 'phone': ['000-000-0000', 'N/A'], 'count': [-1]})
+
+        expected = pd.DataFrame({'name': ['Acme', np.nan, np.nan, 'Widgets Inc', 'TEST ACCOUNT', np.nan],
+                                 'phone': ['555-1234', np.nan, 'none', '555-9999', np.nan, '999'],
+                                 'count': [1, 0, np.nan, 5, 0, 2]})
+
+        assert_frame_equal(mydf, expected)
+        self.assertEqual(counts, {'name': 2, 'phone': 2, 'count': 1})
+
+    def test_blacklist_values_case_sensitive(self):
+        mydf = self.mydf.copy(deep=True)
+
+        counts = blacklist_values(mydf, {'name': ['n/a', 'unknown']}, case_sensitive=True)
+
+        self.assertEqual(counts, {'name': 1})
+        self.assertEqual(mydf['name'].isnull().sum(), 2)
+
+    def test_nullify_regex_combines_patterns(self):
+        mydf = self.mydf.copy(deep=True)
+
+        counts = nullify_regex(mydf, {'name': [r'^test', r'(un)?known'], 'phone': r'^n'})
+
+        expected = pd.DataFrame({'name': ['Acme', 'N/A', np.nan, 'Widgets Inc', np.nan, np.nan],
+                                 'phone': ['555-1234', '000-000-0000', np.nan, '555-9999', np.nan, '999'],
+                                 'count': [1, 0, -1, 5, 0, 2]})
+
+        self.assertEqual(counts, {'name': 2, 'phone': 2})
+        assert_frame_equal(mydf, expected)
+
+    def test_patterns_with_global_flags_are_applied_one_by_one(self):
+        mydf = self.mydf.copy(deep=True)
+
+        # (?i) must start a regex, so these patterns can't be combined into one
+        counts = nullify_regex(mydf, {'name': [r'(?i)^test', r'known$']}, case_sensitive=True)
+
+        self.assertEqual(counts, {'name': 2})
+        self.assertEqual(mydf['name'].isnull().tolist(), [False, False, True, False, True, True])
+
+    def test_patterns_reusing_a_group_name_are_applied_one_by_one(self):
+        mydf = self.mydf.copy(deep=True)
+
+        counts = nullify_regex(mydf, {'phone': [r'^(?P<digit>0)(?P=digit)', r'^(?P<digit>9)(?P=digit)']})
+
+        self.assertEqual(counts, {'phone': 2})
+        self.assertEqual(mydf['phone'].isnull().tolist(), [False, True, False, False, False, True])
+
+    def test_rules_are_reused_across_dataframes(self):
+        rules = NullificationRules().add_blacklist('name', ['n/a']).add_pattern('phone', r'^0+[-0]*$')
+
+        first = self.mydf.copy(deep=True)
+        second = self.mydf.copy(deep=True)
+
+        self.assertEqual(rules.apply(first), {'name': 1, 'phone': 1})
+        self.assertEqual(rules.apply(second), {'name': 1, 'phone': 1})
+        assert_frame_equal(first, second)
+
+class TestCsvCleaning_Categoricals(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'make': pd.Categorical(['FORD', '---', 'N/A', 'FORD', np.nan, 'jeep']),
+                                  'description': pd.Categorical(['SPEED', 'LICENSE', 'SPEED', 'LIGHT', 'SPEED',
+                                                                 np.nan])})
+
+    def test_nullify_non_alphanum_keeps_categoricals(self):
+        nullify_non_alphanum(self.mydf)
+
+        self.assertEqual(self.mydf['make'].dtype, 'category')
+        self.assertEqual(self.mydf['make'].cat.categories.tolist(), ['FORD', 'N/A', 'jeep'])
+        self.assertEqual(self.mydf['make'].isnull().tolist(), [False, True, False, False, True, False])
+
+    def test_rules_remove_matching_categories(self):
+        counts = NullificationRules().add_blacklist('make', ['JEEP']).add_pattern('make', '/') \
+            .add_pattern('description', '^LI').apply(self.mydf)
+
+        self.assertEqual(counts, {'make': 2, 'description': 2})
+        self.assertEqual(self.mydf['make'].cat.categories.tolist(), ['---', 'FORD'])
+        self.assertEqual(self.mydf['description'].cat.categories.tolist(), ['SPEED'])
+        self.assertEqual(self.mydf['description'].isnull().tolist(), [False, True, False, True, False, True])
+
+    def test_nullify_fields_if_categorical_field_matches_pattern(self):
+        nullify_fields_if_field_matches_pattern(self.mydf, 'description', 'speed', ['make'])
+
+        self.assertEqual(self.mydf['make'].dtype, 'category')
+        self.assertEqual(self.mydf['make'].isnull().tolist(), [True, False, True, False, True, False])
@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from pandas.util.testing import assert_frame_equal
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities.csv_loading import read_csv_categorical, low_cardinality_fields, categorize
+
+class TestCsvLoading(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'id': [str(i) for i in range(8)],
+                                  'make': ['FORD', 'JEEP', 'FORD', np.nan, 'FORD', 'JEEP', 'FORD', 'FORD'],
+                                  'year': [2001, 2002, 2001, 2003, 2001, 2002, 2001, 2001]})
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'vehicles.csv')
+        self.mydf.to_csv(self.path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_low_cardinality_text_fields_are_picked(self):
+        self.assertEqual(low_cardinality_fields(self.mydf), ['make'])
+        self.assertEqual(low_cardinality_fields(self.mydf, max_unique_ratio=1), ['id', 'make'])
+
+    def test_read_csv_categorical_picks_fields_from_sample(self):
+        result = read_csv_categorical(self.path, sample_rows=4)
+
+        self.assertEqual(result['make'].dtype, 'category')
+        self.assertEqual(result['id'].dtype, 'int64')
+        assert_frame_equal(result.astype({'make': object}), pd.read_csv(self.path))
+
+    def test_read_csv_categorical_with_given_fields_and_dtypes(self):
+        result = read_csv_categorical(self.path, categorical_fields=['id', 'make'], dtype={'id': str})
+
+        self.assertEqual(result['id'].dtype, object)
+        self.assertEqual(result['make'].cat.categories.tolist(), ['FORD', 'JEEP'])
+
+    def test_read_csv_categorical_with_single_dtype(self):
+        # the single dtype applies to the fields that aren't loaded as categoricals
+        result = read_csv_categorical(self.path, categorical_fields=['make'], dtype=str)
+
+        self.assertEqual(result['make'].dtype, 'category')
+        self.assertEqual(result['id'].tolist(), self.mydf['id'].tolist())
+        self.assertEqual(result['year'].tolist(), self.mydf['year'].astype(str).tolist())
+
+    def test_categorize_in_place(self):
+        self.assertEqual(categorize(self.mydf), ['make'])
+        self.assertEqual(self.mydf['make'].dtype, 'category')
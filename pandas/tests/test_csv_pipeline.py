@@ -0,0 +1,78 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from pandas.util.testing import assert_frame_equal
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities.csv_pipeline import process_csv_in_chunks, step, column_step
+from utilities.csv_cleaning import nullify_non_alphanum
+from utilities.csv_transformations import concat_fieldvalues
+from utilities.phone_number_utility import clean_phone_numbers
+
+class TestProcessCsvInChunks(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.infile = os.path.join(self.tempdir, 'input.csv')
+        self.outfile = os.path.join(self.tempdir, 'output.csv')
+
+        self.mydf = pd.DataFrame({'city': ['Toronto', '---', 'Boston', 'London', '?', 'Madrid', 'Toronto'],
+                                  'state': ['ON', 'BC', 'MA', np.nan, '..', 'MD', 'ON'],
+                                  'phone': ['416-593-8570', '(604) 264-0954', 'BILL_TO', np.nan, '416 593 8570',
+                                            '', '4165938570']})
+        self.mydf.to_csv(self.infile, index=False)
+
+        self.steps = [step(nullify_non_alphanum, ['city', 'state']),
+                      step(clean_phone_numbers, phonenum_field='phone', newField='cleaned_phone', region_string='CA'),
+                      column_step('city_state', concat_fieldvalues, ['city', 'state'], separator=', ')]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_chunked_output_matches_whole_file(self):
+        rows_written = process_csv_in_chunks(self.infile, self.outfile, self.steps, chunksize=3,
+                                             read_csv_kwargs={'dtype': str})
+
+        expected = pd.read_csv(self.infile, dtype=str)
+        for pipeline_step in self.steps:
+            pipeline_step(expected)
+
+        self.assertEqual(rows_written, 7)
+        assert_frame_equal(pd.read_csv(self.outfile, dtype=str), expected.astype(object))
+
+    def test_step_returning_dataframe_replaces_chunk(self):
+        steps = [lambda chunk: chunk[['city']]]
+
+        process_csv_in_chunks(self.infile, self.outfile, steps, chunksize=2)
+
+        result = pd.read_csv(self.outfile)
+        self.assertEqual(result.columns.tolist(), ['city'])
+        self.assertEqual(len(result), 7)
+
+    def test_header_option_applies_to_first_chunk(self):
+        aliases = ['CITY', 'STATE', 'PHONE']
+        process_csv_in_chunks(self.infile, self.outfile, [], chunksize=3, to_csv_kwargs={'header': aliases})
+        self.assertEqual(pd.read_csv(self.outfile).columns.tolist(), aliases)
+        self.assertEqual(len(pd.read_csv(self.outfile)), 7)
+
+        process_csv_in_chunks(self.infile, self.outfile, [], chunksize=3, to_csv_kwargs={'header': False})
+        self.assertEqual(len(pd.read_csv(self.outfile, header=None)), 7)
+
+    def test_chunks_without_null_regions_are_cleaned(self):
+        # some chunks of the region field hold no nulls
+        steps = [step(clean_phone_numbers, phonenum_field='phone', newField='cleaned_phone', region_field='region')]
+        self.mydf.assign(region=['CA', 'CA', 'US', np.nan, 'CA', 'US', 'CA']).to_csv(self.infile, index=False)
+
+        process_csv_in_chunks(self.infile, self.outfile, steps, chunksize=3, read_csv_kwargs={'dtype': str})
+
+        self.assertEqual(pd.read_csv(self.outfile, dtype=str)['cleaned_phone'].fillna('').tolist(),
+                         ['4165938570', '6042640954', '', '', '4165938570', '', '4165938570'])
+
+    def test_invalid_chunksize_raises_error(self):
+        self.assertRaises(ValueError, process_csv_in_chunks, self.infile, self.outfile, self.steps, chunksize=0)
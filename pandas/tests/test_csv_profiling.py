@@ -0,0 +1,150 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities import columnar_io
+from utilities.csv_profiling import profile_uniques, profile_uniques_mapped, UniquesProfile
+from utilities.multivalued_table import MultivaluedTable
+
+class TestCsvProfiling(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['1', '1', '2', '2', '2', '3'],
+                                  'field1': ['y', 'y', np.nan, 'x', 'z', 'a'],
+                                  'field2': ['y', 'z', 'a', 'a', 'a', np.nan]})
+
+    def test_profiling_works_for_strings_and_NaNs(self):
+        expected = [{'field': 'field1', 'min_uniques': 1, 'max_uniques': 2, 'avg_uniques': 1.3333333333333333},
+                    {'field': 'field2', 'min_uniques': 0, 'max_uniques': 2, 'avg_uniques': 1.0}]
+
+        self.assertEqual(profile_uniques(self.mydf, 'key', ['field1', 'field2']), expected)
+
+    def test_repeated_fields_get_scalar_stats(self):
+        expected = {'field': 'field1', 'min_uniques': 1, 'max_uniques': 2, 'avg_uniques': 1.3333333333333333}
+
+        self.assertEqual(profile_uniques(self.mydf, 'key', ['field1', 'field1']), [expected, expected])
+
+class TestUniquesProfile(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['1', '1', '2', '2', '2', '3', np.nan, '4', '2', '4'],
+                                  'field1': ['y', 'y', np.nan, 'x', 'z', 'a', 'b', np.nan, 'w', np.nan],
+                                  'field2': ['y', 'z', 'a', 'a', 'a', np.nan, 'c', 'd', 'e', 'd']})
+        self.fields = ['field1', 'field2']
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_chunked_updates_match_profile_uniques(self):
+        profile = UniquesProfile('key', self.fields)
+        for start in range(0, len(self.mydf), 3):
+            profile.update(self.mydf.iloc[start:start + 3])
+
+        self.assertEqual(profile.field_stats(), MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields))
+        self.assertEqual(profile.to_list(), profile_uniques(self.mydf, 'key', self.fields))
+        self.assertEqual(profile.rows_seen, 10)
+
+    def test_merged_profiles_match_profile_uniques(self):
+        first = UniquesProfile('key', self.fields).update(self.mydf.iloc[:5])
+        second = UniquesProfile('key', self.fields).update(self.mydf.iloc[5:])
+
+        first.merge(second)
+
+        self.assertEqual(first.field_stats(), MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields))
+
+    def test_keys_of_mixed_types_are_counted(self):
+        # files read with different dtypes can give the same profile int and string keys, which can't be sorted
+        profile = UniquesProfile('key', self.fields).update(self.mydf.iloc[:5])
+        profile.update(self.mydf.iloc[5:].assign(key=[3, np.nan, 4, 2, 4]))
+
+        self.assertEqual(profile.count_uniques_by_key('field2').to_dict(), {'1': 2, '2': 1, 3: 0, 4: 1, 2: 1})
+
+    def test_merge_requires_same_fields(self):
+        self.assertRaises(ValueError, UniquesProfile('key', self.fields).merge, UniquesProfile('key', ['field1']))
+
+    def test_save_load_and_update_from_csv(self):
+        profile_path = os.path.join(self.tempdir, 'profile.pkl')
+        csv_path = os.path.join(self.tempdir, 'day2.csv')
+        self.mydf.iloc[4:].to_csv(csv_path, index=False)
+
+        UniquesProfile('key', self.fields).update(self.mydf.iloc[:4]).save(profile_path)
+        profile = UniquesProfile.load(profile_path).update_from_csv(csv_path, chunksize=2, dtype=str)
+
+        self.assertEqual(profile.field_stats(), MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields))
+
+    def test_approximate_profile_matches_exact_counts_with_metadata(self):
+        approximate = UniquesProfile('key', self.fields, approximate=True, error_rate=0.05)
+        approximate.update(self.mydf.iloc[:5]).merge(
+            UniquesProfile('key', self.fields, approximate=True, error_rate=0.05).update(self.mydf.iloc[5:]))
+        exact = MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields)
+
+        stats = approximate.field_stats()
+        for field in self.fields:
+            self.assertTrue(stats[field].pop('approximate'))
+            self.assertLessEqual(stats[field].pop('relative_error'), 0.05)
+        self.assertEqual(stats, exact)
+        self.assertRaises(ValueError, approximate.merge, UniquesProfile('key', self.fields))
+
+    def test_approximate_profile_uniques(self):
+        outfile = os.path.join(self.tempdir, 'profile.csv')
+        results = profile_uniques(self.mydf, 'key', self.fields, outfile=outfile, approximate=True)
+        mvt_results = MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields, approximate=True)
+
+        self.assertEqual([result.pop('field') for result in results], self.fields)
+        self.assertEqual(results, [mvt_results[field] for field in self.fields])
+        self.assertEqual(list(pd.read_csv(outfile).columns),
+                         ['field', 'max_uniques', 'avg_uniques', 'min_uniques', 'approximate', 'relative_error'])
+
+
+@unittest.skipIf(columnar_io.pyarrow is None, 'pyarrow is not installed')
+class TestProfileUniquesMapped(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['1', '1', '2', '2', '2', '3', np.nan, '4'],
+                                  'field1': ['y', 'y', np.nan, 'x', 'z', 'a', 'b', np.nan],
+                                  'field2': [1.5, 2.5, 1.5, 1.5, 1.5, np.nan, 3.0, 4.0],
+                                  'field3': pd.Categorical(['a', 'b', 'a', 'a', np.nan, 'c', 'c', 'a'])})
+        self.fields = ['field1', 'field2', 'field3']
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_arrow_file_matches_profile_uniques(self):
+        path = os.path.join(self.tempdir, 'data.arrow')
+        with columnar_io.ChunkWriter(path) as writer:
+            writer.write(self.mydf.iloc[:3])
+            writer.write(self.mydf.iloc[3:])
+
+        self.assertEqual(profile_uniques_mapped(path, 'key', self.fields),
+                         profile_uniques(self.mydf, 'key', self.fields))
+        self.assertEqual(MultivaluedTable.profile_uniques_mapped(path, 'key', self.fields),
+                         MultivaluedTable.profile_uniques(self.mydf, 'key', self.fields))
+
+    def test_written_arrow_file_is_mapped(self):
+        path = os.path.join(self.tempdir, 'data.arrow')
+        columnar_io.write_table(self.mydf, path)
+
+        self.assertEqual(profile_uniques_mapped(path, 'key', self.fields),
+                         profile_uniques(self.mydf, 'key', self.fields))
+
+    def test_compressed_arrow_file_is_rejected(self):
+        path = os.path.join(self.tempdir, 'data.arrow')
+        columnar_io.write_table(self.mydf, path, compression='lz4')
+
+        self.assertRaises(ValueError, profile_uniques_mapped, path, 'key', self.fields)
+
+    def test_npy_directory_matches_profile_uniques(self):
+        np.save(os.path.join(self.tempdir, 'key.npy'), np.array([1, 1, 2, 2, 2, 3, 5, 4]))
+        np.save(os.path.join(self.tempdir, 'field1.npy'), np.array(['y', 'y', '', 'x', 'z', 'a', 'b', '']))
+        np.save(os.path.join(self.tempdir, 'field2.npy'), self.mydf['field2'].values)
+        mydf = self.mydf.assign(key=[1, 1, 2, 2, 2, 3, 5, 4])
+
+        self.assertEqual(profile_uniques_mapped(self.tempdir, 'key', ['field1', 'field2']),
+                         profile_uniques(mydf, 'key', ['field1', 'field2']))
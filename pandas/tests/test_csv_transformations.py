@@ -22,9 +22,8 @@ class TestCsvConcatenationTransformations(unittest.TestCase):
         assert_series_equal(self.df["new_concat_field_ab"], expected_result_ab['new_concat_field_ab'])
         assert_series_equal(self.df["new_concat_field_abc"], expected_result_abc['new_concat_field_abc'])
 
-    @unittest.skip("This currently fails because doesn't convert ints to strings")
     def test_strings_NaNs_numbers_are_concatenated(self):
-        self.df["new_concat_field_abd"] = concat_fieldvalues(self.df, ['a', 'b', 'd'])
+        self.df["new_concat_field_abd"] = concat_fieldvalues(self.df, ['a', 'b', 'd'], skip_empty_values=True)
         expected_result_abd = pd.DataFrame({'new_concat_field_abd': ['x y x', 'y', 'x 1']})
 
         assert_series_equal(self.df["new_concat_field_abd"], expected_result_abd['new_concat_field_abd'])
@@ -43,13 +42,53 @@ class TestCsvConcatenationTransformations(unittest.TestCase):
         expected_result_bc = pd.DataFrame({'new_concat_field_bc': ['y z', 'y z', np.nan]})
         assert_series_equal(mydf["new_concat_field_bc"], expected_result_bc["new_concat_field_bc"])
 
-    #@unittest.skip('will fail--doesnt currently strip whitespaces before concat')
     def test_leading_trailing_whitespaces_in_fields_are_stripped(self):
         """ any leading/trailing whitespaces within a column will be stripped before concatenation occurs"""
-        self.df["new_concat_field_ae"] = concat_fieldvalues(self.df, ['a', 'e'])
+        self.df["new_concat_field_ae"] = concat_fieldvalues(self.df, ['a', 'e'], skip_empty_values=True)
 
         expected_result_ae = pd.DataFrame({'new_concat_field_ae': ['x y12', 'y', 'x']})
         assert_series_equal(self.df["new_concat_field_ae"], expected_result_ae['new_concat_field_ae'])
 
+    def test_middle_NaNs_double_separators(self):
+        # only the whole concatenation is stripped, so NaNs between values leave their separators in
+        self.df["new_concat_field_bad"] = concat_fieldvalues(self.df, ['b', 'a', 'd'], separator=', ')
+        expected_result_bad = pd.DataFrame({'new_concat_field_bad': ['y, x, x', 'y, ,', ', x, 1']})
+
+        assert_series_equal(self.df["new_concat_field_bad"], expected_result_bad['new_concat_field_bad'])
+
+    def test_middle_NaNs_do_not_double_separators_when_skipping_empty_values(self):
+        self.df["new_concat_field_bac"] = concat_fieldvalues(self.df, ['b', 'a', 'c'], separator=', ',
+                                                             skip_empty_values=True)
+        expected_result_bac = pd.DataFrame({'new_concat_field_bac': ['y, x, z', 'y, z', 'x']})
+
+        assert_series_equal(self.df["new_concat_field_bac"], expected_result_bac['new_concat_field_bac'])
+
+    def test_nan_substitute_is_used(self):
+        result = concat_fieldvalues(self.df, ['a', 'b'], nan_substitute='?')
+        expected = pd.Series(['x y', '? y', 'x ?'], name='a')
+
+        assert_series_equal(result, expected)
+
+    def test_output_dtype(self):
+        result = concat_fieldvalues(self.df, ['b', 'c'], dtype='category')
+        expected = pd.Series(['y z', 'y z', np.nan], name='b', dtype='category')
+
+        assert_series_equal(result, expected)
+
+    def test_output_dtype_of_single_field(self):
+        result = concat_fieldvalues(self.df, ['b'], dtype='category')
+        expected = pd.Series(['y', 'y', np.nan], name='b', dtype='category')
+
+        assert_series_equal(result, expected)
+
     def tearDown(self):
-        del self.df
\ No newline at end of file
+        del self.df
+
+
+class TestCsvConcatenationOfCategoricals(unittest.TestCase):
+    def test_categoricals_are_concatenated_like_strings(self):
+        df = pd.DataFrame({'make': [' FORD', 'JEEP', np.nan], 'color': ['RED', np.nan, np.nan]})
+        categorical_df = df.astype('category')
+
+        assert_series_equal(concat_fieldvalues(categorical_df, ['make', 'color']),
+                            concat_fieldvalues(df, ['make', 'color']))
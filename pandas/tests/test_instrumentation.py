@@ -0,0 +1,114 @@
+import unittest
+import json
+import logging
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities import instrumentation
+from utilities.instrumentation import MemoryCollector, JsonLinesSink, LoggingSink
+from utilities.csv_cleaning import blacklist_values, nullify_fields_if_field_matches_pattern
+from utilities.multivalued_table import MultivaluedTable
+from utilities.phone_number_utility import clean_phone_numbers, PhoneParseCache
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.collector = MemoryCollector()
+        self.mydf = pd.DataFrame({'key': ['a', 'a', 'b', 'c'],
+                                  'phone': ['416-593-8570', '416-593-8570', 'BILL_TO', '000-000-0000'],
+                                  'field1': ['x', 'y', 'x', np.nan]})
+
+    def tearDown(self):
+        instrumentation.disable()
+
+    def test_nothing_is_recorded_when_disabled(self):
+        clean_phone_numbers(self.mydf, phonenum_field='phone', newField='cleaned', region_string='CA')
+
+        with instrumentation.stage('unused', rows=10) as stage:
+            stage.count('counter')
+            instrumentation.count('counter')
+
+        self.assertFalse(instrumentation.is_enabled())
+        self.assertEqual(self.collector.records, [])
+
+    def test_phone_cleaning_records_stage_and_counters(self):
+        instrumentation.enable(self.collector)
+
+        clean_phone_numbers(self.mydf, phonenum_field='phone', newField='cleaned', region_string='CA',
+                            parse_cache=PhoneParseCache())
+
+        record, = self.collector.records
+        self.assertEqual(record['stage'], '_clean_phone_batch')
+        self.assertEqual(record['rows'], 4)
+        self.assertIsNotNone(record['rows_per_sec'])
+        self.assertIsNone(record['error'])
+        self.assertEqual(record['counters'], {'phone_valid': 2, 'phone_invalid': 1, 'phone_parse_failures': 1,
+                                              'phone_cache_hits': 1, 'phone_cache_misses': 3})
+
+    def test_row_by_row_phone_cleaning_counts_outcomes(self):
+        instrumentation.enable(self.collector)
+
+        clean_phone_numbers(self.mydf, phonenum_field='phone', newField='cleaned', region_string='CA', batch=False)
+
+        self.assertEqual(self.collector.counter_totals(), {'phone_valid': 2, 'phone_invalid': 1,
+                                                           'phone_parse_failures': 1})
+
+    def test_nested_stages_and_nullification_counters(self):
+        instrumentation.enable(self.collector)
+
+        MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['field1'])
+        nullify_fields_if_field_matches_pattern(self.mydf, 'phone', '416', ['field1'])
+        blacklist_values(self.mydf, {'phone': ['BILL_TO']})
+
+        stages = [record['stage'] for record in self.collector.records]
+        # inner stages are emitted before the stages that contain them
+        self.assertEqual(stages, ['profile_uniques', '_widen_one_field', 'widen_multivalues_into_additional_columns',
+                                  'nullify_fields_if_field_matches_pattern', 'NullificationRules.apply'])
+        self.assertEqual(self.collector.counter_totals(), {'rows_nullified': 2, 'values_nullified': 1})
+
+    def test_failed_stage_records_error(self):
+        instrumentation.enable(self.collector)
+
+        with self.assertRaises(KeyError):
+            MultivaluedTable.profile_uniques(self.mydf, 'key', ['missing_field'])
+
+        self.assertEqual(self.collector.records[0]['error'], 'KeyError')
+
+class TestInstrumentationSinks(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        instrumentation.disable()
+        shutil.rmtree(self.tempdir)
+
+    def test_json_lines_sink(self):
+        path = os.path.join(self.tempdir, 'stages.jsonl')
+        instrumentation.enable(JsonLinesSink(path))
+
+        for i in range(2):
+            with instrumentation.stage('stage' + str(i), rows=5):
+                instrumentation.count('things', 3)
+
+        with open(path) as jsonfile:
+            records = [json.loads(line) for line in jsonfile]
+
+        self.assertEqual([record['stage'] for record in records], ['stage0', 'stage1'])
+        self.assertEqual(records[1]['counters'], {'things': 3})
+
+    def test_logging_sink(self):
+        logger = logging.getLogger('test_instrumentation')
+        instrumentation.enable(LoggingSink(logger))
+
+        with self.assertLogs(logger, level='INFO') as logs:
+            with instrumentation.stage('logged'):
+                pass
+
+        self.assertIn('stage logged', logs.output[0])
@@ -1,4 +1,8 @@
 import unittest
+import warnings
+import os
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 from pandas.util.testing import assert_frame_equal, assert_series_equal
@@ -9,6 +13,7 @@ import sys
 script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
 sys.path.append(os.path.join(script_dir,os.pardir))
 
+from utilities import columnar_io
 from utilities.multivalued_table import MultivaluedTable
 
 class TestMultivaluedTableProfiling(unittest.TestCase):
@@ -155,3 +160,218 @@ class TestMultivaluedTableWidening(unittest.TestCase):
 
         assert_series_equal(result['field1'], expected['field1'])
         assert_series_equal(result['empty_field'], expected['empty_field'])
+
+
+class TestMultivaluedTableProfilingMatchesPerFieldGroupby(unittest.TestCase):
+    def test_single_aggregation_matches_per_field_nunique(self):
+        mydf = pd.DataFrame({'key': [3, 1, 1, 2, 2, 2, np.nan, 3],
+                             'field1': ['y', 'y', 'x', np.nan, 'x', 'z', 'a', 'b'],
+                             'field2': [1.0, 2.0, 2.0, np.nan, np.nan, np.nan, 3.0, 1.0],
+                             'field3': ['a', 'a', 'a', 'a', 'a', 'a', 'a', 'a']})
+        fields = ['field1', 'field2', 'field3']
+
+        result = MultivaluedTable.profile_uniques(mydf, 'key', fields, debug_multiple_uniques=True)
+
+        for field in fields:
+            count_by_key = mydf.groupby('key')[field].nunique()
+            self.assertEqual(result[field], {'max_uniques': count_by_key.max(),
+                                             'avg_uniques': count_by_key.mean(),
+                                             'min_uniques': count_by_key.min()})
+
+    def test_no_fields_to_profile(self):
+        mydf = pd.DataFrame({'key': [1, 1, 2], 'field1': ['a', 'b', 'c']})
+
+        self.assertEqual(MultivaluedTable.profile_uniques(mydf, 'key', []), {})
+
+    def test_repeated_fields_are_profiled_once(self):
+        mydf = pd.DataFrame({'key': [1, 1, 2], 'field1': ['a', 'b', 'c']})
+
+        self.assertEqual(MultivaluedTable.profile_uniques(mydf, 'key', ['field1', 'field1']),
+                         MultivaluedTable.profile_uniques(mydf, 'key', ['field1']))
+
+
+class TestMultivaluedTableVectorizedWidening(unittest.TestCase):
+    def test_values_keep_first_seen_order_and_type(self):
+        mydf = pd.DataFrame({'key': [2, 1, 2, 1, 2, 2, 1],
+                             'field1': [30, 5, 10, 5, np.nan, 20, 7]})
+        stats = MultivaluedTable.profile_uniques(mydf, 'key', ['field1'])
+
+        result = MultivaluedTable._widen_one_field(mydf, 'key', 'field1', stats)
+
+        expected = pd.DataFrame({'field1': [5.0, 30.0], 'field1_1': [7.0, 10.0], 'field1_2': [np.nan, 20.0]},
+                                index=pd.Index([1, 2], name='key'))
+        assert_frame_equal(result, expected)
+
+    def test_integer_values_are_padded_with_nans(self):
+        mydf = pd.DataFrame({'key': ['1', '1', '2'], 'field1': [10, 20, 30]})
+
+        result = MultivaluedTable._widen_one_field(mydf, 'key', 'field1', {'field1': {'max_uniques': 2}})
+
+        self.assertEqual(result['field1'].tolist(), [10, 30])
+        self.assertEqual(result['field1_1'].tolist()[0], 20)
+        self.assertTrue(np.isnan(result['field1_1'].tolist()[1]))
+
+    def test_more_than_ten_columns_keep_numeric_suffix_order(self):
+        mydf = pd.DataFrame({'key': ['a'] * 12 + ['b'], 'field1': [str(i) for i in range(13)]})
+        stats = MultivaluedTable.profile_uniques(mydf, 'key', ['field1'])
+
+        result = MultivaluedTable._widen_one_field(mydf, 'key', 'field1', stats, limit=11)
+
+        self.assertEqual(result.columns.tolist(), ['field1'] + ['field1_' + str(i) for i in range(1, 11)])
+        self.assertEqual(result.loc['a'].tolist(), [str(i) for i in range(11)])
+        self.assertEqual(result.loc['b', 'field1'], '12')
+        self.assertTrue(result.loc['b', 'field1_1':].isnull().all())
+
+
+class TestMultivaluedTableWideningAssembly(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['cc', 'aa', 'aa', 'bb', 'bb', 'cc'],
+                                  'field1': ['z', 'y', 'x', np.nan, 'w', 'z'],
+                                  'field2': [np.nan, '1', '1', '2', '2', np.nan]})
+
+    def test_fields_are_aligned_on_first_seen_key_order(self):
+        result = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['field1', 'field2'])
+
+        expected = pd.DataFrame([{'key': 'cc', 'field1': 'z', 'field1_1': np.nan, 'field2': np.nan},
+                                 {'key': 'aa', 'field1': 'y', 'field1_1': 'x', 'field2': '1'},
+                                 {'key': 'bb', 'field1': 'w', 'field1_1': np.nan, 'field2': '2'}]).set_index('key')
+
+        assert_frame_equal(result, expected)
+
+    def test_without_copy_gives_same_result(self):
+        copied = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['field1', 'field2'])
+        not_copied = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['field1', 'field2'],
+                                                                                copy=False)
+
+        assert_frame_equal(copied, not_copied)
+
+    def test_no_fields_returns_unique_keys(self):
+        result = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', [])
+
+        assert_frame_equal(result, MultivaluedTable._generate_unique_key_dataframe(self.mydf, 'key'))
+
+
+class TestMultivaluedTableCategoricals(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': pd.Categorical(['cc', 'aa', 'aa', 'bb'], categories=['aa', 'bb', 'cc', 'dd']),
+                                  'field1': pd.Categorical(['z', 'y', 'x', np.nan]),
+                                  'field2': pd.Categorical(['1', '1', '1', '2'])})
+
+    def test_unused_key_categories_are_not_profiled(self):
+        self.assertEqual(MultivaluedTable.profile_uniques(self.mydf, 'key', ['field1', 'field2']),
+                         MultivaluedTable.profile_uniques(self.mydf.astype(object), 'key', ['field1', 'field2']))
+
+    def test_widened_fields_stay_categorical(self):
+        result = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key', ['field1', 'field2'])
+        expected = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf.astype(object), 'key',
+                                                                              ['field1', 'field2'])
+
+        self.assertTrue(all(dtype == 'category' for dtype in result.dtypes))
+        self.assertEqual(result['field1'].cat.categories.tolist(), ['x', 'y', 'z'])
+        assert_frame_equal(result.astype(object).set_axis(result.index.astype(object)), expected,
+                           check_index_type=False)
+
+
+class TestMultivaluedTableKeyDiagnostics(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['b', 'a', 'b', np.nan, 'c', 'a', 'b', 'd'],
+                                  'field1': range(8)})
+
+    def test_diagnose_key(self):
+        diagnostics = MultivaluedTable.diagnose_key(self.mydf, 'key', top_n=1)
+
+        self.assertEqual(dict((name, diagnostics[name]) for name in ['rows', 'null_keys', 'distinct_keys', 'is_unique',
+                                                                     'duplicate_keys', 'rows_with_duplicate_keys',
+                                                                     'max_rows_per_key']),
+                         {'rows': 8, 'null_keys': 1, 'distinct_keys': 4, 'is_unique': False, 'duplicate_keys': 2,
+                          'rows_with_duplicate_keys': 5, 'max_rows_per_key': 3})
+        self.assertEqual(diagnostics['fan_out'].to_dict(), {1: 2, 2: 1, 3: 1})
+        assert_series_equal(diagnostics['top_keys'], pd.Series([3], index=pd.Index(['b'], name='key'), name='rows'))
+
+    def test_top_keys_keep_key_dtype(self):
+        # the repeated keys of an object key field are all ints here, which pandas would otherwise infer as int64
+        mydf = pd.DataFrame({'key': pd.Series([1, 'a', 1, 2, 2], dtype=object)})
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', FutureWarning)
+            diagnostics = MultivaluedTable.diagnose_key(mydf, 'key')
+
+        self.assertEqual(diagnostics['top_keys'].index.dtype, object)
+        self.assertEqual(diagnostics['top_keys'].to_dict(), {1: 2, 2: 2})
+
+    def test_diagnose_unique_key(self):
+        diagnostics = MultivaluedTable.diagnose_key(self.mydf, 'field1')
+
+        self.assertTrue(diagnostics['is_unique'])
+        self.assertEqual(diagnostics['fan_out'].to_dict(), {1: 8})
+        self.assertEqual(len(diagnostics['top_keys']), 0)
+
+    def test_key_is_unique(self):
+        for blocksize in [1, 3, 100]:
+            self.assertFalse(MultivaluedTable.key_is_unique(self.mydf, 'key', blocksize=blocksize))
+            self.assertTrue(MultivaluedTable.key_is_unique(self.mydf, 'field1', blocksize=blocksize))
+
+        # NaN keys are not duplicates of each other
+        self.assertTrue(MultivaluedTable.key_is_unique(pd.DataFrame({'key': ['a', np.nan, np.nan]}), 'key'))
+
+
+class TestMultivaluedTableMelting(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['2', '1', '2', '2', '1', '3', '2'],
+                                  'field1': ['x', 'y', np.nan, 'z', 'y', np.nan, 'w'],
+                                  'field2': [1.5, 2.5, 1.5, np.nan, 3.5, 4.5, np.nan]})
+        self.widened = MultivaluedTable.widen_multivalues_into_additional_columns(self.mydf, 'key',
+                                                                                  ['field1', 'field2'])
+
+    def test_column_families(self):
+        columns = ['key', 'field_2', 'field', 'other_1', 'field_10', 'field_1', 'notes']
+
+        self.assertEqual(list(MultivaluedTable.widened_column_families(columns).items()),
+                         [('key', ['key']), ('field', ['field', 'field_1', 'field_2', 'field_10']),
+                          ('other_1', ['other_1']), ('notes', ['notes'])])
+
+    def test_melting_undoes_widening(self):
+        expected = pd.DataFrame({'key': ['2', '2', '2', '2', '1', '1', '1', '3'],
+                                 'field': pd.Categorical(['field1', 'field1', 'field1', 'field2', 'field1', 'field2',
+                                                          'field2', 'field2'], categories=['field1', 'field2']),
+                                 'value': ['x', 'z', 'w', 1.5, 'y', 2.5, 3.5, 4.5]})
+
+        for chunksize in [1, 2, 100]:
+            result = MultivaluedTable.melt_widened_columns(self.widened, chunksize=chunksize)
+            assert_frame_equal(result, expected)
+
+    def test_melting_one_field_from_a_key_column(self):
+        result = MultivaluedTable.melt_widened_columns(self.widened.reset_index(), keyfield='key', fields=['field2'])
+
+        self.assertEqual(result['value'].dtype, np.float64)
+        self.assertEqual(result['key'].tolist(), ['2', '1', '1', '3'])
+
+    def test_melting_to_outfile(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            outfile = os.path.join(tempdir, 'long.csv')
+            rows_written = MultivaluedTable.melt_widened_columns(self.widened, outfile=outfile, chunksize=2)
+
+            self.assertEqual(rows_written, 8)
+            self.assertEqual(pd.read_csv(outfile, dtype=str)['key'].tolist(), ['2', '2', '2', '2', '1', '1', '1', '3'])
+        finally:
+            shutil.rmtree(tempdir)
+
+    @unittest.skipIf(columnar_io.pyarrow is None, 'pyarrow is not installed')
+    def test_melting_mixed_types_to_columnar_outfiles(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            for filename in ['long.parquet', 'long.arrow']:
+                outfile = os.path.join(tempdir, filename)
+                MultivaluedTable.melt_widened_columns(self.widened, outfile=outfile, chunksize=2)
+
+                result = columnar_io.read_table(outfile)
+                self.assertEqual(result['value'].tolist(), ['x', 'z', 'w', '1.5', 'y', '2.5', '3.5', '4.5'])
+                self.assertEqual(result['field'].tolist(), ['field1'] * 3 + ['field2', 'field1'] + ['field2'] * 3)
+
+            # values of a single dtype keep it
+            outfile = os.path.join(tempdir, 'field2.parquet')
+            MultivaluedTable.melt_widened_columns(self.widened, fields=['field2'], outfile=outfile, chunksize=2)
+            self.assertEqual(columnar_io.read_table(outfile)['value'].tolist(), [1.5, 2.5, 3.5, 4.5])
+        finally:
+            shutil.rmtree(tempdir)
@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from pandas.util.testing import assert_series_equal
+
+#add parent directory into search path
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from utilities.phone_linkage import PhoneLinkageIndex, _roots, _union
+
+class TestPhoneLinkageIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        # c1 and c3 share a home phone, c3 and c4 a work phone; 18005550000 is a switchboard number
+        self.customers = pd.DataFrame({'home': pd.array([14165938570, 16042640954, 14165938570, np.nan, 18005550000,
+                                                         18005550000, 18005550000], dtype='Int64'),
+                                       'work': pd.array([np.nan, np.nan, 12125550100, 12125550100, np.nan, np.nan,
+                                                         16042640954], dtype='Int64')},
+                                      index=['c1', 'c2', 'c3', 'c4', 'c5', 'c6', 'c7'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_records_sharing_numbers_are_clustered(self):
+        index = PhoneLinkageIndex()
+        cluster_ids = index.add(self.customers, ['home', 'work'])
+
+        # without a bucket size limit, the switchboard number chains c5 and c6 to c2 through c7
+        assert_series_equal(cluster_ids, pd.Series(['c1', 'c2', 'c1', 'c1', 'c2', 'c2', 'c2'],
+                                                   index=self.customers.index))
+
+    def test_common_numbers_are_not_used_for_linking(self):
+        index = PhoneLinkageIndex(max_bucket_size=2)
+        cluster_ids = index.add(self.customers, ['home', 'work'])
+
+        self.assertEqual(cluster_ids.tolist(), ['c1', 'c2', 'c1', 'c1', 'c5', 'c6', 'c2'])
+        self.assertEqual(index.oversized_numbers().to_dict(), {18005550000: 3})
+
+    def test_incremental_batches_link_against_saved_index(self):
+        path = os.path.join(self.tempdir, 'customers.linkage')
+        index = PhoneLinkageIndex()
+        index.add(self.customers.iloc[:4], ['home', 'work'])
+        index.save(path)
+
+        index = PhoneLinkageIndex.load(path)
+        new_customers = pd.DataFrame({'id': ['n1', 'n2'], 'home': pd.array([12125550100, np.nan], dtype='Int64'),
+                                      'work': pd.array([16042640954, np.nan], dtype='Int64')})
+        cluster_ids = index.add(new_customers, ['home', 'work'], id_field='id')
+
+        # n1 links c1's cluster to c2's, which keeps the id of the earliest record
+        self.assertEqual(cluster_ids.tolist(), ['c1', 'n2'])
+        self.assertEqual(index.cluster_ids().tolist(), ['c1', 'c1', 'c1', 'c1', 'c1', 'n2'])
+        self.assertEqual(len(index), 6)
+
+    def test_load_rejects_other_pickles(self):
+        path = os.path.join(self.tempdir, 'other.pickle')
+        pd.Series([1]).to_pickle(path)
+
+        self.assertRaises(TypeError, PhoneLinkageIndex.load, path)
+
+    def test_numbers_becoming_oversized_keep_earlier_links(self):
+        index = PhoneLinkageIndex(max_bucket_size=2)
+        self.assertEqual(index.add(self.customers.iloc[4:6], ['home', 'work']).tolist(), ['c5', 'c5'])
+
+        # the switchboard number now exceeds the limit: it doesn't link c7, but c5 and c6 stay clustered
+        self.assertEqual(index.add(self.customers.iloc[6:], ['home', 'work']).tolist(), ['c7'])
+        self.assertEqual(index.cluster_ids().tolist(), ['c5', 'c5', 'c7'])
+        self.assertEqual(index.oversized_numbers().to_dict(), {18005550000: 3})
+
+    def test_union_of_a_chain(self):
+        # links given in an order that needs several hooking passes
+        parents = np.arange(6, dtype=np.int64)
+        _union(parents, np.array([4, 3, 2, 1]), np.array([5, 4, 3, 2]))
+
+        self.assertEqual(_roots(parents, np.arange(6)).tolist(), [0, 1, 1, 1, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
 import unittest
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from pandas.util.testing import assert_frame_equal, assert_series_equal
@@ -9,7 +13,11 @@ import sys
 script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
 sys.path.append(os.path.join(script_dir,os.pardir))
 
-from utilities.phone_number_utility import _regions_are_supported, clean_phone_numbers
+from phonenumbers import phonenumberutil
+from utilities import phone_number_utility
+from utilities.phone_number_utility import _regions_are_supported, clean_phone_numbers, PhoneParseCache, \
+    _partition_by_region, _region_validator, prefilter_phone_values, STATUS_CODE_NULL, PHONE_STATUS_CODES, \
+    PhoneResultStore
 
 class TestPhoneRegions(unittest.TestCase):
 
@@ -278,4 +286,300 @@ class TestPhoneNumberCleaning(unittest.TestCase):
                             region_field='regions_valid_but_missing_or_invalid_canada', use_orig_on_error=False)
 
         # new field should hold formatted + validated phones, orig phone field should not be changed
-        assert_series_equal(mydf['phones_by_country'], expected['phones_by_country'])
\ No newline at end of file
+        assert_series_equal(mydf['phones_by_country'], expected['phones_by_country'])
+
+class TestPhoneNumberCleaningBatchMode(unittest.TestCase):
+    """ batch mode should give exactly the same output as cleaning row by row """
+    def setUp(self):
+        self.mydf = pd.DataFrame({'key': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'],
+                                  'phones': ['(604) 264-0954', '+44 (0)871 781 3000', np.nan, 'BILL_TO',
+                                             '4165938570', '', '+34 915 21 12 01', 1],
+                                  'regions': ['CA', 'GB', np.nan, 'US', np.nan, 'CA', 'ES', 'US']}).set_index('key')
+
+    def assert_same_as_row_by_row(self, **kwargs):
+        batch_df = self.mydf.copy(deep=True)
+        rowwise_df = self.mydf.copy(deep=True)
+
+        clean_phone_numbers(batch_df, batch=True, **kwargs)
+        clean_phone_numbers(rowwise_df, batch=False, **kwargs)
+
+        assert_frame_equal(batch_df, rowwise_df)
+
+    def test_new_field_with_region_string(self):
+        self.assert_same_as_row_by_row(phonenum_field='phones', newField='correctedPhones', region_string='CA')
+
+    def test_in_place_with_region_field_and_fallback_use_orig_on_error(self):
+        self.assert_same_as_row_by_row(phonenum_field='phones', region_string='CA', region_field='regions',
+                                       use_orig_on_error=True)
+
+    def test_new_field_with_region_field_only(self):
+        self.assert_same_as_row_by_row(phonenum_field='phones', newField='correctedPhones', region_field='regions')
+
+    def test_all_invalid_keeps_new_field_numeric(self):
+        self.mydf['phones'] = ['BILL_TO'] * 8
+        self.assert_same_as_row_by_row(phonenum_field='phones', newField='correctedPhones', region_string='CA')
+
+
+class TestPhoneRegionPartitions(unittest.TestCase):
+    def test_values_are_partitioned_by_region(self):
+        partitions = _partition_by_region(np.array(['US', None, 'CA', 'US', None, 'US'], dtype=object))
+
+        self.assertEqual([(region, partition.tolist()) for region, partition in partitions],
+                         [(None, [1, 4]), ('US', [0, 3, 5]), ('CA', [2])])
+
+    def test_region_validator_matches_library(self):
+        self.assert_region_validator_matches_library()
+
+    def test_region_validator_without_private_helper_matches_library(self):
+        # library versions without the private helper use the public is_valid_number_for_region
+        number_type_helper = phone_number_utility._number_type_helper
+        phone_number_utility._number_type_helper = None
+        try:
+            self.assert_region_validator_matches_library()
+        finally:
+            phone_number_utility._number_type_helper = number_type_helper
+
+    def assert_region_validator_matches_library(self):
+        values = ['(604) 264-0954', '+44 (0)871 781 3000', '020 7946 0958', '+1 416 593 8570', 'BILL_TO', '',
+                  '+34 915 21 12 01', '1', '0612345678', '+33 1 23 45 67 89']
+
+        for region in ['US', 'CA', 'GB', 'FR', 'IM', None]:
+            for value in values:
+                try:
+                    phonenum = phonenumberutil.parse(value, region=region, _check_region=True)
+                    if phonenumberutil.is_valid_number_for_region(phonenum, region):
+                        e164 = phonenumberutil.format_number(phonenum, phonenumberutil.PhoneNumberFormat.E164)
+                        expected = ('valid', phonenum.national_number, int(e164[1:]))
+                    else:
+                        expected = ('invalid', None, None)
+                except Exception:
+                    expected = ('parse_error', None, None)
+
+                self.assertEqual(_region_validator(region).validate(value), expected)
+
+class TestPhonePrefilter(unittest.TestCase):
+    def setUp(self):
+        self.phones = ['N/A', 'none@example.com', '7', 1, '123456789012345678901234567890', '9' * 300,
+                       '+1 (416) 593-8570', '12', np.nan, '1-800-FLOWERS', '123-456-7890-123-456-7890 ext 12345',
+                       '1488 0011 880 0 ' + '1' * 17]
+
+    def test_reasons(self):
+        self.assertEqual(prefilter_phone_values(self.phones).tolist(),
+                         ['too_few_digits', 'too_few_digits', 'too_few_digits', 'too_few_digits', None, 'too_long',
+                          None, None, None, None, None, None])
+
+    def test_prefiltered_output_matches_row_by_row(self):
+        mydf = pd.DataFrame({'phones': self.phones})
+        # the last value has 29 digits, and parses in AU (whose international prefix can be 8 digits long)
+        for region in ['US', 'AU']:
+            for use_orig_on_error in [True, False]:
+                prefiltered_df = mydf.copy(deep=True)
+                rowwise_df = mydf.copy(deep=True)
+
+                clean_phone_numbers(prefiltered_df, phonenum_field='phones', newField='cleaned', region_string=region,
+                                    use_orig_on_error=use_orig_on_error, prefilter=True)
+                clean_phone_numbers(rowwise_df, phonenum_field='phones', newField='cleaned', region_string=region,
+                                    use_orig_on_error=use_orig_on_error, batch=False)
+
+                assert_frame_equal(prefiltered_df, rowwise_df)
+
+
+class TestPhoneOutputFormats(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'phones': ['(604) 264-0954', '02 1234 5678', np.nan, 'BILL_TO', '000-000-0000',
+                                             '+1 416 593 8570'],
+                                  'regions': ['CA', 'IT', np.nan, 'CA', 'CA', 'US']})
+
+    def test_e164(self):
+        clean_phone_numbers(self.mydf, phonenum_field='phones', newField='e164', region_field='regions',
+                            output_format='e164')
+
+        # the leading zero of Italian fixed lines is part of the E.164 number
+        assert_series_equal(self.mydf['e164'],
+                            pd.Series([16042640954, 390212345678, None, None, None, None], dtype='Int64', name='e164'))
+
+    def test_e164_in_place_matches_national_output(self):
+        national_df = self.mydf.copy(deep=True)
+        with ThreadPoolExecutor(2) as executor:
+            clean_phone_numbers(national_df, phonenum_field='phones', region_field='regions', n_jobs=2,
+                                executor=executor)
+            clean_phone_numbers(self.mydf, phonenum_field='phones', region_field='regions', output_format='e164',
+                                n_jobs=2, executor=executor)
+
+        self.assertEqual(self.mydf['phones'].dtype, 'Int64')
+        self.assertEqual(self.mydf['phones'].isnull().tolist(), national_df['phones'].isnull().tolist())
+
+    def test_components_and_status_codes(self):
+        clean_phone_numbers(self.mydf, phonenum_field='phones', newField='cleaned', region_field='regions',
+                            output_format='components', status_field='status', parse_cache=PhoneParseCache())
+
+        assert_series_equal(self.mydf['cleaned_country_code'],
+                            pd.Series([1, 39, None, None, None, None], dtype='Int64', name='cleaned_country_code'))
+        assert_series_equal(self.mydf['cleaned_national_number'],
+                            pd.Series(['6042640954', '0212345678', np.nan, np.nan, np.nan, np.nan], dtype=object,
+                                      name='cleaned_national_number'))
+        self.assertNotIn('cleaned', self.mydf.columns)
+        self.assertEqual(self.mydf['phones'].tolist()[:2], ['(604) 264-0954', '02 1234 5678'])
+
+        # the national number keeps the Italian leading zero, which E.164 has after the country code
+        self.assertEqual(self.mydf['cleaned_country_code'].astype(str).str.cat(self.mydf['cleaned_national_number'])
+                         .tolist()[:2], ['16042640954', '390212345678'])
+
+        self.assertEqual(self.mydf['status'].dtype, np.int8)
+        self.assertEqual(self.mydf['status'].tolist(),
+                         [PHONE_STATUS_CODES['valid'], PHONE_STATUS_CODES['valid'], STATUS_CODE_NULL,
+                          PHONE_STATUS_CODES['parse_error'], PHONE_STATUS_CODES['invalid'],
+                          PHONE_STATUS_CODES['invalid']])
+
+    def test_invalid_options_raise_error(self):
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          output_format='international')
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          output_format='e164', use_orig_on_error=True)
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          status_field='status', batch=False)
+
+
+class TestPhoneParseCache(unittest.TestCase):
+    def setUp(self):
+        self.mydf = pd.DataFrame({'phones': ['416-593-8570', ' 416-593-8570 ', '000-000-0000', '416-593-8570',
+                                             '000-000-0000', 'BILL_TO', np.nan, 'BILL_TO']})
+
+    def test_cached_output_matches_uncached(self):
+        cached_df = self.mydf.copy(deep=True)
+        uncached_df = self.mydf.copy(deep=True)
+
+        clean_phone_numbers(cached_df, phonenum_field='phones', newField='cleaned', region_string='CA',
+                            use_orig_on_error=True, parse_cache=PhoneParseCache())
+        clean_phone_numbers(uncached_df, phonenum_field='phones', newField='cleaned', region_string='CA',
+                            use_orig_on_error=True)
+
+        assert_frame_equal(cached_df, uncached_df)
+
+    def test_repeated_values_are_parsed_once(self):
+        cache = PhoneParseCache()
+        clean_phone_numbers(self.mydf, phonenum_field='phones', newField='cleaned', region_string='CA',
+                            parse_cache=cache)
+
+        # whitespace is normalized away, and NaNs never reach the cache
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 4)
+        self.assertEqual(stats['size'], 3)
+
+    def test_least_recently_used_result_is_evicted(self):
+        cache = PhoneParseCache(maxsize=2)
+        cache.validate('416-593-8570', 'CA')
+        cache.validate('000-000-0000', 'CA')
+        cache.validate('416-593-8570', 'CA')
+        cache.validate('BILL_TO', 'CA')
+
+        self.assertEqual(len(cache), 2)
+        cache.validate('416-593-8570', 'CA')
+        self.assertEqual(cache.stats()['hits'], 2)
+        cache.validate('000-000-0000', 'CA')
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    def test_cache_requires_batch_mode(self):
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          batch=False, parse_cache=PhoneParseCache())
+
+
+class TestPhoneResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'results.sqlite')
+        self.mydf = pd.DataFrame({'phones': ['(604) 264-0954', ' 416-593-8570', '000-000-0000', 'BILL_TO', np.nan,
+                                             '+44 (0)871 781 3000', '416-593-8570'],
+                                  'regions': ['CA', 'CA', 'CA', 'US', np.nan, np.nan, 'US']})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_output_matches_cleaning_without_store(self):
+        with ThreadPoolExecutor(2) as executor:
+            for kwargs in [dict(use_orig_on_error=True), dict(output_format='e164', n_jobs=2, executor=executor)]:
+                for run in range(2):
+                    stored_df = self.mydf.copy(deep=True)
+                    expected_df = self.mydf.copy(deep=True)
+
+                    with PhoneResultStore(self.path) as store:
+                        clean_phone_numbers(stored_df, phonenum_field='phones', newField='cleaned',
+                                            region_string='GB', region_field='regions', result_store=store, **kwargs)
+                    clean_phone_numbers(expected_df, phonenum_field='phones', newField='cleaned', region_string='GB',
+                                        region_field='regions', **kwargs)
+
+                    assert_frame_equal(stored_df, expected_df)
+
+    def test_stored_values_are_not_parsed_again(self):
+        with PhoneResultStore(self.path) as store:
+            clean_phone_numbers(self.mydf.copy(deep=True), phonenum_field='phones', region_field='regions',
+                                result_store=store)
+            # whitespace is normalized away, and the same value in another region is a different result
+            self.assertEqual(len(store), 6)
+
+        cache = PhoneParseCache()
+        with PhoneResultStore(self.path) as store:
+            clean_phone_numbers(self.mydf, phonenum_field='phones', region_field='regions', result_store=store,
+                                parse_cache=cache)
+        self.assertEqual(cache.stats()['misses'], 0)
+
+    def test_results_of_another_library_version_are_dropped(self):
+        with PhoneResultStore(self.path) as store:
+            clean_phone_numbers(self.mydf, phonenum_field='phones', region_field='regions', result_store=store)
+            self.assertGreater(len(store), 0)
+
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute("UPDATE store_metadata SET value = '0.0.1' WHERE key = 'phonenumbers_version'")
+        connection.close()
+
+        with PhoneResultStore(self.path) as store:
+            self.assertEqual(len(store), 0)
+
+    def test_store_requires_batch_mode(self):
+        with PhoneResultStore(self.path) as store:
+            self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                              batch=False, result_store=store)
+
+
+class TestPhoneNumberCleaningInParallel(unittest.TestCase):
+    """ cleaning in chunks across workers should give exactly the same output as the serial path """
+    def setUp(self):
+        phones = ['(604) 264-0954', '+44 (0)871 781 3000', np.nan, 'BILL_TO', '4165938570', '', '+34 915 21 12 01', 1]
+        regions = ['CA', 'GB', np.nan, 'US', np.nan, 'CA', 'ES', 'US']
+        self.mydf = pd.DataFrame({'phones': phones * 5, 'regions': regions * 5},
+                                 index=['key' + str(i) for i in range(40)])
+
+    def assert_same_as_serial(self, **kwargs):
+        parallel_df = self.mydf.copy(deep=True)
+        serial_df = self.mydf.copy(deep=True)
+
+        clean_phone_numbers(parallel_df, **kwargs)
+        for parallel_only_arg in ['n_jobs', 'executor', 'parse_cache']:
+            kwargs.pop(parallel_only_arg, None)
+        clean_phone_numbers(serial_df, **kwargs)
+
+        assert_frame_equal(parallel_df, serial_df)
+
+    def test_process_pool_use_orig_on_error(self):
+        self.assert_same_as_serial(phonenum_field='phones', newField='cleaned', region_string='CA',
+                                   region_field='regions', use_orig_on_error=True, n_jobs=2)
+
+    def test_process_pool_in_place(self):
+        self.assert_same_as_serial(phonenum_field='phones', region_field='regions', n_jobs=2)
+
+    def test_custom_executor_with_cache(self):
+        cache = PhoneParseCache()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assert_same_as_serial(phonenum_field='phones', newField='cleaned', region_string='CA',
+                                       region_field='regions', n_jobs=3, executor=executor, parse_cache=cache)
+
+        # every non-null value is looked up once, in whichever chunk's cache it lands
+        self.assertEqual(cache.stats()['hits'] + cache.stats()['misses'], 35)
+
+    def test_invalid_n_jobs_raises_error(self):
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          n_jobs=0)
+        self.assertRaises(ValueError, clean_phone_numbers, self.mydf, phonenum_field='phones', region_string='CA',
+                          n_jobs=2, batch=False)
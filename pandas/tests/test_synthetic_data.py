@@ -0,0 +1,52 @@
+import unittest
+from pandas.util.testing import assert_frame_equal
+
+#add parent directory into search path
+import os
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__)) #current directory of the python script
+sys.path.append(os.path.join(script_dir,os.pardir))
+
+from benchmarks.synthetic_data import consumer_complaints, traffic_violations
+from benchmarks.run_benchmarks import run_benchmarks, BENCHMARKS
+from utilities.multivalued_table import MultivaluedTable
+
+class TestSyntheticData(unittest.TestCase):
+    def test_same_seed_gives_same_data(self):
+        assert_frame_equal(consumer_complaints(500, n_keys=100, fanout=3, seed=7),
+                           consumer_complaints(500, n_keys=100, fanout=3, seed=7))
+        assert_frame_equal(traffic_violations(500, n_keys=100, fanout=3, seed=7),
+                           traffic_violations(500, n_keys=100, fanout=3, seed=7))
+
+    def test_key_cardinality_and_fanout(self):
+        mydf = traffic_violations(2000, n_keys=400, fanout=3, null_ratio=0)
+
+        self.assertEqual(len(mydf), 2000)
+        self.assertEqual(mydf['Stop ID'].nunique(), 400)
+
+        stats = MultivaluedTable.profile_uniques(mydf, 'Stop ID', ['Charge', 'Make'])
+        self.assertEqual(stats['Charge']['max_uniques'], 3)
+        self.assertEqual(stats['Make']['max_uniques'], 1)
+
+    def test_null_ratio(self):
+        mydf = consumer_complaints(5000, null_ratio=0.2)
+
+        self.assertEqual(mydf['Complaint ID'].isnull().sum(), 0)
+        self.assertAlmostEqual(mydf['Company'].isnull().mean(), 0.2, delta=0.03)
+
+    def test_phone_validity(self):
+        all_invalid = consumer_complaints(200, null_ratio=0, valid_phone_ratio=0)
+        all_valid = consumer_complaints(200, null_ratio=0, valid_phone_ratio=1)
+
+        self.assertFalse(all_invalid['Phone'].str.contains(r'\d{3}-\d{4}$').all())
+        self.assertTrue(all_valid['Phone'].str.contains(r'\d{3}-?\d{4}$').all())
+
+class TestRunBenchmarks(unittest.TestCase):
+    def test_every_benchmark_produces_a_record(self):
+        records = run_benchmarks(sizes=[300])
+
+        self.assertEqual(sorted(record['benchmark'] for record in records), sorted(BENCHMARKS))
+        for record in records:
+            self.assertEqual(record['rows'], 300)
+            self.assertGreater(record['peak_memory_bytes'], 0)
+            self.assertIsNotNone(record['result_fingerprint'])
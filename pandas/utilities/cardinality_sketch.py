@@ -0,0 +1,173 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+""" HyperLogLog sketches that approximate the number of distinct values per key, for profiling fields whose
+cardinality is too high to count exactly (exact counting keeps every distinct (key, value) pair in memory).
+Each key gets its own sketch of 2**precision registers; the relative standard error of a count is about
+1.04 / sqrt(2**precision), whatever the number of distinct values. """
+
+
+DEFAULT_ERROR_RATE = 0.05
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# number of hash bits used to compute a register's rank, after the top `precision` bits pick the register
+_RANK_BITS = 32
+
+def precision_for_error_rate(error_rate):
+    """
+    :param error_rate: target relative standard error of a count, e.g. 0.05 for 5%
+    :return: smallest precision (log2 of registers per key) whose standard error is at most error_rate, within
+    MIN_PRECISION and MAX_PRECISION
+    """
+    if not 0 < error_rate < 1:
+        raise ValueError('error_rate must be between 0 and 1')
+
+    registers = (1.04 / error_rate) ** 2
+    return int(min(max(math.ceil(math.log(registers, 2)), MIN_PRECISION), MAX_PRECISION))
+
+
+class KeyedHyperLogLog(object):
+    """
+    One HyperLogLog sketch per key. Registers are stored sparsely, as a sorted array of (key, register) slots and the
+    rank held in each, so keys with few values cost a few bytes rather than 2**precision. Memory is bounded by
+    keys * 2**precision slots however many distinct values there are.
+    Sketches with the same precision can be merged, e.g. to combine sketches built from different files.
+    """
+    def __init__(self, error_rate=DEFAULT_ERROR_RATE, precision=None):
+        """
+        :param error_rate: target relative standard error of the per-key counts. Ignored if precision is given
+        :param precision: number of index bits, between MIN_PRECISION and MAX_PRECISION (2**precision registers per key)
+        """
+        if precision is None:
+            precision = precision_for_error_rate(error_rate)
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError('precision must be between ' + str(MIN_PRECISION) + ' and ' + str(MAX_PRECISION))
+
+        self.precision = int(precision)
+        self.registers_per_key = 1 << self.precision
+        self._keys = pd.Index([], dtype=object)
+        self._slots = np.array([], dtype=np.int64)     # key position * registers_per_key + register, sorted
+        self._ranks = np.array([], dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """ relative standard error of each per-key count """
+        return 1.04 / math.sqrt(self.registers_per_key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, keys, values):
+        """
+        Adds (key, value) pairs to the sketches. NaN values register their key (which counts 0 values until a value is
+        seen) without being counted.
+        :param keys: array-like of keys, without NaNs
+        :param values: array-like of values, same length as keys
+        :return: self
+        """
+        keys = np.asarray(keys, dtype=object)
+        values = pd.Series(np.asarray(values, dtype=object))
+        key_positions = self._key_positions(keys)
+
+        not_null = values.notnull().values
+        # values are hashed as strings (non-string values by their str()), consistently across chunks and dtypes
+        hashes = pd.util.hash_array(values.values[not_null])
+
+        registers = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        ranks = _rank(hashes & np.uint64((1 << _RANK_BITS) - 1))
+        slots = key_positions[not_null] * self.registers_per_key + registers
+
+        self._add_slots(slots, ranks)
+        return self
+
+    def merge(self, other):
+        """
+        Merges another sketch with the same precision into this one
+        :return: self
+        """
+        if other.precision != self.precision:
+            raise ValueError('can only merge sketches of the same precision')
+
+        other_positions = self._key_positions(other._keys.values)
+        key_positions, registers = np.divmod(other._slots, other.registers_per_key)
+        self._add_slots(other_positions[key_positions] * self.registers_per_key + registers, other._ranks)
+        return self
+
+    def estimate(self):
+        """
+        :return: series of the estimated number of distinct non-NaN values per key, rounded to integers and sorted by
+        key
+        """
+        n_keys = len(self._keys)
+        m = float(self.registers_per_key)
+        key_positions = self._slots // self.registers_per_key
+
+        nonzero = np.bincount(key_positions, minlength=n_keys)
+        zeros = m - nonzero
+        # sum of 2**-rank over all registers, where registers that were never set have rank 0
+        harmonic_sum = np.bincount(key_positions, weights=np.ldexp(1.0, -self._ranks.astype(np.int64)),
+                                   minlength=n_keys) + zeros
+        raw_estimate = _alpha(self.registers_per_key) * m * m / harmonic_sum
+
+        # linear counting is more accurate for small counts (which is most keys, in practice)
+        with np.errstate(divide='ignore'):
+            linear_estimate = m * np.log(m / zeros)
+        estimates = np.where((raw_estimate <= 2.5 * m) & (zeros > 0), linear_estimate, raw_estimate)
+
+        counts = pd.Series(np.round(estimates).astype(np.int64), index=self._keys)
+        try:
+            return counts.sort_index()
+        except TypeError:   # keys of mixed types can't be sorted
+            return counts
+
+    def _key_positions(self, keys):
+        """ :return: position of every key in self._keys, appending keys that haven't been seen yet """
+        positions = self._keys.get_indexer(keys)
+        unseen = positions == -1
+        if unseen.any():
+            self._keys = self._keys.append(pd.Index(pd.unique(keys[unseen]), dtype=object))
+            positions[unseen] = self._keys.get_indexer(keys[unseen])
+        return positions.astype(np.int64)
+
+    def _add_slots(self, slots, ranks):
+        """
+        keeps the highest rank of every slot. Only the new slots are sorted: they are then merged into the stored slots,
+        which are already sorted, so adding a block costs time linear (rather than n log n) in the slots stored
+        """
+        slots, ranks = _highest_rank_by_slot(slots, ranks)
+
+        positions = np.searchsorted(self._slots, slots)
+        stored = positions < len(self._slots)
+        stored[stored] = self._slots[positions[stored]] == slots[stored]
+        self._ranks[positions[stored]] = np.maximum(self._ranks[positions[stored]], ranks[stored])
+
+        new = ~stored
+        self._slots = np.insert(self._slots, positions[new], slots[new])
+        self._ranks = np.insert(self._ranks, positions[new], ranks[new])
+
+def _highest_rank_by_slot(slots, ranks):
+    """ :return: (sorted array of the distinct slots, array of the highest rank of each) """
+    # sort by slot then rank, so the last entry of each slot holds its maximum
+    order = np.lexsort((ranks, slots))
+    slots, ranks = slots[order], ranks[order]
+    last_of_slot = np.append(slots[1:] != slots[:-1], True) if len(slots) else np.array([], dtype=bool)
+    return slots[last_of_slot], ranks[last_of_slot]
+
+def _rank(bits):
+    """ :return: position of the leftmost 1 bit within the _RANK_BITS low bits (_RANK_BITS + 1 if all are 0) """
+    # values below 2**32 are exact as floats, and frexp's exponent is their bit length (0 for 0)
+    bit_lengths = np.frexp(bits.astype(np.float64))[1]
+    return (_RANK_BITS + 1 - bit_lengths).astype(np.uint8)
+
+def _alpha(registers):
+    """ bias correction constant of the HyperLogLog estimate """
+    if registers == 16:
+        return 0.673
+    if registers == 32:
+        return 0.697
+    if registers == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / registers)
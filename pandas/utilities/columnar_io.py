@@ -0,0 +1,288 @@
+import os
+
+import pandas as pd
+
+from utilities import instrumentation
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:     # parquet and arrow files need pyarrow; csv works without it
+    pyarrow = None
+
+""" Reads and writes inputs, cleaned outputs and widened tables as csv, Parquet or Arrow IPC (feather v2) files, picking
+the format from the file extension. Parquet and Arrow keep dtypes (including categoricals) and the index, so there is
+no text to parse between pipeline stages, and both support column projection: only the columns asked for are read.
+
+Example:
+    widened = MultivaluedTable.widen_multivalues_into_additional_columns(df, 'Stop ID', ['Charge', 'Description'])
+    write_table(widened, 'widened.parquet')
+    charges = read_table('widened.parquet', columns=['Charge', 'Charge_1'])
+"""
+
+
+CSV = 'csv'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+
+# file extension -> format. Any other extension is read and written as csv
+FORMATS_BY_EXTENSION = {'.parquet': PARQUET, '.pq': PARQUET,
+                        '.arrow': ARROW, '.feather': ARROW, '.ipc': ARROW}
+
+# rows of leading chunks a ChunkWriter holds back while some of their columns are all null, waiting for a chunk that
+# gives those columns a type
+MAX_HELD_ROWS = 1000000
+
+def format_for_path(path, file_format=None):
+    """
+    :param file_format: CSV, PARQUET or ARROW to override the extension
+    :return: CSV, PARQUET or ARROW, from file_format or the file extension
+    """
+    if file_format is not None:
+        if file_format not in (CSV, PARQUET, ARROW):
+            raise ValueError('unknown file format: ' + str(file_format))
+        return file_format
+
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(str(path))[1].lower(), CSV)
+
+@instrumentation.instrumented()
+def read_table(path, columns=None, file_format=None, **read_kwargs):
+    """
+    Reads a whole file into a dataframe.
+    :param columns: optional list of the columns to read (the index of a Parquet/Arrow file is always restored)
+    :param file_format: CSV, PARQUET or ARROW. Defaults to the format matching the file extension
+    :param read_kwargs: keyword arguments passed on to pandas.read_csv, pyarrow.parquet.read_table or
+    pyarrow.feather.read_table
+    :return: dataframe
+    """
+    file_format = format_for_path(path, file_format)
+
+    if file_format == CSV:
+        return pd.read_csv(path, usecols=columns, **read_kwargs)
+
+    _require_pyarrow()
+    if file_format == PARQUET:
+        schema = pyarrow.parquet.read_schema(path)
+        read_table_from_file = pyarrow.parquet.read_table
+    else:
+        with pyarrow.memory_map(path) as source:
+            schema = pyarrow.ipc.open_file(source).schema
+        read_table_from_file = pyarrow.feather.read_table
+
+    if columns is not None:
+        columns = list(columns) + [column for column in _index_columns(schema) if column not in columns]
+    return read_table_from_file(path, columns=columns, **read_kwargs).to_pandas()
+
+@instrumentation.instrumented()
+def write_table(dataframe, path, file_format=None, index=None, **write_kwargs):
+    """
+    Writes a dataframe, overwriting any existing file.
+    :param file_format: CSV, PARQUET or ARROW. Defaults to the format matching the file extension
+    :param index: True to write the index, False to leave it out. By default it is written unless it is a plain
+    0..n-1 range (e.g., widened tables keep their key field index)
+    :param write_kwargs: keyword arguments passed on to DataFrame.to_csv, pyarrow.parquet.write_table or
+    pyarrow.feather.write_feather (e.g., compression). Arrow files are written uncompressed unless a compression is
+    given, so they can be memory-mapped (see mapped_columns.MappedColumns)
+    """
+    file_format = format_for_path(path, file_format)
+
+    if file_format == CSV:
+        if index is None:
+            index = not _has_default_index(dataframe)
+        dataframe.to_csv(path, index=index, **write_kwargs)
+        return
+
+    table = _to_arrow_table(dataframe, index)
+    if file_format == PARQUET:
+        pyarrow.parquet.write_table(table, path, **write_kwargs)
+    else:
+        write_kwargs.setdefault('compression', 'uncompressed')
+        pyarrow.feather.write_feather(table, path, **write_kwargs)
+
+def iter_chunks(path, chunksize, columns=None, file_format=None, **read_kwargs):
+    """
+    Reads a file one chunk of up to chunksize rows at a time. Chunks keep a running row index (0..n-1 across the file),
+    as pandas.read_csv does.
+    :param columns: optional list of the columns to read
+    :return: iterator of dataframes
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+    file_format = format_for_path(path, file_format)
+
+    if file_format == CSV:
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns, **read_kwargs):
+            yield chunk
+        return
+
+    _require_pyarrow()
+    if file_format == PARQUET:
+        batches = pyarrow.parquet.ParquetFile(path, **read_kwargs).iter_batches(batch_size=chunksize, columns=columns)
+        rows_read = 0
+        for batch in batches:
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(rows_read, rows_read + len(chunk))
+            rows_read += len(chunk)
+            yield chunk
+        return
+
+    # arrow files are memory mapped and sliced, so only the rows of the current chunk are converted to pandas
+    with pyarrow.memory_map(path) as source:
+        table = pyarrow.ipc.open_file(source, **read_kwargs).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        for start in range(0, table.num_rows, chunksize):
+            chunk = table.slice(start, chunksize).to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            yield chunk
+
+class ChunkWriter(object):
+    """
+    Appends chunks to a csv, Parquet or Arrow file, overwriting any existing file (Parquet/Arrow files are only
+    created once the first chunks are written, as they give their schema). Parquet/Arrow chunks must all have
+    the columns of the first chunk, with types that convert to its types. A column that is all null in the first
+    chunk (e.g., a newField no row of the chunk has a value for) takes its type from the first chunk that has a value
+    in it: leading chunks are held back until then, up to MAX_HELD_ROWS rows (columns still without a value are then
+    typed as in the first chunk, or as strings if that has no type). Pass schema to set types up front instead.
+    Categorical chunks may have different categories. An Arrow IPC file can only hold one dictionary per column, so
+    Arrow files store categorical columns as their values (Parquet files keep them categorical).
+
+    Example:
+        with ChunkWriter('cleaned.parquet') as writer:
+            for chunk in iter_chunks('input.csv', 100000, dtype=str):
+                writer.write(chunk)
+    """
+    def __init__(self, path, file_format=None, index=False, header=True, schema=None, **write_kwargs):
+        """
+        :param file_format: CSV, PARQUET or ARROW. Defaults to the format matching the file extension
+        :param index: whether to write the index of the chunks
+        :param header: csv only: as DataFrame.to_csv's header (False to leave the column names out, or a list of
+        aliases), applied to the first chunk only
+        :param schema: Parquet/Arrow only: optional pyarrow schema, or dict of column name -> pyarrow type, whose types
+        override the ones taken from the chunks (e.g., {'cleaned_phone': pyarrow.string()})
+        :param write_kwargs: keyword arguments passed on to DataFrame.to_csv, pyarrow.parquet.ParquetWriter or
+        pyarrow.ipc.new_file (e.g., compression)
+        """
+        self.path = path
+        self.file_format = format_for_path(path, file_format)
+        self.index = index
+        self.header = header
+        self.write_kwargs = write_kwargs
+        self.rows_written = 0
+        self.chunks_written = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+        # column -> pyarrow type given by schema
+        self._types = dict(zip(schema.names, schema.types)) if hasattr(schema, 'names') else dict(schema or {})
+        self._held = []         # leading chunks not written yet, while some of their columns are all null
+        self._untyped = None    # columns all null in every held chunk, and without a type in schema
+
+        if self.file_format == CSV:
+            self._file = open(path, 'w', newline='')
+        else:
+            _require_pyarrow()
+
+    def write(self, chunk):
+        """ appends a chunk """
+        if self.file_format == CSV:
+            # only the first chunk writes the header
+            chunk.to_csv(self._file, header=self.header if self.chunks_written == 0 else False, index=self.index,
+                         **self.write_kwargs)
+        elif self._writer is not None:
+            self._write_table(chunk)
+        else:
+            # held chunks are copied, so callers can go on modifying theirs
+            self._held.append(chunk.copy())
+            if self._untyped is None:
+                self._untyped = set(chunk.columns[chunk.isnull().all().values]).difference(self._types)
+            else:
+                self._untyped = set(column for column in self._untyped if chunk[column].isnull().all())
+
+            if not self._untyped or sum(len(held) for held in self._held) >= MAX_HELD_ROWS:
+                self._write_held()
+
+        self.rows_written += len(chunk)
+        self.chunks_written += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._held:
+            self._write_held()
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _write_held(self):
+        """ opens the file with the schema of the held chunks, and writes them """
+        first_chunk = self._held[0]
+        table = _to_arrow_table(first_chunk, self.index)
+        types = dict()
+        for column in first_chunk.columns[first_chunk.isnull().all().values]:
+            # the type of a column that is all null in the first chunk comes from the first chunk with a value in it
+            typed_chunks = [held for held in self._held[1:] if held[column].notnull().any()]
+            if typed_chunks:
+                types[column] = _to_arrow_table(typed_chunks[0][[column]], False).schema.field(column).type
+            elif pyarrow.types.is_null(table.schema.field(column).type):
+                types[column] = pyarrow.string()
+        types.update(self._types)
+
+        if types:
+            schema = pyarrow.schema([field.with_type(types.get(field.name, field.type)) for field in table.schema],
+                                    metadata=table.schema.metadata)
+            table = pyarrow.Table.from_pandas(first_chunk, schema=schema, preserve_index=self.index)
+        if self.file_format == ARROW:
+            table = _decode_dictionaries(table)
+        self._schema = table.schema
+        self._writer = self._open_writer(table.schema)
+        self._writer.write_table(table)
+
+        held, self._held = self._held[1:], []
+        for chunk in held:
+            self._write_table(chunk)
+
+    def _write_table(self, chunk):
+        self._writer.write_table(pyarrow.Table.from_pandas(chunk, schema=self._schema, preserve_index=self.index))
+
+    def _open_writer(self, schema):
+        if self.file_format == PARQUET:
+            return pyarrow.parquet.ParquetWriter(self.path, schema, **self.write_kwargs)
+        return pyarrow.ipc.new_file(self.path, schema, **self.write_kwargs)
+
+def _to_arrow_table(dataframe, index):
+    """ :param index: True/False to write the index or not, None to write it unless it is a plain 0..n-1 range """
+    _require_pyarrow()
+    if index is None:
+        index = not _has_default_index(dataframe)
+    return pyarrow.Table.from_pandas(dataframe, preserve_index=index)
+
+def _decode_dictionaries(table):
+    """ :return: table with its dictionary (categorical) columns replaced by columns of their values """
+    columns = [column.cast(column.type.value_type) if pyarrow.types.is_dictionary(column.type) else column
+               for column in table.columns]
+    schema = pyarrow.schema([field.with_type(column.type) for field, column in zip(table.schema, columns)],
+                            metadata=table.schema.metadata)
+    return pyarrow.Table.from_arrays(columns, schema=schema)
+
+def _index_columns(schema):
+    """ :return: names of the columns that hold the index of a dataframe written to schema """
+    pandas_metadata = schema.pandas_metadata or {}
+    # a plain range index is stored as metadata (a dict) rather than as a column
+    return [column for column in pandas_metadata.get('index_columns', []) if isinstance(column, str)]
+
+def _has_default_index(dataframe):
+    return isinstance(dataframe.index, pd.RangeIndex) and dataframe.index.start == 0 and dataframe.index.step == 1 \
+        and dataframe.index.name is None
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError('reading and writing parquet or arrow files requires pyarrow')
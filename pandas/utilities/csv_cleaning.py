@@ -1,9 +1,21 @@
+import re
 import numpy as np
+import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_string_dtype
 
+from utilities import instrumentation
+
+# matches values that contain no alphanumeric characters (including empty strings)
+NON_ALPHANUM_PATTERN = re.compile(r'^[^a-zA-Z0-9]*$')
+
+@instrumentation.instrumented()
 def nullify_non_alphanum(dataframe, fields=None):
     """
     Nullify in place any values that have no alphanumeric characters (note: does not take into account latin chars.
     Nullified values are converted to NaNs.
+    The precompiled pattern is run once per distinct value of each text column rather than once per row (on the
+    categories of categorical columns, which stay categorical). Columns that can't hold strings (numeric, boolean,
+    datetime) are skipped without being scanned.
 
     :param dataframe:
     :param fields: optional list of fieldnames to be nullified. If not specified, runs across entire dataset.
@@ -11,42 +23,220 @@ def nullify_non_alphanum(dataframe, fields=None):
     """
 
     if fields is None:
-        dataframe.replace({r'^[^a-zA-Z0-9]*$': np.nan}, regex=True, inplace=True)
-    else:
-        # TODO: there's probably a more efficient way to do this than looping through each field
-        for field in fields:
-            dataframe[field].replace({r'^[^a-zA-Z0-9]*$': np.nan}, regex=True, inplace=True)
+        fields = dataframe.columns
+
+    text_fields = [field for field in fields if _is_text(dataframe[field])]
+
+    for field in text_fields:
+        nullified = _nullify_matching_values(dataframe, field, _non_alphanum_values)
+        instrumentation.count('values_nullified', nullified)
+
+def _non_alphanum_values(values):
+    """ :return: boolean array flagging the string values that have no alphanumeric characters """
+    return np.fromiter((isinstance(value, str) and NON_ALPHANUM_PATTERN.search(value) is not None for value in values),
+                       dtype=bool, count=len(values))
 
+@instrumentation.instrumented()
 def nullify_fields_if_field_matches_pattern(dataframe, field_containing_pattern, pattern, fields_to_nullify, case_sensitive=False):
     """
     Can be used to nullify one or more fields if another field matches a certain pattern.
     Can also be used to nullify values in one field if values in that field match a certain pattern (i.e., blacklisting values)
-    Note: Keys must be unique by row; otherwise will not work correctly
+    Rows are selected with a positional boolean mask, so keys do not need to be unique by row.
     :param dataframe:
     :param field_containing_pattern:
     :param fields_to_nullify: list of fieldnames specifying the fields to nullify. Can nullify the same field (i.e., blacklist)
     :param case_sensitive: whether matching is case sensitive or not. Default is False (i.e., not case sensitive)
     :return: None (nullifies the dataframe in place)
     """
-    rows_that_contain = dataframe[field_containing_pattern].str.contains(pattern, case=case_sensitive)
+    # the pattern is searched once per distinct value. Non-string values (e.g., NaNs, numbers in an object column)
+    # never match
+    def contains_pattern(values):
+        return pd.Series(values, dtype=object).str.contains(pattern, case=case_sensitive, na=False).values.astype(bool)
+
+    rows_that_contain = _matching_rows(dataframe[field_containing_pattern], contains_pattern)[0]
+
+    if rows_that_contain.any():
+        dataframe.loc[rows_that_contain, fields_to_nullify] = np.nan
+
+    if instrumentation.is_enabled():
+        instrumentation.count('rows_nullified', int(rows_that_contain.sum()))
+
+
+class NullificationRules(object):
+    """
+    A set of nullification rules, each being a field plus either literal values to blacklist or a regex pattern.
+    Rules are compiled once per field: literal values go into a hash set for membership tests, and all patterns for a
+    field are combined into a single alternation regex. Applying the rules then takes one pass per field, no matter
+    how many rules there are, and the same compiled rules can be applied to many dataframes (or chunks).
+    Rules are evaluated once per distinct value of a field (once per category for categorical fields, which stay
+    categorical: matching categories are removed).
+    """
+    def __init__(self, case_sensitive=False):
+        """
+        :param case_sensitive: whether matching is case sensitive or not. Default is False (i.e., not case sensitive)
+        """
+        self.case_sensitive = case_sensitive
+        self._blacklists = dict()   # field -> set of literal values
+        self._patterns = dict()     # field -> list of regex patterns
+        self._compiled = None
+
+    def add_blacklist(self, field, values):
+        """
+        :param field: fieldname the rule applies to
+        :param values: iterable of literal values to be nullified wherever they appear in field
+        :return: self, so rules can be chained
+        """
+        self._blacklists.setdefault(field, set()).update(values)
+        self._compiled = None
+        return self
+
+    def add_pattern(self, field, pattern):
+        """
+        :param field: fieldname the rule applies to
+        :param pattern: regex pattern. String values containing a match are nullified (anchor the pattern with ^...$
+        to only match whole values). Patterns are combined with others for the same field, so they must not rely on
+        numbered backreferences. Patterns that can't be combined (e.g., with inline global flags like (?i), or reusing
+        a group name) still work, but the field's patterns are then searched one by one.
+        :return: self, so rules can be chained
+        """
+        self._patterns.setdefault(field, []).append(pattern)
+        self._compiled = None
+        return self
+
+    def compile(self):
+        """
+        Compiles the rules into {field: (frozenset of literal values, list of compiled regexes)}: the list holds the
+        field's combined regex, or one regex per pattern if they can't be combined, and is empty without patterns.
+        Called automatically by apply if rules changed since the last compile.
+        """
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        compiled = dict()
+
+        for field in set(self._blacklists).union(self._patterns):
+            literals = self._blacklists.get(field, set())
+            if not self.case_sensitive:
+                literals = set(value.lower() if isinstance(value, str) else value for value in literals)
+
+            patterns = self._patterns.get(field, [])
+            try:
+                regexes = [re.compile('|'.join('(?:' + pattern + ')' for pattern in patterns), flags)] \
+                    if patterns else []
+            except re.error:
+                # patterns that are valid alone can fail to combine, so they are searched one by one instead
+                regexes = [re.compile(pattern, flags) for pattern in patterns]
+
+            compiled[field] = (frozenset(literals), regexes)
+
+        self._compiled = compiled
+        return compiled
+
+    @instrumentation.instrumented('NullificationRules.apply')
+    def apply(self, dataframe):
+        """
+        Nullifies (as NaN) in place every value matching any rule for its field.
+        :return: dict of {fieldname: number of values nullified}
+        """
+        if self._compiled is None:
+            self.compile()
+
+        nullified_counts = dict()
+        for field, (literals, regexes) in self._compiled.items():
+            match_values = self._value_matcher(literals, regexes)
+            nullified_counts[field] = _nullify_matching_values(dataframe, field, match_values)
+
+            instrumentation.count('values_nullified', nullified_counts[field])
+
+        return nullified_counts
+
+    def _value_matcher(self, literals, regexes):
+        """ :return: function flagging the values of an array that match a literal or any of the regexes """
+        def match_values(values):
+            matches = np.zeros(len(values), dtype=bool)
+
+            if literals:
+                matches |= pd.Series(values, dtype=object).isin(literals).values
+                if not self.case_sensitive:
+                    matches |= np.fromiter((isinstance(value, str) and value.lower() in literals for value in values),
+                                           dtype=bool, count=len(values))
+
+            for regex in regexes:
+                matches |= np.fromiter((isinstance(value, str) and regex.search(value) is not None
+                                        for value in values), dtype=bool, count=len(values))
+
+            return matches
+
+        return match_values
+
+def _is_text(column):
+    """ :return: whether column can hold strings, including categoricals with string categories """
+    if is_categorical_dtype(column.dtype):
+        return is_string_dtype(column.cat.categories.dtype)
+    return is_string_dtype(column.dtype)
+
+def _matching_rows(column, match_values):
+    """
+    Runs match_values once per distinct value of column instead of once per row: on the categories of a categorical
+    column, or on the uniques of any other column (found with a single factorize).
+    :param match_values: function that takes a numpy object array of distinct values and returns a boolean array
+    :return: (boolean numpy array flagging the matching rows, boolean array flagging the matching distinct values)
+    """
+    if is_categorical_dtype(column.dtype):
+        codes, distinct_values = column.cat.codes.values, column.cat.categories
+    else:
+        codes, distinct_values = pd.factorize(column)
+
+    distinct_matches = np.asarray(match_values(np.asarray(distinct_values, dtype=object)), dtype=bool)
+
+    # NaNs have code -1, which picks up the trailing False
+    return np.append(distinct_matches, False)[codes], distinct_matches
+
+def _nullify_matching_values(dataframe, field, match_values):
+    """
+    Nullifies (as NaN) in place the values of field flagged by match_values (see _matching_rows). Categorical fields
+    stay categorical, with the matching categories removed.
+    :return: number of values nullified
+    """
+    column = dataframe[field]
+    rows, distinct_matches = _matching_rows(column, match_values)
 
-    if not rows_that_contain.index.is_unique:
-        raise IndexError("indexes in dataframe must be unique")
+    if is_categorical_dtype(column.dtype):
+        if distinct_matches.any():
+            dataframe[field] = column.cat.remove_categories(column.cat.categories[distinct_matches])
+    elif rows.any():
+        dataframe.loc[rows, field] = np.nan
 
-    # store indexes of rows that match pattern in a list to be used for locating elements to update
-    # TODO: there is likely a more pandas-efficient way to do this (via slices, etc) instead of O(n) iteration
-    indexes_for_match = []
-    for idx, row in rows_that_contain.iteritems():
-        if row == True:     # because of numpy quirk, must use == instead of "is True" for boolean
-            indexes_for_match.append(idx)
+    return int(rows.sum())
 
-    for field in fields_to_nullify:
-        dataframe.loc[indexes_for_match, (field)] = np.nan
+def blacklist_values(dataframe, blacklist, case_sensitive=False):
+    """
+    Nullify in place values that appear in a per-field blacklist. Nullified values are converted to NaNs.
+
+    :param dataframe:
+    :param blacklist: dict of {fieldname: iterable of literal values to nullify in that field}
+    :param case_sensitive: whether matching is case sensitive or not. Default is False (i.e., not case sensitive)
+    :return: dict of {fieldname: number of values nullified}
+    """
+    rules = NullificationRules(case_sensitive=case_sensitive)
+    for field, values in blacklist.items():
+        rules.add_blacklist(field, values)
 
+    return rules.apply(dataframe)
 
-def blacklist_values():
-    raise NotImplemented()
+def nullify_regex(dataframe, patterns, case_sensitive=False):
+    """
+    Nullify in place string values that contain a match for any of a field's regex patterns. Nullified values are
+    converted to NaNs.
 
-def nullify_regex():
-    raise NotImplemented()
+    :param dataframe:
+    :param patterns: dict of {fieldname: pattern or list of patterns}
+    :param case_sensitive: whether matching is case sensitive or not. Default is False (i.e., not case sensitive)
+    :return: dict of {fieldname: number of values nullified}
+    """
+    rules = NullificationRules(case_sensitive=case_sensitive)
+    for field, field_patterns in patterns.items():
+        if isinstance(field_patterns, str):
+            field_patterns = [field_patterns]
+        for pattern in field_patterns:
+            rules.add_pattern(field, pattern)
 
+    return rules.apply(dataframe)
@@ -0,0 +1,78 @@
+import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_dict_like, is_string_dtype
+
+from utilities import instrumentation
+
+""" Loads csvs with low-cardinality text columns (e.g., Product, State, Agency, Make, Color) as categoricals, which
+store each distinct string once plus a small integer code per row instead of a python string object per row.
+The cleaning, transformation and multivalued table utilities accept categorical columns and keep them categorical. """
+
+
+# text columns whose share of distinct values is at most this are loaded as categoricals
+DEFAULT_MAX_UNIQUE_RATIO = 0.5
+# rows read to pick categorical columns when they are not given
+DEFAULT_SAMPLE_ROWS = 10000
+
+@instrumentation.instrumented()
+def read_csv_categorical(filepath, categorical_fields=None, max_unique_ratio=DEFAULT_MAX_UNIQUE_RATIO,
+                         sample_rows=DEFAULT_SAMPLE_ROWS, **read_csv_kwargs):
+    """
+    Reads a csv, loading low-cardinality text columns as categoricals. Categories are built while parsing, so the full
+    column of python strings is never held in memory.
+
+    Example: read_csv_categorical('Traffic_violations.csv', categorical_fields=['Agency', 'SubAgency', 'Make', 'Color'])
+
+    :param filepath: path of the csv
+    :param categorical_fields: list of fieldnames to load as categoricals. If not specified, text columns are picked
+    from the first sample_rows rows by their share of distinct values
+    :param max_unique_ratio: text columns with at most this share of distinct values in the sample are loaded as
+    categoricals. Ignored if categorical_fields is specified
+    :param sample_rows: number of rows read to pick categorical columns. Ignored if categorical_fields is specified
+    :param read_csv_kwargs: keyword arguments passed on to pandas.read_csv. dtype entries for the same fields take
+    precedence over 'category'; a single dtype (e.g., dtype=str) applies to every field not loaded as a categorical
+    :return: dataframe
+    """
+    if categorical_fields is None:
+        sample = pd.read_csv(filepath, nrows=sample_rows, **read_csv_kwargs)
+        categorical_fields = low_cardinality_fields(sample, max_unique_ratio=max_unique_ratio)
+
+    other_dtype = read_csv_kwargs.pop('dtype', None)
+    if other_dtype is not None and not is_dict_like(other_dtype):
+        columns = pd.read_csv(filepath, nrows=0, **read_csv_kwargs).columns
+        other_dtype = dict((column, other_dtype) for column in columns if column not in categorical_fields)
+
+    dtype = dict((field, 'category') for field in categorical_fields)
+    dtype.update(other_dtype or {})
+
+    return pd.read_csv(filepath, dtype=dtype, **read_csv_kwargs)
+
+def low_cardinality_fields(dataframe, fields=None, max_unique_ratio=DEFAULT_MAX_UNIQUE_RATIO):
+    """
+    :param fields: optional list of fieldnames to consider. If not specified, considers all columns
+    :return: list of the text fields whose share of distinct (non-NaN) values is at most max_unique_ratio
+    """
+    if fields is None:
+        fields = dataframe.columns
+
+    selected = []
+    for field in fields:
+        column = dataframe[field]
+        if is_categorical_dtype(column.dtype) or not is_string_dtype(column.dtype):
+            continue
+        if column.nunique() <= max_unique_ratio * len(column):
+            selected.append(field)
+    return selected
+
+def categorize(dataframe, fields=None, max_unique_ratio=DEFAULT_MAX_UNIQUE_RATIO):
+    """
+    Converts in place low-cardinality text columns of a dataframe that is already loaded to categoricals.
+    :param fields: optional list of fieldnames to convert, regardless of their cardinality. If not specified, converts
+    the fields picked by low_cardinality_fields
+    :return: list of the fieldnames converted
+    """
+    if fields is None:
+        fields = low_cardinality_fields(dataframe, max_unique_ratio=max_unique_ratio)
+
+    for field in fields:
+        dataframe[field] = dataframe[field].astype('category')
+    return list(fields)
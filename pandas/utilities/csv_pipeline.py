@@ -0,0 +1,105 @@
+import pandas as pd
+
+from utilities import columnar_io, instrumentation
+
+""" Streaming pipeline that runs the cleaning/transformation utilities over a csv one chunk at a time, so that files
+much larger than memory can be processed. Peak memory is bounded by the chunk size rather than the file size. """
+
+
+DEFAULT_CHUNKSIZE = 100000
+
+def step(func, *args, **kwargs):
+    """
+    Wraps one of the in-place utilities (e.g., nullify_non_alphanum, clean_phone_numbers) as a pipeline step.
+    The chunk is passed as the first argument, followed by args and kwargs.
+
+    Example: step(clean_phone_numbers, phonenum_field='phone', region_string='US')
+
+    :param func: function that takes a dataframe as its first argument
+    :return: callable that takes a chunk
+    """
+    def run_step(chunk):
+        return func(chunk, *args, **kwargs)
+
+    run_step.__name__ = func.__name__
+    return run_step
+
+def column_step(fieldname, func, *args, **kwargs):
+    """
+    Wraps a utility that returns a series (e.g., concat_fieldvalues) as a pipeline step that stores its result in
+    fieldname.
+
+    Example: column_step('address', concat_fieldvalues, ['street', 'city', 'state'])
+
+    :param fieldname: name of the field that will hold the result. Created if not present.
+    :param func: function that takes a dataframe as its first argument and returns a series
+    :return: callable that takes a chunk
+    """
+    def run_column_step(chunk):
+        chunk[fieldname] = func(chunk, *args, **kwargs)
+
+    run_column_step.__name__ = func.__name__
+    return run_column_step
+
+def process_csv_in_chunks(infile, outfile, steps, chunksize=DEFAULT_CHUNKSIZE, read_csv_kwargs=None,
+                          to_csv_kwargs=None):
+    """
+    Reads a csv in fixed size chunks, applies a sequence of steps to each chunk and appends the result to an output csv.
+    Only one chunk is held in memory at a time.
+
+    Steps only ever see one chunk, so they must be row-local: cleaning and transformations are, but profiling
+    (profile_uniques) and widening multivalued attributes need every row of a key and can't be run as steps.
+    Chunks keep pandas' running row index (0..n-1 across the whole file), so row indexes are unique as
+    clean_phone_numbers requires.
+
+    :param infile: path (or buffer) of the csv to be read
+    :param outfile: path of the csv to write results to, overwriting any existing data
+    :param steps: list of callables (see step and column_step) that each take a chunk dataframe. Steps that modify the
+    chunk in place return None; if a step returns a dataframe, that dataframe replaces the chunk for subsequent steps.
+    :param chunksize: number of rows per chunk
+    :param read_csv_kwargs: optional dict of keyword arguments passed on to pandas.read_csv (e.g., dtype, usecols)
+    :param to_csv_kwargs: optional dict of keyword arguments passed on to DataFrame.to_csv. Index is not written unless
+    specified here. A header is only written with the first chunk.
+    :return: number of rows written
+    """
+    return process_in_chunks(infile, outfile, steps, chunksize=chunksize, read_kwargs=read_csv_kwargs,
+                             write_kwargs=to_csv_kwargs, input_format=columnar_io.CSV, output_format=columnar_io.CSV)
+
+def process_in_chunks(infile, outfile, steps, chunksize=DEFAULT_CHUNKSIZE, columns=None, read_kwargs=None,
+                      write_kwargs=None, input_format=None, output_format=None):
+    """
+    Same as process_csv_in_chunks, for csv, Parquet or Arrow IPC input and output (see columnar_io), e.g. to clean a
+    csv into a Parquet file that later stages read without parsing text.
+
+    :param infile: path of the file to be read
+    :param outfile: path of the file to write results to, overwriting any existing data
+    :param steps: list of callables that each take a chunk dataframe (see process_csv_in_chunks)
+    :param chunksize: number of rows per chunk
+    :param columns: optional list of the columns to read; other columns are neither read nor written
+    :param read_kwargs: optional dict of keyword arguments for reading (see columnar_io.iter_chunks)
+    :param write_kwargs: optional dict of keyword arguments for writing (see columnar_io.ChunkWriter). Index is not
+    written unless specified here.
+    :param input_format: columnar_io.CSV, PARQUET or ARROW. Defaults to the format matching the file extension
+    :param output_format: columnar_io.CSV, PARQUET or ARROW. Defaults to the format matching the file extension
+    :return: number of rows written
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+
+    read_kwargs = dict(read_kwargs or {})
+    write_kwargs = dict(write_kwargs or {})
+    index = write_kwargs.pop('index', False)
+
+    with columnar_io.ChunkWriter(outfile, file_format=output_format, index=index, **write_kwargs) as writer:
+        for chunk in columnar_io.iter_chunks(infile, chunksize, columns=columns, file_format=input_format,
+                                             **read_kwargs):
+            for pipeline_step in steps:
+                with instrumentation.stage('pipeline_step ' + getattr(pipeline_step, '__name__', ''), rows=len(chunk)):
+                    result = pipeline_step(chunk)
+                if isinstance(result, pd.DataFrame):
+                    chunk = result
+
+            with instrumentation.stage('write_chunk', rows=len(chunk)):
+                writer.write(chunk)
+
+        return writer.rows_written
@@ -1,15 +1,34 @@
 import pandas as pd
 import numpy as np
 import csv
+import pickle
 
-def profile_uniques(dataframe, keyfield, fields_to_profile, casesensitive=False, outfile=None):
+from utilities import columnar_io, instrumentation
+from utilities.cardinality_sketch import KeyedHyperLogLog, DEFAULT_ERROR_RATE
+from utilities.mapped_columns import MappedColumns
+
+# rows hashed into the sketches at a time in approximate mode, to bound the memory of the temporary hash arrays
+SKETCH_BLOCKSIZE = 1000000
+
+# exact UniquesProfiles store each distinct (key, value) pair as one int64: the key code in the high bits and the value
+# code + 1 in the low VALUE_BITS (0 standing for NaN)
+VALUE_BITS = 32
+VALUE_MASK = (1 << VALUE_BITS) - 1
+
+@instrumentation.instrumented()
+def profile_uniques(dataframe, keyfield, fields_to_profile, casesensitive=False, outfile=None, approximate=False,
+                    error_rate=DEFAULT_ERROR_RATE):
     """
     Analyzes the max, min, and average number of unique values in a csv around a key field, grouped by each field
     specified in the input. (NaNs are not counted as values)
     :param keyfield: string representing the column name of key column
     :param fields_to_profile: list of fieldnames identifying fields to provile
     :param casesensitive: currently does not do anything
-    :param outfile: path and name of file to write results to
+    :param outfile: path and name of file to write results to (csv, or Parquet/Arrow for a .parquet/.arrow extension)
+    :param approximate: set to True to estimate the unique values per key with HyperLogLog sketches instead of counting
+    them exactly. Memory then no longer grows with the number of distinct values, and each field's stats also hold
+    "approximate": True and "relative_error", the relative standard error of the per-key counts
+    :param error_rate: target relative standard error of the per-key counts in approximate mode
     :return: list of dicts representing stats by field
     """
 
@@ -17,29 +36,298 @@ def profile_uniques(dataframe, keyfield, fields_to_profile, casesensitive=False,
     header = ["field", "max_uniques", "avg_uniques", "min_uniques"]
     all_field_stats = []
 
+    if approximate:
+        all_field_stats = UniquesProfile(keyfield, fields_to_profile, approximate=True,
+                                         error_rate=error_rate).update(dataframe).to_list()
+        header += ["approximate", "relative_error"]
+    else:
+        # Equivalent to: SELECT keyfield, COUNT(distinct field1), COUNT(distinct field2), ... FROM table
+        # GROUP BY keyfield, computed with a single groupby and aggregation across all fields. observed=True keeps
+        # unused categories of a categorical key from being counted as keys. Repeated fields are aggregated once, so
+        # each field is a single column of counts_by_key
+        if len(fields_to_profile) > 0:
+            counts_by_key = dataframe.groupby(keyfield, observed=True)[list(dict.fromkeys(fields_to_profile))].nunique()
+
+        for field in fields_to_profile:
+            count_by_key = counts_by_key[field]
+            fieldstats = {"field": field,
+                          "max_uniques": count_by_key.max(),
+                          "avg_uniques": count_by_key.mean(),
+                          "min_uniques": count_by_key.min()}
+            all_field_stats.append(fieldstats)
+
+            del fieldstats, count_by_key
+
+    if outfile is not None:
+        _write_profile(all_field_stats, header, outfile)
+
+    return all_field_stats
+
+@instrumentation.instrumented()
+def profile_uniques_mapped(path, keyfield, fields_to_profile, outfile=None):
+    """
+    Same as profile_uniques, reading the data from a memory-mapped Arrow IPC file or directory of per-column .npy
+    files (see mapped_columns.MappedColumns) instead of a dataframe. Columns are encoded as integer codes straight from
+    the mapped pages, so no dataframe copy of the data is made, and workers profiling the same file share its pages.
+    :param path: path of an Arrow IPC file, or of a directory of .npy files
+    :param keyfield: string representing the column name of key column
+    :param fields_to_profile: list of fieldnames identifying fields to profile
+    :param outfile: path and name of file to write results to (csv, or Parquet/Arrow for a .parquet/.arrow extension)
+    :return: list of dicts representing stats by field, as returned by profile_uniques
+    """
+    with MappedColumns(path) as columns:
+        key_codes, n_keys = columns.codes(keyfield)
+        has_key = key_codes >= 0
+        # only keys that appear in some row are profiled (a dictionary encoded key may list unused keys)
+        observed_keys = np.bincount(key_codes[has_key], minlength=n_keys) > 0
 
-    for field in fields_to_profile:
-        # Equivalent to: SELECT keyfield, COUNT(distinct field) FROM table GROUP BY keyfield
-        count_by_key = dataframe.groupby(keyfield)[field].nunique()
-        fieldstats = {"field": field,
-                      "max_uniques": count_by_key.max(),
-                      "avg_uniques": count_by_key.mean(),
-                      "min_uniques": count_by_key.min()}
-        all_field_stats.append(fieldstats)
+        all_field_stats = []
+        for field in fields_to_profile:
+            value_codes, n_values = columns.codes(field)
+            count_by_key = pd.Series(_count_uniques_by_code(key_codes, n_keys, value_codes, n_values)[observed_keys])
 
-        del fieldstats, count_by_key
+            all_field_stats.append({"field": field,
+                                    "max_uniques": count_by_key.max(),
+                                    "avg_uniques": count_by_key.mean(),
+                                    "min_uniques": count_by_key.min()})
 
     if outfile is not None:
-        # write results to an output file, overwriting any existing data
-        print("write to outfile")
-        with open(outfile, 'w') as csvfile:
+        _write_profile(all_field_stats, ["field", "max_uniques", "avg_uniques", "min_uniques"], outfile)
+
+    return all_field_stats
+
+def _count_uniques_by_code(key_codes, n_keys, value_codes, n_values):
+    """
+    :param key_codes: numpy int array of key codes, -1 for null keys
+    :param value_codes: numpy int array of value codes, -1 for null values
+    :return: numpy array with the number of distinct non-null values of each of the n_keys keys
+    """
+    has_pair = (key_codes >= 0) & (value_codes >= 0)
+    # each distinct (key, value) pair as a single integer
+    pairs = np.unique(key_codes[has_pair].astype(np.int64) * max(n_values, 1) + value_codes[has_pair])
+    return np.bincount(pairs // max(n_values, 1), minlength=n_keys)
+
+def _write_profile(all_field_stats, header, outfile):
+    """ writes a list of field stats to a csv, overwriting any existing data (or a Parquet/Arrow file, by extension) """
+    print("write to outfile")
+    if columnar_io.format_for_path(outfile) != columnar_io.CSV:
+        # .parquet/.arrow outfiles are written as a columnar table
+        columnar_io.write_table(pd.DataFrame(all_field_stats, columns=header), outfile)
+    else:
+        with instrumentation.stage('write_profile_csv', rows=len(all_field_stats)), open(outfile, 'w') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=header)
             writer.writeheader()
             for row in all_field_stats:
                 writer.writerow(row)
 
-    return all_field_stats
+def _codes_in(index, values):
+    """
+    :param index: pandas Index of distinct values
+    :param values: array-like of distinct non-NaN values
+    :return: (numpy int64 array with the position of each value in index, index with the values it was missing
+    appended)
+    """
+    values = np.asarray(values)
+    codes = index.get_indexer(values).astype(np.int64)
+    missing = codes < 0
+    if missing.any():
+        codes[missing] = np.arange(len(index), len(index) + missing.sum())
+        index = index.append(pd.Index(values[missing], dtype=object))
+    return codes, index
+
+def _pair_codes(key_codes, value_codes):
+    """ :return: int64 array holding each (key code, value code) pair as a single integer (see VALUE_BITS) """
+    return (key_codes.astype(np.int64) << VALUE_BITS) | value_codes
+
+
+class UniquesProfile(object):
+    """
+    Mergeable state for profile_uniques, so that profiling cost is proportional to new data only. Holds the
+    distinct values seen per key for every profiled field; it can be updated chunk by chunk and file by file, merged
+    with profiles built elsewhere (e.g., one per daily file), saved to disk and loaded back, and produces the same
+    max/avg/min statistics as profile_uniques over all the data it has seen.
+    Exact profiles encode keys and values as integer codes and keep the distinct (key, value) code pairs of every field
+    in numpy arrays, so updating, merging and counting are factorize/unique/bincount operations rather than Python
+    loops over pairs.
+    Memory is proportional to the number of distinct (key, value) pairs, or, with approximate=True, bounded by the
+    number of keys: each field then keeps a HyperLogLog sketch per key (see cardinality_sketch), and the stats are
+    estimates with "approximate": True and "relative_error" added.
+
+    Note: values are compared as read, so read every chunk/file with the same dtypes (e.g., dtype=str) to keep
+    values like '01' and 1 from being counted differently in different files.
+    """
+    def __init__(self, keyfield, fields_to_profile, approximate=False, error_rate=DEFAULT_ERROR_RATE):
+        """
+        :param keyfield: string representing the column name of key column
+        :param fields_to_profile: list of fieldnames identifying fields to profile
+        :param approximate: set to True to keep HyperLogLog sketches instead of exact sets of values
+        :param error_rate: target relative standard error of the per-key counts if approximate
+        """
+        self.keyfield = keyfield
+        self.fields_to_profile = list(fields_to_profile)
+        self.approximate = approximate
+        self.rows_seen = 0
+        # relative standard error of the per-key counts, None if exact
+        self.relative_error = None
+        if approximate:
+            # field -> sketches of the distinct non-NaN values of every key
+            self._sketches = dict((field, KeyedHyperLogLog(error_rate)) for field in self.fields_to_profile)
+            self.relative_error = KeyedHyperLogLog(error_rate).relative_error
+        else:
+            # distinct keys and distinct non-NaN values of every field, in the order they were first seen: their
+            # positions are the codes
+            self._keys = pd.Index([])
+            self._values = dict((field, pd.Index([])) for field in self.fields_to_profile)
+            # field -> list of int64 arrays of distinct pairs (see VALUE_BITS), deduplicated across the list once it
+            # grows (see _add_pairs). Keys whose values are all NaN keep a pair with the NaN value code
+            self._pairs = dict((field, []) for field in self.fields_to_profile)
+
+    @instrumentation.instrumented('UniquesProfile.update')
+    def update(self, dataframe):
+        """
+        Adds a dataframe (or chunk) to the profile. Rows with a NaN key are ignored, as in profile_uniques.
+        :return: self
+        """
+        if self.approximate:
+            # only the key and one field at a time are copied, rather than every column of the keyed rows
+            has_key = dataframe[self.keyfield].notnull().values
+            keys = dataframe[self.keyfield].values[has_key]
+            for field in self.fields_to_profile:
+                values = dataframe[field].values[has_key]
+                for start in range(0, len(keys), SKETCH_BLOCKSIZE):
+                    self._sketches[field].update(keys[start:start + SKETCH_BLOCKSIZE],
+                                                 values[start:start + SKETCH_BLOCKSIZE])
+
+            self.rows_seen += len(dataframe)
+            return self
+
+        has_key = dataframe[self.keyfield].notnull().values
+        key_codes, keys = pd.factorize(dataframe[self.keyfield].values[has_key])
+        profile_codes, self._keys = _codes_in(self._keys, keys)
+        key_codes = profile_codes[key_codes]
+
+        for field in self.fields_to_profile:
+            value_codes, values = pd.factorize(dataframe[field].values[has_key])
+            profile_codes, self._values[field] = _codes_in(self._values[field], values)
+            # NaNs have code -1, which picks up the trailing 0
+            value_codes = np.append(profile_codes + 1, 0)[value_codes]
+            self._add_pairs(field, pd.unique(_pair_codes(key_codes, value_codes)))
+
+        self.rows_seen += len(dataframe)
+        return self
+
+    def update_from_csv(self, infile, chunksize=100000, **read_csv_kwargs):
+        """
+        Adds a csv to the profile, reading it in chunks so only one chunk is held in memory at a time
+        :param read_csv_kwargs: keyword arguments passed on to pandas.read_csv (e.g., dtype=str)
+        :return: self
+        """
+        usecols = [self.keyfield] + [field for field in self.fields_to_profile if field != self.keyfield]
+        for chunk in pd.read_csv(infile, chunksize=chunksize, usecols=usecols, **read_csv_kwargs):
+            self.update(chunk)
+        return self
+
+    def merge(self, other):
+        """
+        Merges another profile of the same key and fields into this one
+        :return: self
+        """
+        if other.keyfield != self.keyfield or other.fields_to_profile != self.fields_to_profile:
+            raise ValueError('can only merge profiles of the same keyfield and fields')
+        if other.approximate != self.approximate:
+            raise ValueError('can not merge exact and approximate profiles')
+
+        if self.approximate:
+            for field in self.fields_to_profile:
+                self._sketches[field].merge(other._sketches[field])
+
+            self.rows_seen += other.rows_seen
+            return self
+
+        # other's codes are translated into codes of this profile
+        key_codes, self._keys = _codes_in(self._keys, other._keys)
+        for field in self.fields_to_profile:
+            value_codes, self._values[field] = _codes_in(self._values[field], other._values[field])
+            value_codes = np.append(0, value_codes + 1)
+            for pairs in list(other._pairs[field]):
+                self._add_pairs(field, _pair_codes(key_codes[pairs >> VALUE_BITS], value_codes[pairs & VALUE_MASK]))
+
+        self.rows_seen += other.rows_seen
+        return self
+
+    def count_uniques_by_key(self, field):
+        """
+        :return: series with the number of unique non-NaN values per key (estimated, if approximate), sorted by key
+        (in the order keys were first seen if they are of mixed types)
+        """
+        if self.approximate:
+            return self._sketches[field].estimate()
+
+        pairs = self._distinct_pairs(field)
+        key_codes = pairs >> VALUE_BITS
+        # pairs are distinct, so counting the pairs of a key with a non-NaN value counts its unique values
+        counts = np.bincount(key_codes[(pairs & VALUE_MASK) != 0], minlength=len(self._keys))
+        observed = np.bincount(key_codes, minlength=len(self._keys)) > 0
+        counts = pd.Series(counts[observed], index=self._keys[observed], dtype=np.int64)
+        try:
+            return counts.sort_index()
+        except TypeError:   # keys of mixed types can't be sorted
+            return counts
+
+    def _add_pairs(self, field, pairs):
+        """
+        Appends an int64 array of pairs to the field's pairs. The list is deduplicated once the pairs appended since it
+        last was outnumber the deduplicated ones, so each pair is deduplicated a logarithmic number of times rather than
+        on every update.
+        """
+        arrays = self._pairs[field]
+        arrays.append(pairs)
+        if sum(len(array) for array in arrays[1:]) > len(arrays[0]):
+            self._distinct_pairs(field)
+
+    def _distinct_pairs(self, field):
+        """ :return: int64 array of the distinct pairs of field """
+        arrays = self._pairs[field]
+        if not arrays:
+            return np.zeros(0, dtype=np.int64)
+        if len(arrays) > 1:
+            arrays[:] = [pd.unique(np.concatenate(arrays))]
+        return arrays[0]
+
+    def field_stats(self):
+        """
+        :return: a nested dictionary {"fieldname1": {"max_uniques": 1, ... }, "fieldname2": {...} }, as returned by
+        MultivaluedTable.profile_uniques
+        """
+        all_field_stats = dict()
+        for field in self.fields_to_profile:
+            count_by_key = self.count_uniques_by_key(field)
+            all_field_stats[field] = {"max_uniques": count_by_key.max(),
+                                      "avg_uniques": count_by_key.mean(),
+                                      "min_uniques": count_by_key.min()}
+            if self.approximate:
+                all_field_stats[field]["approximate"] = True
+                all_field_stats[field]["relative_error"] = self.relative_error
+        return all_field_stats
 
+    def to_list(self):
+        """
+        :return: list of dicts representing stats by field, as returned by profile_uniques
+        """
+        all_field_stats = self.field_stats()
+        return [dict(field=field, **all_field_stats[field]) for field in self.fields_to_profile]
 
+    def save(self, path):
+        """ write the profile to disk, overwriting any existing file """
+        with open(path, 'wb') as picklefile:
+            pickle.dump(self, picklefile, protocol=pickle.HIGHEST_PROTOCOL)
 
+    @staticmethod
+    def load(path):
+        """ load a profile written by save """
+        with open(path, 'rb') as picklefile:
+            profile = pickle.load(picklefile)
 
+        if not isinstance(profile, UniquesProfile):
+            raise TypeError(str(path) + ' does not contain a UniquesProfile')
+        return profile
@@ -1,31 +1,91 @@
 import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_categorical_dtype
 
-def concat_fieldvalues(mydataframe, fieldnames, separator=' ', nan_substitute=''):
+from utilities import instrumentation
+
+# str.strip as a ufunc over object arrays of strings, returning an object array
+_strip = np.frompyfunc(str.strip, 1, 1)
+
+@instrumentation.instrumented()
+def concat_fieldvalues(mydataframe, fieldnames, separator=' ', nan_substitute='', dtype=None, skip_empty_values=False):
     """
-    Concatenates data values across one or more fields (note: data to be concatenated must be the same type),
-    with separator. Handles NaN's gracefully.
+    Concatenates data values across one or more fields, with separator. Fields can be of any type (non-string values
+    are concatenated as their string representation, so floats keep their decimal point: 1.0 is written '1.0'.
+    Convert float fields holding whole numbers, e.g. ints read with NaNs, to a nullable int or string dtype first).
+    Handles NaN's gracefully: they are written as nan_substitute, leading/trailing whitespaces are stripped from the
+    concatenation, and concatenations that come out empty are returned as NaNs.
 
     :param mydataframe: dataframe containing data to be concatenated
     :param fieldnames: list of fieldnames to be concatenated
     :param separator: separator to be used. Default separator is single whitespace
     :param nan_substitute: character to be substituted for NaNs. Default is blank space.
+    :param dtype: optional dtype of the returned series, e.g. 'category' when the result has few distinct values, or
+    'string'. Default keeps python strings in an object series.
+    :param skip_empty_values: set to True to strip leading/trailing whitespaces from each value before concatenation,
+    and leave out values that are empty (NaNs included, unless nan_substitute isn't empty), so separators are not
+    doubled up: ['x', NaN, 'z'] gives 'x z' instead of 'x  z'
     :return: dataframe
     """
 
     # trivial cases
     if len(fieldnames) <1: raise IOError('must designate at least one field to be concatenated')
     if len(fieldnames) == 1:
+        if dtype is not None:
+            return mydataframe[fieldnames[0]].astype(dtype)
         return mydataframe[fieldnames[0]]
 
-    firstfield = fieldnames[0]
-    otherfields = fieldnames[1:]
+    # the result is built one column at a time with elementwise additions of object arrays, rather than row by row
+    columns = [_string_values(mydataframe[field], nan_substitute, skip_empty_values) for field in fieldnames]
+    mydata = columns[0]
+
+    if skip_empty_values:
+        separators = np.array(['', separator], dtype=object)
+        has_value = mydata != ''
+        for column in columns[1:]:
+            is_value = column != ''
+            # a separator only goes between two non-empty values
+            np.add(mydata, separators[(has_value & is_value).view(np.int8)], out=mydata)
+            np.add(mydata, column, out=mydata)
+            has_value |= is_value
+    else:
+        for column in columns[1:]:
+            np.add(mydata, separator, out=mydata)
+            np.add(mydata, column, out=mydata)
+        mydata = _strip(mydata)
+
+    # concatenating 2 or more NaNs gives an empty string, which is returned as a NaN
+    mydata[mydata == ''] = np.nan
+    mydata = pd.Series(mydata, index=mydataframe.index, name=fieldnames[0], dtype=object)
 
-    mydata = mydataframe[firstfield].str.cat(others=[mydataframe[col] for col in otherfields], sep=separator, na_rep=nan_substitute)
+    if dtype is not None:
+        mydata = mydata.astype(dtype)
 
-    # strip any leading/trailing whitespaces
-    mydata = mydata.map(str.strip)
+    return mydata
+
+def _string_values(series, nan_substitute, strip):
+    """
+    :return: numpy object array with the values of series as strings (stripped if strip), and nan_substitute in place
+    of NaNs
+    """
+    if is_categorical_dtype(series.dtype):
+        # only the categories are converted (and stripped); rows look theirs up by code (NaNs get code -1, which picks
+        # up nan_substitute from the end of the lookup array)
+        categories = _strings(series.cat.categories)
+        if strip:
+            categories = _strip(categories)
+        return np.append(categories, np.array([nan_substitute], dtype=object))[series.cat.codes.values]
 
-    # since concatenating 2 or more NaNs will give you a '' entry, now have to replace any of these with NaNs
-    mydata.replace('', np.nan, inplace=True)
+    nulls = series.isnull().values
+    values = _strings(series)
+    if strip:
+        values[nulls] = ''
+        values = _strip(values)
+    values[nulls] = nan_substitute
+    return values
 
-    return mydata
\ No newline at end of file
+def _strings(values):
+    """ :return: new numpy object array with values as strings, except for nulls """
+    if infer_dtype(values, skipna=True) != 'string':
+        values = values.astype(str)
+    return np.array(values, dtype=object)
@@ -0,0 +1,206 @@
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+""" Opt-in instrumentation for the utilities. When enabled, each instrumented stage (phone cleaning, profiling,
+widening, csv writing, ...) records its wall time, rows processed, rows/sec, memory delta and counters such as phone
+parse failures, cache hits and rows nullified, and hands the record to a pluggable sink.
+Instrumentation is disabled by default; stage() then returns a shared no-op object and count() returns immediately,
+so the instrumented code pays close to nothing.
+
+Example:
+    collector = MemoryCollector()
+    enable(collector)
+    clean_phone_numbers(df, 'phone', region_string='US')
+    disable()
+    print(collector.records)
+"""
+
+
+_sink = None
+_active_stages = threading.local()
+
+def enable(sink):
+    """
+    Turns instrumentation on, sending stage records to sink
+    :param sink: object with an emit(record) method, e.g. LoggingSink, JsonLinesSink or MemoryCollector
+    """
+    global _sink
+    _sink = sink
+
+def disable():
+    """ Turns instrumentation off """
+    global _sink
+    _sink = None
+
+def is_enabled():
+    return _sink is not None
+
+def stage(name, rows=None):
+    """
+    Context manager that records one stage. Counters recorded with count() while the stage is active are attached to
+    the innermost active stage.
+    :param name: stage name, e.g. the name of the function being timed
+    :param rows: number of rows processed, if known up front (can also be set on the stage afterwards)
+    :return: Stage, or a no-op stand in if instrumentation is disabled
+    """
+    if _sink is None:
+        return _NULL_STAGE
+    return Stage(name, rows, _sink)
+
+def instrumented(name=None):
+    """
+    Decorator that runs every call of a function as a stage. Rows are taken from the length of the first
+    dataframe/series argument.
+    :param name: stage name. Defaults to the function's name
+    """
+    def decorator(func):
+        stage_name = name if name is not None else func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return func(*args, **kwargs)
+            with Stage(stage_name, _rows_in_arguments(args, kwargs), _sink):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+def count(counter, amount=1):
+    """
+    Adds amount to a counter of the innermost active stage. Does nothing if instrumentation is disabled or no stage is
+    active.
+    """
+    if _sink is None:
+        return
+    stages = getattr(_active_stages, 'stack', None)
+    if stages:
+        stages[-1].count(counter, amount)
+
+
+class Stage(object):
+    """
+    Records wall time, rows, rows/sec, memory delta and counters of one stage, and emits them to a sink on exit.
+    Memory delta is the change in memory traced by tracemalloc if it is tracing, otherwise the growth in the process'
+    peak resident memory (where the resource module is available), in bytes.
+    """
+    def __init__(self, name, rows, sink):
+        self.name = name
+        self.rows = rows
+        self.counters = dict()
+        self._sink = sink
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def __enter__(self):
+        self._start_memory = _memory_in_use()
+        self._start_time = time.perf_counter()
+
+        stages = getattr(_active_stages, 'stack', None)
+        if stages is None:
+            stages = _active_stages.stack = []
+        stages.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start_time
+        end_memory = _memory_in_use()
+        _active_stages.stack.pop()
+
+        record = {"stage": self.name,
+                  "seconds": seconds,
+                  "rows": self.rows,
+                  "rows_per_sec": self.rows / seconds if self.rows is not None and seconds > 0 else None,
+                  "memory_delta_bytes": end_memory - self._start_memory if end_memory is not None else None,
+                  "counters": self.counters,
+                  "error": exc_type.__name__ if exc_type is not None else None}
+        self._sink.emit(record)
+
+        return False
+
+class _NullStage(object):
+    """ shared stand in for Stage when instrumentation is disabled """
+    rows = None
+
+    def count(self, counter, amount=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        # ignore e.g. stage.rows = n, so the shared instance is never modified
+        pass
+
+_NULL_STAGE = _NullStage()
+
+def _rows_in_arguments(args, kwargs):
+    """ :return: length of the first argument that looks like a dataframe or series, or None """
+    for argument in list(args) + list(kwargs.values()):
+        if isinstance(argument, (pd.DataFrame, pd.Series)):
+            return len(argument)
+    return None
+
+def _memory_in_use():
+    """ :return: bytes traced by tracemalloc if it is tracing, otherwise peak resident memory, or None """
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class LoggingSink(object):
+    """ logs each stage record as a single line """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, "stage %s: %s", record["stage"], json.dumps(record, sort_keys=True, default=str))
+
+class JsonLinesSink(object):
+    """ appends each stage record to a file as one line of JSON """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            with open(self.path, 'a') as jsonfile:
+                jsonfile.write(json.dumps(record, sort_keys=True, default=str) + '\n')
+
+class MemoryCollector(object):
+    """ keeps stage records in a list, e.g. for tests or for summarizing a job at the end """
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def counter_totals(self):
+        """ :return: dict of {counter: total across all records} """
+        totals = dict()
+        for record in self.records:
+            for counter, amount in record["counters"].items():
+                totals[counter] = totals.get(counter, 0) + amount
+        return totals
+
+    def clear(self):
+        self.records = []
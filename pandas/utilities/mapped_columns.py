@@ -0,0 +1,152 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilities import columnar_io
+
+""" Read-only, memory-mapped access to the columns of an Arrow IPC file or of a directory of per-column NumPy .npy
+files, for profiling passes that only read data. Columns are never materialized as pandas objects: each column is
+turned into integer codes (one per row, -1 for nulls) straight from the mapped buffers, and the file's pages are
+shared through the OS page cache by every process that maps it.
+
+Example:
+    with MappedColumns('complaints.arrow') as columns:
+        key_codes, n_keys = columns.codes('Complaint ID')
+"""
+
+
+NPY_EXTENSION = '.npy'
+
+class MappedColumns(object):
+    """
+    Columns of a memory-mapped Arrow IPC file (as written by columnar_io.write_table or ChunkWriter), or of a directory
+    holding one <fieldname>.npy file per column (e.g., written with numpy.save).
+    .npy columns must have a numeric, string ('U'/'S') or datetime dtype: object arrays can't be memory-mapped. NaNs
+    (and empty strings in string columns) are treated as nulls.
+    Arrow files must be uncompressed (columnar_io.write_table's default): compressed buffers have to be decompressed
+    into memory, so they are rejected rather than silently copied.
+    """
+    def __init__(self, path):
+        """
+        :param path: path of an Arrow IPC file, or of a directory of .npy files
+        """
+        self.path = path
+        self._table = None
+        self._source = None
+        self._npy_paths = None
+
+        if os.path.isdir(path):
+            self._npy_paths = dict((filename[:-len(NPY_EXTENSION)], os.path.join(path, filename))
+                                   for filename in sorted(os.listdir(path)) if filename.endswith(NPY_EXTENSION))
+        else:
+            columnar_io._require_pyarrow()
+            self._source = columnar_io.pyarrow.memory_map(path)
+            # read_all on a memory map references the mapped buffers instead of copying them, unless they are compressed
+            self._table = columnar_io.pyarrow.ipc.open_file(self._source).read_all()
+            if not _is_mapped(self._table, self._source):
+                self.close()
+                raise ValueError(str(path) + ' is compressed, so it can not be memory-mapped; write it with '
+                                 'compression=\'uncompressed\'')
+
+    def close(self):
+        """ unmap an Arrow file. Codes already returned stay valid, as they are copies """
+        self._table = None
+        if self._source is not None:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def columns(self):
+        """ list of the fieldnames available """
+        if self._npy_paths is None:
+            return list(self._arrow_table().column_names)
+        return list(self._npy_paths)
+
+    def __len__(self):
+        """ number of rows """
+        if self._npy_paths is None:
+            return self._arrow_table().num_rows
+        if len(self._npy_paths) == 0:
+            return 0
+        return len(self.array(self.columns[0]))
+
+    def array(self, field):
+        """
+        :return: the column as a read-only numpy memmap. Only available for .npy columns
+        """
+        if self._npy_paths is None:
+            raise TypeError('arrays are only available for .npy columns; use codes for Arrow columns')
+        if field not in self._npy_paths:
+            raise KeyError(field)
+
+        array = np.load(self._npy_paths[field], mmap_mode='r')
+        if array.dtype == object:
+            raise ValueError(str(field) + ' is an object array, which can not be memory-mapped')
+        return array
+
+    def codes(self, field):
+        """
+        Encodes a column as integer codes, without converting its values to python objects
+        :return: (numpy int64 array with one code per row and -1 for nulls, number of distinct codes)
+        """
+        if self._npy_paths is None:
+            return _arrow_codes(self._arrow_table().column(field))
+        return _numpy_codes(self.array(field))
+
+    def _arrow_table(self):
+        if self._table is None:
+            raise ValueError(str(self.path) + ' has been closed')
+        return self._table
+
+def _is_mapped(table, source):
+    """ :return: True if every buffer of a table read from a memory map points into the mapped file """
+    source.seek(0)
+    mapped = source.read_buffer()
+    start, end = mapped.address, mapped.address + mapped.size
+
+    for column in table.columns:
+        for chunk in column.chunks:
+            arrays = [chunk, chunk.dictionary] if columnar_io.pyarrow.types.is_dictionary(chunk.type) else [chunk]
+            for buffer in itertools.chain.from_iterable(array.buffers() for array in arrays):
+                if buffer is not None and not start <= buffer.address <= buffer.address + buffer.size <= end:
+                    return False
+    return True
+
+def _arrow_codes(column):
+    """ :return: (codes, number of distinct codes) of a pyarrow ChunkedArray """
+    pyarrow = columnar_io.pyarrow
+
+    if pyarrow.types.is_dictionary(column.type):
+        # chunks of a dictionary column may each have their own dictionary
+        column = pyarrow.table({'column': column}).unify_dictionaries().column('column')
+    else:
+        column = column.dictionary_encode()
+
+    if column.num_chunks == 0:
+        return np.array([], dtype=np.int64), 0
+
+    n_values = len(column.chunk(0).dictionary)
+    codes = [np.asarray(chunk.indices.cast(pyarrow.int64()).fill_null(-1)) for chunk in column.chunks]
+    return np.concatenate(codes), n_values
+
+def _numpy_codes(array):
+    """ :return: (codes, number of distinct codes) of a numpy array, treating NaNs/NaTs and empty strings as nulls """
+    if array.dtype.kind not in 'US':
+        # factorize reads the mapped array in place, and codes NaNs/NaTs as -1
+        codes, uniques = pd.factorize(array)
+        return codes.astype(np.int64, copy=False), len(uniques)
+
+    # strings have no null value, so the empty string is coded on its own and then dropped from the codes
+    uniques, codes = np.unique(array, return_inverse=True)
+    codes = codes.astype(np.int64, copy=False)
+    if len(uniques) and uniques[0] == array.dtype.type():
+        codes -= 1
+        return codes, len(uniques) - 1
+    return codes, len(uniques)
@@ -1,6 +1,21 @@
 import pandas as pd
 import numpy as np
 import csv
+import re
+from collections import OrderedDict
+
+from utilities import columnar_io, instrumentation
+from utilities.cardinality_sketch import DEFAULT_ERROR_RATE
+from utilities.csv_profiling import UniquesProfile, profile_uniques_mapped
+
+# rows checked by the first pass of key_is_unique. Each following pass checks twice as many rows
+KEY_CHECK_BLOCKSIZE = 100000
+
+# widened rows melted back to long form at a time
+MELT_CHUNKSIZE = 100000
+
+# name of a widened column holding a later value of a field: field_1, field_2, ...
+_WIDENED_FIELDNAME_PATTERN = re.compile(r'^(.*)_(\d+)$')
 
 class MultivaluedTable(object):
     """
@@ -24,7 +39,9 @@ class MultivaluedTable(object):
         return df_by_unique_key.set_index(keyfield)
 
     @staticmethod
-    def profile_uniques(dataframe, keyfield, fields_to_profile, casesensitive=False, outfile=None, debug_multiple_uniques=False):
+    @instrumentation.instrumented()
+    def profile_uniques(dataframe, keyfield, fields_to_profile, casesensitive=False, outfile=None, debug_multiple_uniques=False,
+                        approximate=False, error_rate=DEFAULT_ERROR_RATE):
         """
         Analyzes the max, min, and average number of unique values in a csv around a key field, grouped by each field
         specified in the input. (NaNs are not counted as values). Outputs these results to a csv if desired.
@@ -32,8 +49,12 @@ class MultivaluedTable(object):
         :param keyfield: string representing the column name of key column
         :param fields_to_profile: list of fieldnames identifying fields to provile
         :param casesensitive: currently does not do anything
-        :param outfile: path and name of file to write results to
+        :param outfile: path and name of file to write results to (csv, or Parquet/Arrow for a .parquet/.arrow
+        extension)
         :param debug_print_uniques: set to True to print out a list of uniques for all records that have >1 unique value
+        :param approximate: set to True to estimate the unique values per key with HyperLogLog sketches, in memory
+        bounded by the number of keys. Each field's stats then also hold "approximate": True and "relative_error"
+        :param error_rate: target relative standard error of the per-key counts in approximate mode
         :return: a nested dictionary {"fieldname1": {"max_uniques": 1, ... }, "fieldname2": {...} }
         """
 
@@ -41,19 +62,35 @@ class MultivaluedTable(object):
         header = ["field", "max_uniques", "avg_uniques", "min_uniques"]
         all_field_stats = dict()
 
+        # group by the key once and count distinct values of every field in a single aggregation. Equivalent to:
+        # SELECT keyfield, COUNT(distinct field1), COUNT(distinct field2), ... FROM table GROUP BY keyfield
+        # (observed=True keeps unused categories of a categorical key from being counted as keys)
+        grouped = dataframe.groupby(keyfield, observed=True)
+        if approximate:
+            profile = UniquesProfile(keyfield, fields_to_profile, approximate=True, error_rate=error_rate)
+            profile.update(dataframe)
+            counts_by_key = dict((field, profile.count_uniques_by_key(field)) for field in fields_to_profile)
+            header += ["approximate", "relative_error"]
+        else:
+            counts_by_key = MultivaluedTable._count_uniques_by_key(grouped, fields_to_profile)
+
         for field in fields_to_profile:
-            # Equivalent to: SELECT keyfield, COUNT(distinct field) FROM table GROUP BY keyfield
-            count_by_key = dataframe.groupby(keyfield)[field].nunique()
+            count_by_key = counts_by_key[field]
 
             # if user wants to debug, print output to stdout
             if debug_multiple_uniques:
-                uniques = dataframe.groupby(keyfield)[field].unique()
-                for idx, value in count_by_key.iteritems():
-                    if value>1: print("recordKey: " + str(idx) + ", values: " + str(uniques[idx]))
+                multiple_uniques = count_by_key[count_by_key > 1]
+                if len(multiple_uniques) > 0:
+                    uniques = grouped[field].unique()
+                    for idx, value in multiple_uniques.items():
+                        print("recordKey: " + str(idx) + ", values: " + str(uniques[idx]))
 
             fieldstats = {"max_uniques": count_by_key.max(),
                           "avg_uniques": count_by_key.mean(),
                           "min_uniques": count_by_key.min()}
+            if approximate:
+                fieldstats["approximate"] = True
+                fieldstats["relative_error"] = profile.relative_error
             all_field_stats[field] = fieldstats
 
             del fieldstats, count_by_key
@@ -61,33 +98,121 @@ class MultivaluedTable(object):
         if outfile is not None:
             # write results to an output file, overwriting any existing data
             print("writing to outfile at location: " + str(outfile))
-            with open(outfile, 'w') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=header)
-                writer.writeheader()
-                for key in all_field_stats:
-                    writer.writerow({"field": key,
-                                     "max_uniques": all_field_stats[key]["max_uniques"],
-                                     "avg_uniques": all_field_stats[key]["avg_uniques"],
-                                     "min_uniques": all_field_stats[key]["min_uniques"]})
+            rows = [dict(field=key, **all_field_stats[key]) for key in all_field_stats]
+            if columnar_io.format_for_path(outfile) != columnar_io.CSV:
+                # .parquet/.arrow outfiles are written as a columnar table
+                columnar_io.write_table(pd.DataFrame(rows, columns=header), outfile)
+            else:
+                with instrumentation.stage('write_profile_csv', rows=len(rows)), open(outfile, 'w') as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=header)
+                    writer.writeheader()
+                    for row in rows:
+                        writer.writerow(row)
 
         return all_field_stats
 
     @staticmethod
-    def widen_multivalues_into_additional_columns(orig_dataframe, keyfield, fields, limit=10):
+    def profile_uniques_mapped(path, keyfield, fields_to_profile, outfile=None):
+        """
+        Same as profile_uniques, reading the data from a memory-mapped Arrow IPC file or directory of per-column .npy
+        files instead of a dataframe (see csv_profiling.profile_uniques_mapped)
+        :return: a nested dictionary {"fieldname1": {"max_uniques": 1, ... }, "fieldname2": {...} }
+        """
+        all_field_stats = profile_uniques_mapped(path, keyfield, fields_to_profile, outfile=outfile)
+        return dict((fieldstats.pop("field"), fieldstats) for fieldstats in all_field_stats)
+
+    @staticmethod
+    @instrumentation.instrumented()
+    def diagnose_key(dataframe, keyfield, top_n=10):
+        """
+        Checks whether a key field is unique, and how keys repeat when it isn't, from a single factorize of the key
+        field (no groupby over the other fields, unlike profile_uniques). NaN keys are counted apart, not as a key.
+
+        :param keyfield: string representing the column name of key column
+        :param top_n: number of most repeated keys to return
+        :return: a dictionary {"rows": ..., "null_keys": ..., "distinct_keys": ..., "is_unique": ...,
+        "duplicate_keys": number of keys on more than one row, "rows_with_duplicate_keys": ...,
+        "max_rows_per_key": ..., "fan_out": series of the number of keys by number of rows per key,
+        "top_keys": series of the number of rows of the top_n most repeated keys (that repeat), most repeated first}
+        """
+        key_codes, keys = pd.factorize(dataframe[keyfield])
+        not_null = key_codes >= 0
+        rows_per_key = np.bincount(key_codes[not_null], minlength=len(keys))
+
+        repeated = np.flatnonzero(rows_per_key > 1)
+        # stable sort, so keys repeated as often come out in first-seen order
+        top = repeated[np.argsort(-rows_per_key[repeated], kind='mergesort')[:top_n]]
+
+        fan_out = np.bincount(rows_per_key)
+        fan_out_sizes = np.flatnonzero(fan_out)
+
+        return {"rows": len(key_codes),
+                "null_keys": int(len(key_codes) - not_null.sum()),
+                "distinct_keys": len(keys),
+                "is_unique": len(repeated) == 0,
+                "duplicate_keys": len(repeated),
+                "rows_with_duplicate_keys": int(rows_per_key[repeated].sum()),
+                "max_rows_per_key": int(rows_per_key.max()) if len(keys) else 0,
+                "fan_out": pd.Series(fan_out[fan_out_sizes], index=pd.Index(fan_out_sizes, name="rows_per_key"),
+                                     name="keys"),
+                # keys keep their dtype, rather than having pandas infer one from the values of object keys
+                "top_keys": pd.Series(rows_per_key[top],
+                                      index=pd.Index(keys.take(top), dtype=keys.dtype, name=keyfield), name="rows")}
+
+    @staticmethod
+    @instrumentation.instrumented()
+    def key_is_unique(dataframe, keyfield, blocksize=KEY_CHECK_BLOCKSIZE):
+        """
+        Checks whether no key appears on more than one row (NaN keys are ignored), stopping as soon as a repeated key
+        is found. Looks for duplicates in the first blocksize rows, then in twice as many rows, and so on, so a key
+        field that repeats early is rejected after reading a few rows, and a unique one costs at most about two passes.
+        :return: True if the key field is unique
+        """
+        if blocksize < 1:
+            raise ValueError('blocksize must be at least 1')
+
+        keys = dataframe[keyfield]
+        end = blocksize
+        while True:
+            if keys.iloc[:end].dropna().duplicated().any():
+                return False
+            if end >= len(keys):
+                return True
+            end *= 2
+
+    @staticmethod
+    def _count_uniques_by_key(grouped, fields):
+        """
+        :param grouped: DataFrameGroupBy, grouped by the key field
+        :param fields: list of fieldnames
+        :return: dataframe with one row per key and one column per distinct field, holding the number of unique non-NaN
+        values
+        """
+        if len(fields) == 0:
+            return pd.DataFrame()
+
+        # a repeated field would otherwise give duplicate columns
+        return grouped[list(dict.fromkeys(fields))].nunique()
+
+    @staticmethod
+    @instrumentation.instrumented()
+    def widen_multivalues_into_additional_columns(orig_dataframe, keyfield, fields, limit=10, copy=True):
         """ Profiles and then expands columns up to the specified limit, appending additional columns to the
         original dataset as necessary to accommodate multi-valued attributes
 
         :param fields: list of fieldnames to be widened
+        :param copy: if False, per-field results are concatenated without copying their data where pandas can avoid it.
+        Saves memory when widening many fields; the result must then be treated as a fresh dataframe that may share
+        memory with the per-field intermediates (which are not used again).
         """
 
         # profile the fields to determine max uniques by key. If max is 1 then is trivial
         uniques_profile_stats = MultivaluedTable.profile_uniques(orig_dataframe, keyfield, fields)
 
-        # initialize dataframe that holds only unique entity ids, which will be merged to create final dataframe
+        # initialize dataframe that holds only unique entity ids, whose index all widened fields are aligned on
         entity_ids = MultivaluedTable._generate_unique_key_dataframe(orig_dataframe, keyfield)
 
-        merged_dataframe = entity_ids.copy(deep=True)
-
+        dfs_to_join = []
         for field in fields:
             # trivial case of there being only one unique value or no unique values per key
             if uniques_profile_stats[field]['max_uniques'] <= 1:
@@ -95,10 +220,14 @@ class MultivaluedTable(object):
             else:
                 df_to_join = MultivaluedTable._widen_one_field(orig_dataframe, keyfield, field, uniques_profile_stats, limit)
 
-            # now merge (join) to uniques table
-            merged_dataframe = merged_dataframe.merge(df_to_join, left_index=True, right_index=True, how='left')
+            # align on the unique keys (equivalent to a left join onto the uniques table)
+            dfs_to_join.append(df_to_join.reindex(entity_ids.index))
+
+        if len(dfs_to_join) == 0:
+            return entity_ids
 
-        return merged_dataframe
+        # now join all fields in a single step, instead of repeatedly merging (and copying) a growing dataframe
+        return pd.concat(dfs_to_join, axis=1, copy=copy)
 
     @staticmethod
     def _unique_valued_field(orig_dataframe, keyfield, field):
@@ -112,9 +241,13 @@ class MultivaluedTable(object):
         return new_df
 
     @staticmethod
+    @instrumentation.instrumented()
     def _widen_one_field(orig_dataframe, keyfield, field, uniques_profile_stats, limit=10):
         """
-        Not very efficient, but does the job for now, especially since pandas pivot has bugs
+        Widens a multivalued field into up to limit columns named field, field_1, field_2, ... Each key's unique
+        non-NaN values fill the columns in the order they are first seen. Values are deduplicated, ranked within
+        their key and reshaped into columns in one vectorized operation, so there is no per-key Python loop.
+        Values keep their original type (they are no longer converted to strings).
         :param dataframe:
         :param keyfield:
         :param field:
@@ -124,39 +257,174 @@ class MultivaluedTable(object):
 
         max_uniques = uniques_profile_stats[field]['max_uniques']
 
-        uniques_by_key = orig_dataframe.groupby(keyfield)[field].unique()
-        num_uniques_by_key = orig_dataframe.groupby(keyfield)[field].nunique()
-
-        # create a series for each possible value up to the max num of uniques or the limit. These will represent
-        # the additional columns used to hold multi-values
+        # the additional columns used to hold multi-values go up to the max num of uniques or the limit
         max_columns = min(max_uniques, limit)
-        values_by_col = {}  # initialize an empty list that will hold dictionaries which will be converted to series
-        for i in range(0, max_columns):
-            if i == 0:
-                fieldname = field
-            else:
-                fieldname = field + "_" + str(i)
 
-            values_by_col[fieldname] = {}  # initialize empty dicts, each dict will have unique series keys as its keys
+        # factorize keys and values once; all of the work below happens on integer codes.
+        # keys are sorted so rows come out in the same order as groupby. NaN keys and values get code -1.
+        key_codes, all_keys = pd.factorize(orig_dataframe[keyfield], sort=True)
+        value_codes, unique_values = pd.factorize(orig_dataframe[field])
+
+        not_null = (key_codes >= 0) & (value_codes >= 0)
+        key_codes = key_codes[not_null]
+        value_codes = value_codes[not_null]
+
+        # deduplicate (key, value) pairs, keeping the first occurrence so values stay in first-seen order
+        is_first = ~pd.Series(key_codes.astype(np.int64) * len(unique_values) + value_codes).duplicated().values
+        key_codes = key_codes[is_first]
+        value_codes = value_codes[is_first]
+
+        # rank each value within its key: position in a stable sort by key, minus the position where that key starts
+        order = np.argsort(key_codes, kind='mergesort')
+        sorted_keys = key_codes[order]
+        group_starts = np.r_[0, np.flatnonzero(np.diff(sorted_keys)) + 1]
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(order)]))
+
+        # scatter value codes into a keys x columns grid, then turn each column of codes back into values
+        within_limit = ranks < max_columns
+        wide_codes = np.full((len(all_keys), max_columns), -1, dtype=np.int64)
+        wide_codes[key_codes[within_limit], ranks[within_limit]] = value_codes[within_limit]
+
+        new_df = pd.DataFrame(dict((MultivaluedTable._widened_fieldname(field, i),
+                                    MultivaluedTable._take_with_nans(unique_values, wide_codes[:, i]))
+                                   for i in range(max_columns)),
+                              index=all_keys,
+                              columns=[MultivaluedTable._widened_fieldname(field, i) for i in range(max_columns)])
+        new_df.index.name = keyfield    # set index name
 
-        for idx, val in uniques_by_key.iteritems():
-            # remove NaNs from consideration within each array of unique values when populating columns
-            # otherwise you can get NaNs populated first instead of actual values
-            # numpy arrays don't do well with object data types, so hacky conversion to list of strings for now
-            unique_values= [x for x in val.astype('str').tolist() if x != 'nan']
+        return new_df
 
-            for i in range(0, max_columns):
-                if i == 0:
-                    fieldname = field
-                else:
-                    fieldname = field + "_" + str(i)
+    @staticmethod
+    def _take_with_nans(unique_values, codes):
+        """ maps codes back to values, with NaN wherever the code is -1 (integer and boolean values are upcast to hold it,
+        as pandas does when reindexing) """
+        # Index.take refuses to fill integer indexes, so take from the underlying array instead
+        return pd.Index(unique_values).array.take(codes, allow_fill=True)
 
-                if i < num_uniques_by_key[idx]:
-                    values_by_col[fieldname][idx] = unique_values[i]
-                else:
-                    values_by_col[fieldname][idx] = np.nan
+    @staticmethod
+    def _widened_fieldname(field, position):
+        """ the first value keeps the original fieldname, later values get a _1, _2, ... suffix """
+        if position == 0:
+            return field
+        else:
+            return field + "_" + str(position)
 
-        new_df = pd.DataFrame(values_by_col)
-        new_df.index.name = keyfield    # set index name
+    @staticmethod
+    def widened_column_families(columns):
+        """
+        Groups the columns of a widened dataframe by the field they were widened from, using the naming of
+        _widened_fieldname: field_1, field_2, ... belong to field when a column named field exists. Every other column
+        is a family of its own.
+        :param columns: list of column names
+        :return: ordered dict {field: [field, field_1, field_2, ...]}, in the order of the fields' columns
+        """
+        columns = list(columns)
+        positions_by_field = dict()
+        for column in columns:
+            match = _WIDENED_FIELDNAME_PATTERN.match(str(column))
+            if match is not None and match.group(1) in columns:
+                positions_by_field.setdefault(match.group(1), []).append((int(match.group(2)), column))
+
+        families = OrderedDict()
+        for column in columns:
+            match = _WIDENED_FIELDNAME_PATTERN.match(str(column))
+            if match is not None and match.group(1) in columns:
+                continue
+            families[column] = [column] + [suffixed for _, suffixed in sorted(positions_by_field.get(column, []))]
+        return families
 
-        return new_df
\ No newline at end of file
+    @staticmethod
+    def iter_melted_chunks(widened, keyfield=None, fields=None, chunksize=MELT_CHUNKSIZE):
+        """
+        Inverse of widen_multivalues_into_additional_columns: turns each widened column family back into one
+        (key, field, value) row per non-NaN value, chunksize widened rows at a time. Only the values that are present
+        are gathered, so the NaN padding of the widened columns is never expanded into rows.
+        Rows come out by key, then field, then position within the family (i.e., the values' first-seen order).
+
+        :param widened: widened dataframe, with the keys as index (as returned by widen_multivalues_into_additional_columns)
+        :param keyfield: optional name of a column holding the keys, to use instead of the index
+        :param fields: optional list of the fields to melt. Defaults to every column family (see widened_column_families)
+        but the keyfield
+        :return: iterator of dataframes with the columns keyfield (the index name, or 'key' if it has none), 'field'
+        (categorical) and 'value'
+        """
+        if chunksize < 1:
+            raise ValueError('chunksize must be at least 1')
+
+        families = MultivaluedTable._melted_families(widened, keyfield, fields)
+        key_name = MultivaluedTable._melted_key_name(widened, keyfield)
+        all_keys = widened.index if keyfield is None else pd.Index(widened[keyfield])
+
+        for start in range(0, len(widened), chunksize):
+            chunk = widened.iloc[start:start + chunksize]
+
+            rows, family_codes, ranks, values = [], [], [], []
+            for family_code, columns in enumerate(families.values()):
+                for rank, column in enumerate(columns):
+                    present = np.flatnonzero(chunk[column].notnull().values)
+                    rows.append(present)
+                    family_codes.append(np.full(len(present), family_code, dtype=np.int64))
+                    ranks.append(np.full(len(present), rank, dtype=np.int64))
+                    values.append(chunk[column].iloc[present].reset_index(drop=True))
+
+            rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+            family_codes = np.concatenate(family_codes) if family_codes else np.array([], dtype=np.int64)
+            order = np.lexsort((np.concatenate(ranks) if ranks else rows, family_codes, rows))
+
+            yield pd.DataFrame({key_name: all_keys[start:start + chunksize].take(rows[order]),
+                                'field': pd.Categorical.from_codes(family_codes[order], categories=list(families)),
+                                'value': (pd.concat(values, ignore_index=True).take(order).values if values
+                                          else np.array([], dtype=object))},
+                               columns=[key_name, 'field', 'value'])
+
+    @staticmethod
+    @instrumentation.instrumented()
+    def melt_widened_columns(widened, keyfield=None, fields=None, chunksize=MELT_CHUNKSIZE, outfile=None):
+        """
+        Collapses widened column families back into long (key, field, value) form, chunk by chunk (see
+        iter_melted_chunks).
+        :param outfile: optional path to write the long rows to one chunk at a time (csv, or Parquet/Arrow for a
+        .parquet/.arrow extension) instead of returning them. A Parquet/Arrow column has a single type, so when the
+        melted columns don't all have the same dtype (or hold python objects), values are written as strings
+        :return: dataframe with the columns keyfield, 'field' and 'value', or the number of rows written if outfile is
+        specified
+        """
+        chunks = MultivaluedTable.iter_melted_chunks(widened, keyfield=keyfield, fields=fields, chunksize=chunksize)
+
+        if outfile is not None:
+            # decided from the widened columns rather than per chunk, so every chunk gets the same schema
+            value_dtypes = set(widened[column].dtype for columns in
+                               MultivaluedTable._melted_families(widened, keyfield, fields).values()
+                               for column in columns)
+            values_as_strings = columnar_io.format_for_path(outfile) != columnar_io.CSV and \
+                (len(value_dtypes) > 1 or any(dtype == object for dtype in value_dtypes))
+
+            with columnar_io.ChunkWriter(outfile) as writer:
+                for chunk in chunks:
+                    if values_as_strings:
+                        chunk['value'] = chunk['value'].astype(str)
+                    writer.write(chunk)
+                return writer.rows_written
+
+        chunks = list(chunks)
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=[MultivaluedTable._melted_key_name(widened, keyfield), 'field', 'value'])
+        return pd.concat(chunks, ignore_index=True)
+
+    @staticmethod
+    def _melted_families(widened, keyfield, fields):
+        """ :return: ordered dict {field: [field, field_1, ...]} of the column families to melt """
+        families = MultivaluedTable.widened_column_families(widened.columns)
+        families.pop(keyfield, None)
+        if fields is not None:
+            families = OrderedDict((field, families[field]) for field in fields)
+        return families
+
+    @staticmethod
+    def _melted_key_name(widened, keyfield):
+        if keyfield is not None:
+            return keyfield
+        if widened.index.name is not None:
+            return widened.index.name
+        return 'key'
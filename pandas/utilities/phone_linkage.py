@@ -0,0 +1,182 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from utilities import instrumentation
+
+""" Record linkage on phone numbers cleaned by clean_phone_numbers: records that share a phone number (directly, or
+through a chain of records) get the same cluster id. Records are grouped through a hash index from number to records,
+so linking costs about one dictionary lookup per phone value instead of a pairwise merge. Numbers shared by too many
+records (switchboards, "000-000-0000") would chain unrelated customers together, so they are left out of the linking.
+
+Example:
+    clean_phone_numbers(customers, 'Phone', newField='phone_e164', region_string='US', output_format='e164')
+    index = PhoneLinkageIndex(max_bucket_size=50)
+    customers['cluster'] = index.add(customers, ['phone_e164'], id_field='Customer ID')
+    index.save('customers.linkage')
+"""
+
+
+# records sharing a number beyond which the number is not used for linking
+DEFAULT_MAX_BUCKET_SIZE = 100
+
+class PhoneLinkageIndex(object):
+    """
+    Hash index from phone number to the records that have it, which clusters records sharing numbers. New batches can
+    be added to an existing index (e.g., one loaded from disk), and are linked to the records already in it.
+    Numbers are matched by equality, so every batch should be cleaned to the same output format.
+    Clusters are kept as a union-find forest over the records, so adding a batch only links the batch's records: its
+    cost doesn't grow with the records already in the index.
+    """
+    def __init__(self, max_bucket_size=DEFAULT_MAX_BUCKET_SIZE):
+        """
+        :param max_bucket_size: numbers shared by more records than this are not used for linking (None for no limit).
+        Their records are only dropped from the index's bucket, so memory stays bounded by max_bucket_size per number.
+        Links a number made in earlier batches, before it exceeded max_bucket_size, are kept, so clusters returned
+        earlier are never split: the number only stops linking the records added from then on
+        """
+        if max_bucket_size is not None and max_bucket_size < 2:
+            raise ValueError('max_bucket_size must be at least 2')
+
+        self.max_bucket_size = max_bucket_size
+        self._n_records = 0
+        # id of every record (and spare capacity), grown along with _parents
+        self._record_ids = np.array([], dtype=object)
+        self._buckets = dict()      # number -> positions of the records that have it, in insertion order
+        self._oversized = dict()    # number -> number of records that have it, once it exceeds max_bucket_size
+        # union-find parent of every record (and identity spare capacity). A parent is never after its record, so the
+        # root of every cluster is its earliest record
+        self._parents = np.array([], dtype=np.int64)
+
+    def __len__(self):
+        """ number of records added """
+        return self._n_records
+
+    @instrumentation.instrumented('PhoneLinkageIndex.add')
+    def add(self, dataframe, phone_fields, id_field=None):
+        """
+        Adds every row of a dataframe as a record, indexed under the non-null values of its phone fields.
+        :param phone_fields: list of fieldnames holding cleaned phone numbers (e.g., home and work phones). Records are
+        linked when any of their numbers match
+        :param id_field: optional fieldname holding record ids. Defaults to the dataframe's index
+        :return: series of the cluster id of every row, aligned with the dataframe
+        """
+        if isinstance(phone_fields, str):
+            phone_fields = [phone_fields]
+
+        start = self._n_records
+        self._n_records += len(dataframe)
+        self._reserve(self._n_records)
+        record_ids = dataframe.index if id_field is None else dataframe[id_field]
+        self._record_ids[start:self._n_records] = np.asarray(record_ids, dtype=object)
+
+        positions = np.arange(start, start + len(dataframe), dtype=np.int64)
+        numbers = pd.concat([pd.DataFrame({'number': dataframe[field].values, 'position': positions})
+                             for field in phone_fields], ignore_index=True)
+        # a record with the same number in several fields only counts once towards the number's bucket
+        numbers = numbers.dropna(subset=['number']).drop_duplicates()
+
+        codes, distinct_numbers = pd.factorize(numbers['number'])
+        order = np.argsort(codes, kind='mergesort')
+        group_starts = np.flatnonzero(np.diff(codes[order])) + 1
+        number_positions = numbers['position'].values[order]
+
+        first_records, other_records = [], []
+        for number, group in zip(distinct_numbers.tolist(), np.split(number_positions, group_starts)
+                                 if len(order) else []):
+            first_record = self._add_to_bucket(number, group.tolist())
+            if first_record is not None:
+                first_records.append(np.full(len(group), first_record, dtype=np.int64))
+                other_records.append(group)
+
+        if first_records:
+            _union(self._parents, np.concatenate(first_records), np.concatenate(other_records))
+
+        return pd.Series(self._record_ids[_roots(self._parents, positions)], index=dataframe.index).infer_objects()
+
+    def cluster_ids(self):
+        """
+        Clusters all the records added so far. Each cluster is identified by the id of its earliest added record, so
+        existing clusters keep their id unless a new batch merges them.
+        :return: series of cluster ids, indexed by record id
+        """
+        record_ids = pd.Index(self._record_ids[:self._n_records])
+        roots = _roots(self._parents, np.arange(self._n_records, dtype=np.int64))
+        # point every record straight at its root, so later lookups take a single step
+        self._parents[:len(roots)] = roots
+        return pd.Series(record_ids.take(roots), index=record_ids)
+
+    def oversized_numbers(self):
+        """ :return: series of the number of records of every number left out of linking, largest first """
+        return pd.Series(self._oversized, dtype=np.int64).sort_values(ascending=False, kind='mergesort')
+
+    def save(self, path):
+        """ write the index to disk, overwriting any existing file """
+        with open(path, 'wb') as picklefile:
+            pickle.dump(self, picklefile, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """ load an index written by save """
+        with open(path, 'rb') as picklefile:
+            index = pickle.load(picklefile)
+
+        if not isinstance(index, PhoneLinkageIndex):
+            raise TypeError(str(path) + ' does not contain a PhoneLinkageIndex')
+        return index
+
+    def _add_to_bucket(self, number, positions):
+        """
+        :return: position of the first record of the number's bucket, or None if the number isn't used for linking
+        """
+        if number in self._oversized:
+            self._oversized[number] += len(positions)
+            return None
+
+        bucket = self._buckets.setdefault(number, [])
+        bucket.extend(positions)
+        if self.max_bucket_size is not None and len(bucket) > self.max_bucket_size:
+            self._oversized[number] = len(bucket)
+            del self._buckets[number]
+            return None
+        return bucket[0]
+
+    def _reserve(self, n_records):
+        """ grows the parent and id arrays to hold n_records, doubling their capacity so batches are amortized """
+        capacity = len(self._parents)
+        if n_records > capacity:
+            parents = np.arange(max(n_records, 2 * capacity), dtype=np.int64)
+            parents[:capacity] = self._parents
+            self._parents = parents
+
+            record_ids = np.empty(len(parents), dtype=object)
+            record_ids[:capacity] = self._record_ids
+            self._record_ids = record_ids
+
+def _roots(parents, records):
+    """ :return: numpy array of the root of every record of a union-find forest, compressing the records' paths """
+    roots = parents[records]
+    while True:
+        grandparents = parents[roots]
+        if np.array_equal(grandparents, roots):
+            parents[records] = roots
+            return roots
+        roots = grandparents
+
+def _union(parents, first_records, other_records):
+    """
+    Merges the clusters at each end of every link, in place, by repeatedly hooking the root of each end onto the
+    smaller of the two roots. Each pass is linear in the number of links still joining different clusters, whatever
+    the size of the forest.
+    """
+    while True:
+        first_roots, other_roots = _roots(parents, first_records), _roots(parents, other_records)
+        unmerged = first_roots != other_roots
+        if not unmerged.any():
+            return
+
+        first_records, other_records = first_roots[unmerged], other_roots[unmerged]
+        lowest_roots = np.minimum(first_records, other_records)
+        np.minimum.at(parents, first_records, lowest_roots)
+        np.minimum.at(parents, other_records, lowest_roots)
@@ -1,13 +1,207 @@
+import phonenumbers
 from phonenumbers import phonenumberutil
+from phonenumbers.phonemetadata import PhoneMetadata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
+import sqlite3
 import numpy as np
 import pandas as pd
 
+from utilities import instrumentation
+
 """ Wrapper functions around Python port of Google Phone Number Library to work across dataframes """
 
 
 # values ignored for validation and cleaning.
 IGNORED_VALUES = [None, np.nan]
 
+# number of chunks handed to each worker when cleaning in parallel, so slow chunks don't leave workers idle
+CHUNKS_PER_JOB = 4
+
+# possible outcomes of validating a single phone number
+PHONE_VALID = 'valid'
+PHONE_INVALID = 'invalid'
+PHONE_PARSE_ERROR = 'parse_error'
+
+# instrumentation counter names for each outcome
+_STATUS_COUNTERS = {PHONE_VALID: 'phone_valid',
+                    PHONE_INVALID: 'phone_invalid',
+                    PHONE_PARSE_ERROR: 'phone_parse_failures'}
+
+# small integer code of each outcome, written to the status field. Null values are not validated and get
+# STATUS_CODE_NULL
+STATUS_CODE_NULL = 0
+PHONE_STATUS_CODES = {PHONE_VALID: 1,
+                      PHONE_INVALID: 2,
+                      PHONE_PARSE_ERROR: 3}
+
+# output formats of clean_phone_numbers. NATIONAL writes the national number as a string; E164 writes a nullable
+# int64 column, which takes 9 bytes per row instead of a python string object; COMPONENTS writes the country code as
+# a nullable int64 column and the national significant number as a string, which keeps its leading zeros
+OUTPUT_NATIONAL = 'national'
+OUTPUT_E164 = 'e164'
+OUTPUT_COMPONENTS = 'components'
+COUNTRY_CODE_SUFFIX = '_country_code'
+NATIONAL_NUMBER_SUFFIX = '_national_number'
+
+# reasons the prefilter rejects a value without parsing it. The library fails to parse all of these, so they get the
+# same outcome as any other parse error
+PREFILTER_TOO_FEW_DIGITS = 'too_few_digits'
+PREFILTER_TOO_LONG = 'too_long'
+
+# the library needs at least 2 digits to consider a string a phone number, and refuses strings over 250 characters
+PREFILTER_MIN_DIGITS = 2
+PREFILTER_MAX_LENGTH = 250
+
+# private helper behind phonenumberutil.is_valid_number_for_region that takes a region's metadata directly. It isn't
+# part of the library's API, so versions without it fall back to the public function
+_number_type_helper = getattr(phonenumberutil, '_number_type_helper', None)
+
+class PhoneParseCache(object):
+    """
+    Bounded LRU cache sitting in front of phone number parsing/validation. Results are keyed on the
+    (normalized raw value, region) pair, so a value that repeats many times in a column (switchboard numbers,
+    placeholders like "000-000-0000") is only parsed once while it stays in the cache.
+    Pass an instance to clean_phone_numbers (batch mode) and read hit/miss statistics back with stats().
+    The same instance can be reused across several calls or dataframes.
+    """
+    def __init__(self, maxsize=100000):
+        """
+        :param maxsize: maximum number of distinct (value, region) results to hold. Least recently used results are
+        evicted first once the cache is full.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    @staticmethod
+    def normalize_key(value, region):
+        """ leading/trailing whitespace does not change how a number parses, so it is stripped from the key """
+        return str(value).strip(), region
+
+    def validate(self, value, region):
+        """
+        Cached equivalent of _validate_phone
+        :return: (status, national_number, e164)
+        """
+        key = self.normalize_key(value, region)
+
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        self.misses += 1
+        result = _validate_phone(key[0], region)
+        self._results[key] = result
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+        return result
+
+    def stats(self):
+        """
+        :return: dict with hits, misses, hit_ratio, the current number of cached results and maxsize
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": float(self.hits) / lookups if lookups else 0.0,
+                "size": len(self._results),
+                "maxsize": self.maxsize}
+
+    def clear(self):
+        """ drop all cached results and reset statistics """
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+class PhoneResultStore(object):
+    """
+    SQLite file holding validation results across runs, keyed on the (normalized raw value, region) pair and the
+    version of the phonenumbers library (whose metadata decides the results). Results of an older library version
+    are deleted when the store is opened, so a library upgrade re-validates everything once.
+    Pass an instance to clean_phone_numbers (batch mode): values already in the store are not parsed again, and new
+    results are added to it.
+
+    Example:
+        with PhoneResultStore('phone_results.sqlite') as store:
+            clean_phone_numbers(customers, 'Phone', region_string='US', result_store=store)
+    """
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite file, created if it does not exist
+        """
+        self.path = path
+        self.version = phonenumbers.__version__
+        self._connection = sqlite3.connect(path)
+
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS store_metadata (key TEXT PRIMARY KEY, value TEXT)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results (value TEXT, region TEXT, version TEXT, '
+                                     'status TEXT, national_number INTEGER, e164 INTEGER, '
+                                     'PRIMARY KEY (value, region, version)) WITHOUT ROWID')
+
+            stored_version = self._connection.execute("SELECT value FROM store_metadata "
+                                                      "WHERE key = 'phonenumbers_version'").fetchone()
+            if stored_version is None or stored_version[0] != self.version:
+                self._connection.execute('DELETE FROM results')
+                self._connection.execute("INSERT OR REPLACE INTO store_metadata VALUES ('phonenumbers_version', ?)",
+                                         (self.version,))
+
+    def lookup(self, keys):
+        """
+        :param keys: iterable of (normalized value, region) pairs, as PhoneParseCache.normalize_key
+        :return: dict of the stored (status, national_number, e164) result of each key found in the store
+        """
+        with self._connection:
+            self._connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup_keys (value TEXT, region TEXT)')
+            self._connection.execute('DELETE FROM lookup_keys')
+            self._connection.executemany('INSERT INTO lookup_keys VALUES (?, ?)',
+                                         ((value, _region_column(region)) for value, region in keys))
+            rows = self._connection.execute('SELECT results.value, results.region, status, national_number, e164 '
+                                            'FROM lookup_keys JOIN results ON results.value = lookup_keys.value '
+                                            'AND results.region = lookup_keys.region AND results.version = ?',
+                                            (self.version,)).fetchall()
+
+        return dict(((value, region or None), (status, national_number, e164))
+                    for value, region, status, national_number, e164 in rows)
+
+    def store(self, results):
+        """
+        :param results: dict of (status, national_number, e164) results by (normalized value, region) pair
+        """
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                         ((value, _region_column(region), self.version) + tuple(result)
+                                          for (value, region), result in results.items()))
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def _region_column(region):
+    """ NULLs never match in SQL, so a missing region is stored as an empty string """
+    return region if region is not None else ''
+
 def print_supported_regions():
     """
     print to stdout a list of supported region code abbreviations
@@ -16,7 +210,8 @@ def print_supported_regions():
     print(phonenumberutil.SUPPORTED_REGIONS)
 
 def clean_phone_numbers(dataframe, phonenum_field, newField=None, region_string=None, region_field=None,
-                use_orig_on_error=False):
+                use_orig_on_error=False, batch=True, parse_cache=None, n_jobs=1, executor=None, prefilter=False,
+                output_format=OUTPUT_NATIONAL, status_field=None, result_store=None):
     """
     Uses python port of Google PhoneNumLib to clean and format phone numbers within a dataframe
     see: https://github.com/daviddrysdale/python-phonenumbers
@@ -32,9 +227,55 @@ def clean_phone_numbers(dataframe, phonenum_field, newField=None, region_string=
     and if that fails, fall back on the region_string
     :param use_orig_on_error: what to do if an exception is encountered for that record. If true, paste the original record's value.
     If false, nullify value.
+    :param batch: if True (default), collect values and regions into arrays, clean them in one loop and write the
+    result column in a single assignment. If False, clean and write one row at a time (much slower on large dataframes).
+    Both modes give the same output.
+    :param parse_cache: optional PhoneParseCache. If provided (batch mode only), repeated (value, region) pairs are
+    only parsed once, and hit/miss statistics are collected on the cache.
+    :param n_jobs: number of worker processes to clean phone numbers with (batch mode only). The dataframe is split into
+    chunks that are cleaned in a process pool and stitched back together in the original row order. -1 uses all CPUs.
+    When a parse_cache is given, each chunk is cleaned with its own cache of the same size and the hit/miss counts
+    are added to parse_cache, but cached results are not shared between processes.
+    :param executor: optional concurrent.futures.Executor to submit chunks to instead of creating a process pool.
+    Its workers are used as given; n_jobs then only controls how many chunks the data is split into.
+    :param prefilter: if True (batch mode only), values that can't be phone numbers (fewer than 2 digits or too long;
+    see prefilter_phone_values) skip the parser and get the parse error outcome directly. Doesn't change the output,
+    but rejected values don't reach parse_cache, so they aren't counted in its statistics. The number of values
+    rejected for each reason is counted as 'phone_prefiltered_<reason>' when instrumentation is enabled.
+    :param output_format: how valid numbers are written (batch mode only):
+        OUTPUT_NATIONAL (default): the national number as a string, e.g. '4165938570'
+        OUTPUT_E164: the E.164 number as a nullable int64 (Int64) column, e.g. 14165938570 for +14165938570.
+        Leading zeros of the national number (e.g., Italian fixed lines) are kept, after the country code
+        OUTPUT_COMPONENTS: two columns, <field>_country_code (nullable int64) and <field>_national_number, where
+        <field> is newField (or phonenum_field when cleaning in place). The national number is the national significant
+        number as a string, so leading zeros are kept (e.g., '0212345678' for +39 02 1234 5678). phonenum_field itself
+        is left untouched
+    Integer output can't hold original values, so it can't be combined with use_orig_on_error.
+    :param status_field: optional name of a field to write the outcome of every row to, as an int8 code (batch mode
+    only): PHONE_STATUS_CODES maps PHONE_VALID, PHONE_INVALID and PHONE_PARSE_ERROR to their codes, and null values
+    get STATUS_CODE_NULL
+    :param result_store: optional PhoneResultStore (batch mode only). Each distinct (value, region) pair is looked up
+    in the store first, and only the pairs that aren't in it are validated (through parse_cache, and in n_jobs
+    processes, if given) and added to it. The number of distinct pairs found and not found are counted as
+    'phone_store_hits' and 'phone_store_misses' when instrumentation is enabled.
     :return: None (modifies orig data frame)
     """
 
+    if parse_cache is not None and not batch:
+        raise ValueError("parse_cache is only supported in batch mode")
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError("n_jobs must be a positive number of processes, or -1 to use all CPUs")
+    if (n_jobs != 1 or executor is not None) and not batch:
+        raise ValueError("n_jobs and executor are only supported in batch mode")
+    if result_store is not None and not batch:
+        raise ValueError("result_store is only supported in batch mode")
+    if output_format not in (OUTPUT_NATIONAL, OUTPUT_E164, OUTPUT_COMPONENTS):
+        raise ValueError("unknown output_format: " + str(output_format))
+    if (output_format != OUTPUT_NATIONAL or status_field is not None) and not batch:
+        raise ValueError("output_format and status_field are only supported in batch mode")
+    if output_format != OUTPUT_NATIONAL and use_orig_on_error:
+        raise ValueError("use_orig_on_error can only be used with the national output format")
+
     if (region_string is None and region_field is None):
         raise ValueError(
             "either country_code_string or country_code_field must be specified so phone validator knows what country to use.")
@@ -44,9 +285,7 @@ def clean_phone_numbers(dataframe, phonenum_field, newField=None, region_string=
               "so if no valid region code is found, will default to the region_string")
         category = 'both_string_and_field'
 
-        regions_list = dataframe[region_field].unique().tolist()
-        regions_list.remove(np.nan)
-        regions = set(regions_list)
+        regions = set(dataframe[region_field].dropna().unique().tolist())
         regions.add(region_string)
     elif (region_string is not None and region_field is None):
         category = 'only_region_string'
@@ -55,22 +294,38 @@ def clean_phone_numbers(dataframe, phonenum_field, newField=None, region_string=
     elif (region_string is None and region_field is not None):
         category = "only_region_field"
 
-        regions_list = dataframe[region_field].unique().tolist()
-        regions_list.remove(np.nan)
-        regions = set(regions_list)
+        regions = set(dataframe[region_field].dropna().unique().tolist())
 
     # verify that all specified regions are supported. Note that this does not fix any incorrect casings in the orig data
     is_valid_regions, list_of_invalid_regions = _regions_are_supported(regions)
     if not is_valid_regions:
         raise ValueError('Your following specified regions are not supported: ' + str(list_of_invalid_regions))
 
-    # if newField is specified, check if it already exists in dataframe. If not, initialize it.
-    _initialize_col_if_not_present(dataframe, newField)
+    # if newField is specified, check if it already exists in dataframe. If not, initialize it. Integer output columns
+    # are written whole, so they don't need initializing
+    if output_format == OUTPUT_NATIONAL:
+        _initialize_col_if_not_present(dataframe, newField)
 
     # now iterate through rows and clean phone numbers
-    _clean_phone_for_rows(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
-                          region_string=region_string, region_field=region_field, use_orig_on_error=use_orig_on_error,
-                          category=category)
+    if batch:
+        with instrumentation.stage('_clean_phone_batch', rows=len(dataframe)) as phone_stage:
+            if parse_cache is not None:
+                hits_before, misses_before = parse_cache.hits, parse_cache.misses
+
+            _clean_phone_batch(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
+                               region_string=region_string, region_field=region_field,
+                               use_orig_on_error=use_orig_on_error, category=category, parse_cache=parse_cache,
+                               n_jobs=n_jobs, executor=executor, prefilter=prefilter,
+                               output_format=output_format, status_field=status_field, result_store=result_store)
+
+            if parse_cache is not None:
+                phone_stage.count('phone_cache_hits', parse_cache.hits - hits_before)
+                phone_stage.count('phone_cache_misses', parse_cache.misses - misses_before)
+    else:
+        with instrumentation.stage('_clean_phone_for_rows', rows=len(dataframe)):
+            _clean_phone_for_rows(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
+                                  region_string=region_string, region_field=region_field,
+                                  use_orig_on_error=use_orig_on_error, category=category)
 
 def _initialize_col_if_not_present(dataframe, newField):
     """
@@ -131,12 +386,15 @@ def _clean_phone_for_rows(dataframe, phonenum_field, newField, region_string, re
 
                 # update with validated, formatted phone number, or nullify as NaN
                 if phonenumberutil.is_valid_number_for_region(phonenum, region):
+                    instrumentation.count(_STATUS_COUNTERS[PHONE_VALID])
                     _update_element(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
                                     index=idx, replacement_value=phonenum.national_number)
                 else:
+                    instrumentation.count(_STATUS_COUNTERS[PHONE_INVALID])
                     _update_element(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
                                     index=idx, replacement_value=np.nan)
             except:
+                instrumentation.count(_STATUS_COUNTERS[PHONE_PARSE_ERROR])
                 # update value as NaN or paste original value
                 if use_orig_on_error:
                     _update_element(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
@@ -145,6 +403,480 @@ def _clean_phone_for_rows(dataframe, phonenum_field, newField, region_string, re
                     _update_element(dataframe=dataframe, phonenum_field=phonenum_field, newField=newField,
                                     index=idx, replacement_value=np.nan)
 
+def _clean_phone_batch(dataframe, phonenum_field, newField, region_string, region_field, use_orig_on_error, category,
+                       parse_cache=None, n_jobs=1, executor=None, prefilter=False, output_format=OUTPUT_NATIONAL,
+                       status_field=None, result_store=None):
+    """
+    Batch equivalent of _clean_phone_for_rows. Pulls phone values and resolved regions out of the dataframe as arrays,
+    cleans them in one loop and writes the whole result column back in a single assignment, instead of paying for
+    pandas label indexing on every row.
+    Assumes region values have already been validated as supported region abbreviations.
+    :return: None (modifies input dataframe in place)
+    """
+
+    if not dataframe[phonenum_field].index.is_unique:
+        raise IndexError('indexes/keys in dataframe must be unique per row for this function to work correctly!')
+
+    # outcomes are only tallied when someone is collecting them
+    status_counts = dict() if instrumentation.is_enabled() else None
+
+    values = dataframe[phonenum_field].values
+    rejected_positions, rejected_cleaned = [], []
+    if prefilter:
+        values, rejected_positions, rejected_cleaned = _apply_prefilter(values, use_orig_on_error, status_counts)
+
+    regions = _resolve_regions(dataframe, region_string, region_field, category)
+    if result_store is not None:
+        positions, cleaned, status_codes = _clean_phone_values_with_store(values, regions, use_orig_on_error,
+                                                                          result_store, output_format=output_format,
+                                                                          parse_cache=parse_cache, n_jobs=n_jobs,
+                                                                          executor=executor,
+                                                                          status_counts=status_counts)
+    elif n_jobs == 1 and executor is None:
+        positions, cleaned, status_codes = _clean_phone_values(values, regions, use_orig_on_error,
+                                                               output_format=output_format, parse_cache=parse_cache,
+                                                               status_counts=status_counts)
+    else:
+        positions, cleaned, status_codes = _clean_phone_values_parallel(values, regions, use_orig_on_error,
+                                                                        n_jobs=n_jobs, executor=executor,
+                                                                        output_format=output_format,
+                                                                        parse_cache=parse_cache,
+                                                                        status_counts=status_counts)
+    status_codes = [PHONE_STATUS_CODES[PHONE_PARSE_ERROR]] * len(rejected_positions) + status_codes
+    positions = rejected_positions + positions
+    cleaned = rejected_cleaned + cleaned
+
+    if status_counts is not None:
+        for status, amount in status_counts.items():
+            instrumentation.count(_STATUS_COUNTERS[status], amount)
+
+    if newField is not None:
+        output_field = newField
+    else:
+        output_field = phonenum_field
+
+    if output_format == OUTPUT_NATIONAL:
+        _write_cleaned_values(dataframe, output_field, positions, cleaned)
+    elif output_format == OUTPUT_E164:
+        dataframe[output_field] = _integer_column(len(dataframe), positions, cleaned)
+    else:
+        country_codes, national_numbers = _split_components(cleaned)
+        dataframe[output_field + COUNTRY_CODE_SUFFIX] = _integer_column(len(dataframe), positions, country_codes)
+        dataframe[output_field + NATIONAL_NUMBER_SUFFIX] = _string_column(len(dataframe), positions,
+                                                                          national_numbers)
+
+    if status_field is not None:
+        column = np.full(len(dataframe), STATUS_CODE_NULL, dtype=np.int8)
+        column[positions] = status_codes
+        dataframe[status_field] = column
+
+def prefilter_phone_values(values):
+    """
+    Cheap, vectorized check for values that can't be phone numbers, based on their digit count and length, so they
+    don't have to go through the parser. Only rejects values that the parser would fail on too.
+    Example: pd.Series(prefilter_phone_values(df['phone'].values)).value_counts() counts the values rejected per reason
+    :param values: array-like of raw phone values
+    :return: numpy object array with, for every value, the reason it is rejected (PREFILTER_TOO_FEW_DIGITS or
+    PREFILTER_TOO_LONG), or None if it is plausible or null
+    """
+    values = np.asarray(values, dtype=object)
+    reasons = np.full(len(values), None, dtype=object)
+
+    candidates = np.flatnonzero(np.fromiter((value not in IGNORED_VALUES for value in values), dtype=bool,
+                                            count=len(values)))
+    if len(candidates) == 0:
+        return reasons
+
+    # the character checks only run once per distinct (stripped) string
+    codes, texts = pd.factorize(pd.Series(values[candidates]).astype(str).str.strip())
+    texts = pd.Series(texts, dtype=object)
+    digit_counts = texts.str.count(r'\d').values
+
+    distinct_reasons = np.full(len(texts), None, dtype=object)
+    distinct_reasons[texts.str.len().values > PREFILTER_MAX_LENGTH] = PREFILTER_TOO_LONG
+    distinct_reasons[digit_counts < PREFILTER_MIN_DIGITS] = PREFILTER_TOO_FEW_DIGITS
+
+    reasons[candidates] = distinct_reasons[codes]
+    return reasons
+
+def _apply_prefilter(values, use_orig_on_error, status_counts=None):
+    """
+    Runs prefilter_phone_values and gives rejected values the parse error outcome
+    :param status_counts: optional dict that the number of rejected values is added to, as parse errors
+    :return: (values with the rejected ones replaced by None so cleaning skips them, positions of the rejected values,
+    their replacement values)
+    """
+    reasons = prefilter_phone_values(values)
+    rejected = np.flatnonzero(pd.notnull(reasons))
+    if len(rejected) == 0:
+        return values, [], []
+
+    if instrumentation.is_enabled():
+        for reason, amount in pd.Series(reasons[rejected]).value_counts().items():
+            instrumentation.count('phone_prefiltered_' + reason, int(amount))
+    if status_counts is not None:
+        status_counts[PHONE_PARSE_ERROR] = status_counts.get(PHONE_PARSE_ERROR, 0) + len(rejected)
+
+    if use_orig_on_error:
+        rejected_cleaned = [str(value) for value in values[rejected]]
+    else:
+        rejected_cleaned = [np.nan] * len(rejected)
+
+    values = np.array(values, dtype=object)
+    values[rejected] = None
+    return values, rejected.tolist(), rejected_cleaned
+
+def _resolve_regions(dataframe, region_string, region_field, category):
+    """
+    Resolves the region to validate each row against, using the same rules as _clean_phone_for_rows
+    :return: numpy object array of region abbreviations (or None where no region is available), in row order
+    """
+    if category == 'only_region_string':
+        return np.full(len(dataframe), region_string, dtype=object)
+
+    if category == 'both_string_and_field':
+        fallback_region = region_string
+    else:
+        fallback_region = None
+
+    # regions repeat a lot, so each distinct region is converted once. Null regions get code -1, which picks up the
+    # fallback from the end of the lookup array
+    codes, unique_regions = pd.factorize(dataframe[region_field])
+    lookup = np.array([str(region) for region in unique_regions] + [fallback_region], dtype=object)
+    return lookup[codes]
+
+def _clean_phone_values(values, regions, use_orig_on_error, output_format=OUTPUT_NATIONAL, parse_cache=None,
+                        status_counts=None):
+    """
+    Cleans an array of raw phone values against an array of regions of the same length. Null values are skipped
+    and left untouched, as in the row by row path.
+    Values are partitioned by region first, so each region's validation setup (see _RegionValidator) is looked up once
+    and then run over all of that region's values.
+    :param values: array-like of raw phone values
+    :param regions: array-like of region abbreviations, one per value
+    :param use_orig_on_error: if True, values that can't be parsed are replaced by their original value (as a string)
+    :param output_format: OUTPUT_NATIONAL to replace valid numbers by their national number as a string, OUTPUT_E164
+    by their E.164 number as an int, OUTPUT_COMPONENTS by a (country code, national significant number) tuple of an
+    int and a string
+    :param parse_cache: optional PhoneParseCache to look up results in before parsing
+    :param status_counts: optional dict that the number of values per outcome (PHONE_VALID, ...) is added to
+    :return: (list, list, list): positions of the values that were cleaned, their replacement values (NaN for numbers
+    that aren't valid) and their PHONE_STATUS_CODES
+    """
+    positions = np.flatnonzero(np.fromiter((value not in IGNORED_VALUES for value in values), dtype=bool,
+                                           count=len(values)))
+    cleaned = np.empty(len(positions), dtype=object)
+    status_codes = np.empty(len(positions), dtype=np.int8)
+
+    for region, partition in _partition_by_region(np.asarray(regions, dtype=object)[positions]):
+        if parse_cache is not None:
+            validate = functools.partial(parse_cache.validate, region=region)
+        else:
+            validate = _region_validator(region).validate
+        # valid numbers always carry their region's country code
+        country_code = _region_validator(region).country_code
+
+        for position in partition:
+            value = values[positions[position]]
+            result = validate(value)
+            if status_counts is not None:
+                status_counts[result[0]] = status_counts.get(result[0], 0) + 1
+            status_codes[position] = PHONE_STATUS_CODES[result[0]]
+            cleaned[position] = _cleaned_value(value, result, country_code, use_orig_on_error, output_format)
+
+    return positions.tolist(), cleaned.tolist(), status_codes.tolist()
+
+def _cleaned_value(value, result, country_code, use_orig_on_error, output_format):
+    """
+    :param result: (status, national_number, e164) of value, as _validate_phone
+    :param country_code: country code of the region value was validated against
+    :return: the replacement value for value in the given output format (NaN if it isn't valid)
+    """
+    status, national_number, e164 = result
+    if status == PHONE_VALID:
+        if output_format == OUTPUT_E164:
+            return e164
+        elif output_format == OUTPUT_COMPONENTS:
+            # the national significant number follows the country code in E.164, with any leading zeros
+            return country_code, str(e164)[len(str(country_code)):]
+        else:
+            return str(national_number)
+    elif status == PHONE_PARSE_ERROR and use_orig_on_error:
+        return str(value)
+    else:
+        return np.nan
+
+def _clean_phone_values_with_store(values, regions, use_orig_on_error, result_store, output_format=OUTPUT_NATIONAL,
+                                   parse_cache=None, n_jobs=1, executor=None, status_counts=None):
+    """
+    Equivalent of _clean_phone_values that takes the results of the distinct (value, region) pairs it can from a
+    PhoneResultStore, validates the others (in n_jobs processes if n_jobs isn't 1) and adds their results to the store.
+    :return: (list, list, list): positions of the values that were cleaned, their replacement values and their status
+    codes, as _clean_phone_values
+    """
+    positions = np.flatnonzero(np.fromiter((value not in IGNORED_VALUES for value in values), dtype=bool,
+                                           count=len(values)))
+    keys = [PhoneParseCache.normalize_key(values[position], regions[position]) for position in positions]
+    distinct_keys = list(OrderedDict.fromkeys(keys))
+
+    results = result_store.lookup(distinct_keys)
+    missing_keys = [key for key in distinct_keys if key not in results]
+    instrumentation.count('phone_store_hits', len(results))
+    instrumentation.count('phone_store_misses', len(missing_keys))
+
+    new_results = _validate_keys(missing_keys, parse_cache=parse_cache, n_jobs=n_jobs, executor=executor)
+    result_store.store(new_results)
+    results.update(new_results)
+
+    cleaned = []
+    status_codes = []
+    for position, key in zip(positions, keys):
+        result = results[key]
+        if status_counts is not None:
+            status_counts[result[0]] = status_counts.get(result[0], 0) + 1
+        status_codes.append(PHONE_STATUS_CODES[result[0]])
+        cleaned.append(_cleaned_value(values[position], result, _region_validator(key[1]).country_code,
+                                      use_orig_on_error, output_format))
+
+    return positions.tolist(), cleaned, status_codes
+
+def _validate_keys(keys, parse_cache=None, n_jobs=1, executor=None):
+    """
+    Validates distinct (normalized value, region) pairs, in a pool of n_jobs worker processes (or executor) if n_jobs
+    isn't 1
+    :return: dict of the (status, national_number, e164) result of each pair
+    """
+    if n_jobs == 1 and executor is None:
+        if parse_cache is not None:
+            return dict((key, parse_cache.validate(*key)) for key in keys)
+        return dict((key, _validate_phone(*key)) for key in keys)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    chunk_size = max(1, -(-len(keys) // (n_jobs * CHUNKS_PER_JOB)))
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=n_jobs)
+
+    results = dict()
+    try:
+        futures = [executor.submit(_validate_key_chunk, keys[start:start + chunk_size])
+                   for start in range(0, len(keys), chunk_size)]
+        for future in futures:
+            results.update(future.result())
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    return results
+
+def _validate_key_chunk(keys):
+    """ Worker entry point for _validate_keys. Must stay a module level function so it can be pickled. """
+    return dict((key, _validate_phone(*key)) for key in keys)
+
+def _partition_by_region(regions):
+    """
+    :param regions: numpy object array of region abbreviations (None where there is no region)
+    :return: list of (region, numpy array of the positions of that region's values)
+    """
+    codes, unique_regions = pd.factorize(regions)
+    order = np.argsort(codes, kind='mergesort')
+    group_starts = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1]
+
+    partitions = []
+    for partition in np.split(order, group_starts[1:]) if len(order) else []:
+        code = codes[partition[0]]
+        partitions.append((unique_regions[code] if code >= 0 else None, partition))
+    return partitions
+
+def _clean_phone_values_parallel(values, regions, use_orig_on_error, n_jobs, executor=None,
+                                 output_format=OUTPUT_NATIONAL, parse_cache=None, status_counts=None):
+    """
+    Splits values and regions into chunks, cleans each chunk with _clean_phone_values in a pool of worker processes
+    and stitches the results back together in the original order.
+    :param n_jobs: number of worker processes (-1 for all CPUs)
+    :param executor: optional concurrent.futures.Executor to use instead of creating a process pool
+    :param output_format: as in _clean_phone_values
+    :param parse_cache: optional PhoneParseCache. Workers use their own cache of the same size; hit/miss counts are
+    added back to this cache's statistics
+    :param status_counts: optional dict that the number of values per outcome is added to
+    :return: (list, list, list): positions of the values that were cleaned, their replacement values and their status
+    codes, as _clean_phone_values
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+
+    if parse_cache is not None:
+        cache_maxsize = parse_cache.maxsize
+    else:
+        cache_maxsize = None
+
+    # null values are skipped here rather than in the workers: the null check relies on np.nan's identity,
+    # which does not survive pickling
+    candidates = [position for position, value in enumerate(values) if value not in IGNORED_VALUES]
+    candidate_values = [values[position] for position in candidates]
+    candidate_regions = [regions[position] for position in candidates]
+
+    chunk_size = max(1, -(-len(candidates) // (n_jobs * CHUNKS_PER_JOB)))
+    chunk_starts = range(0, len(candidates), chunk_size)
+
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=n_jobs)
+
+    positions = []
+    cleaned = []
+    status_codes = []
+    try:
+        futures = [executor.submit(_clean_phone_chunk, candidate_values[start:start + chunk_size],
+                                   candidate_regions[start:start + chunk_size], use_orig_on_error, cache_maxsize,
+                                   output_format)
+                   for start in chunk_starts]
+
+        # results are collected in submission order, so the original row order is kept
+        for start, future in zip(chunk_starts, futures):
+            chunk_positions, chunk_cleaned, chunk_status_codes, hits, misses, chunk_status_counts = future.result()
+            positions.extend(candidates[start + position] for position in chunk_positions)
+            cleaned.extend(chunk_cleaned)
+            status_codes.extend(chunk_status_codes)
+
+            if status_counts is not None:
+                for status, amount in chunk_status_counts.items():
+                    status_counts[status] = status_counts.get(status, 0) + amount
+
+            if parse_cache is not None:
+                parse_cache.hits += hits
+                parse_cache.misses += misses
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+    return positions, cleaned, status_codes
+
+def _clean_phone_chunk(values, regions, use_orig_on_error, cache_maxsize=None, output_format=OUTPUT_NATIONAL):
+    """
+    Worker entry point for _clean_phone_values_parallel. Must stay a module level function so it can be pickled.
+    :return: (positions, cleaned, status codes, cache hits, cache misses, counts per outcome), positions being relative
+    to the start of the chunk
+    """
+    if cache_maxsize is not None:
+        parse_cache = PhoneParseCache(maxsize=cache_maxsize)
+    else:
+        parse_cache = None
+
+    status_counts = dict()
+    positions, cleaned, status_codes = _clean_phone_values(values, regions, use_orig_on_error,
+                                                           output_format=output_format, parse_cache=parse_cache,
+                                                           status_counts=status_counts)
+
+    if parse_cache is not None:
+        return positions, cleaned, status_codes, parse_cache.hits, parse_cache.misses, status_counts
+    else:
+        return positions, cleaned, status_codes, 0, 0, status_counts
+
+def _validate_phone(value, region):
+    """
+    Parses and validates a single phone value for a region.
+    :return: (status, national_number, e164): status is one of PHONE_VALID, PHONE_INVALID or PHONE_PARSE_ERROR.
+    national_number and e164 (the E.164 number without its '+', as an int) are None unless the number is valid.
+    """
+    return _region_validator(region).validate(value)
+
+@functools.lru_cache(maxsize=None)
+def _region_validator(region):
+    """ :return: the _RegionValidator of a region, created on first use """
+    return _RegionValidator(region)
+
+class _RegionValidator(object):
+    """
+    Validation setup for one region, prepared once and reused for every value of that region: the region's metadata
+    and country code are looked up up front rather than by phonenumberutil.is_valid_number_for_region on every call.
+    Regions are checked against the supported regions before cleaning, so parse is told not to check them again.
+    Gives the same results as parse(..., _check_region=True) followed by is_valid_number_for_region.
+    """
+    def __init__(self, region):
+        self.region = region
+        self.metadata = PhoneMetadata.metadata_for_region(region.upper()) if region is not None else None
+        self.country_code = phonenumberutil.country_code_for_valid_region(region) if self.metadata else None
+        # without a region, parse has to check that the number carries its own country code
+        self.check_region = region is None
+
+    def validate(self, value):
+        """ :return: (status, national_number, e164), as _validate_phone """
+        try:
+            # parse will raise an exception if value doesn't seem to be a phone number
+            phonenum = phonenumberutil.parse(str(value), region=self.region, keep_raw_input=False,
+                                             numobj=None, _check_region=self.check_region)
+
+            # the national significant number keeps the national number's leading zeros, which E.164 includes
+            national_significant_number = phonenumberutil.national_significant_number(phonenum)
+            if self._is_valid_number(phonenum, national_significant_number):
+                return PHONE_VALID, phonenum.national_number, \
+                    int(str(phonenum.country_code) + national_significant_number)
+            else:
+                return PHONE_INVALID, None, None
+        except Exception:
+            return PHONE_PARSE_ERROR, None, None
+
+    def _is_valid_number(self, phonenum, national_significant_number):
+        """ equivalent of phonenumberutil.is_valid_number_for_region, with the region's metadata already at hand """
+        if self.metadata is None or phonenum.country_code != self.country_code:
+            return False
+        if _number_type_helper is None:
+            return phonenumberutil.is_valid_number_for_region(phonenum, self.region)
+        return _number_type_helper(national_significant_number, self.metadata) != phonenumberutil.PhoneNumberType.UNKNOWN
+
+def _write_cleaned_values(dataframe, field, positions, cleaned):
+    """
+    Writes cleaned values into a field at the given row positions with a single column assignment
+    :return: None (modifies input dataframe in place)
+    """
+    if len(positions) == 0:
+        return
+
+    if dataframe[field].dtype == object or any(isinstance(value, str) for value in cleaned):
+        column = dataframe[field].values.astype(object)
+        column[positions] = np.array(cleaned, dtype=object)
+    else:
+        # only NaNs are being written, so a numeric column (e.g., a freshly initialized newField) stays numeric
+        column = dataframe[field].values.astype(float)
+        column[positions] = np.nan
+
+    dataframe[field] = column
+
+def _integer_column(length, positions, numbers):
+    """
+    :param numbers: ints to write at the given row positions. None/NaN entries are written as nulls
+    :return: nullable int64 (Int64) array of length rows, null everywhere but at the positions of the numbers
+    """
+    data = np.zeros(length, dtype=np.int64)
+    mask = np.ones(length, dtype=bool)
+
+    numbers = np.array(numbers, dtype=object)
+    present = pd.notnull(numbers)
+    written = np.asarray(positions, dtype=np.int64)[present]
+    data[written] = numbers[present].astype(np.int64)
+    mask[written] = False
+    return pd.arrays.IntegerArray(data, mask)
+
+def _string_column(length, positions, strings):
+    """
+    :param strings: strings to write at the given row positions. None/NaN entries are written as NaNs
+    :return: object array of length rows, NaN everywhere but at the positions of the strings
+    """
+    column = np.full(length, np.nan, dtype=object)
+    strings = np.array(strings, dtype=object)
+    present = pd.notnull(strings)
+    column[np.asarray(positions, dtype=np.int64)[present]] = strings[present]
+    return column
+
+def _split_components(cleaned):
+    """ :return: (country codes, national numbers) of a list of (country code, national number) tuples or NaNs """
+    country_codes = [value[0] if isinstance(value, tuple) else None for value in cleaned]
+    national_numbers = [value[1] if isinstance(value, tuple) else None for value in cleaned]
+    return country_codes, national_numbers
+
 def _update_element(dataframe, phonenum_field, newField, index, replacement_value):
     """ Logic to update newField or update current phone num field"""
     NULL_VALUES = IGNORED_VALUES